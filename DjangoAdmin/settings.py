@@ -88,12 +88,43 @@ TEMPLATES = [
 WSGI_APPLICATION = 'DjangoAdmin.wsgi.application'
 ASGI_APPLICATION = 'DjangoAdmin.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        'CONFIG': {}
+# Channel layer. TIKTOK_REDIS_URLS (comma separated) switches to channels_redis so several
+# ASGI workers share groups; each URL is a shard and groups are hashed across them.
+# TIKTOK_CHANNEL_LAYER=local-broker runs the same sharded topology in one process.
+TIKTOK_REDIS_URLS = [url.strip() for url in os.environ.get('TIKTOK_REDIS_URLS', '').split(',') if url.strip()]
+TIKTOK_CHANNEL_SHARDS = int(os.environ.get('TIKTOK_CHANNEL_SHARDS', '4'))
+
+if TIKTOK_REDIS_URLS:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': TIKTOK_REDIS_URLS,
+                'capacity': int(os.environ.get('TIKTOK_CHANNEL_CAPACITY', '1000')),
+                'expiry': 30,
+                'group_expiry': 86400,
+            }
+        }
     }
-}
+elif os.environ.get('TIKTOK_CHANNEL_LAYER') == 'local-broker':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'tiktok_live.channel_layers.LocalBrokerChannelLayer',
+            'CONFIG': {'shards': TIKTOK_CHANNEL_SHARDS}
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {}
+        }
+    }
+
+# Which worker opens the upstream TikTok connection for a streamer. 'database' coordinates
+# workers through ConnectorLease rows; 'local' only coordinates within one process.
+TIKTOK_CONNECTOR_LEASE_BACKEND = os.environ.get('TIKTOK_CONNECTOR_LEASE_BACKEND', 'database' if TIKTOK_REDIS_URLS else 'local')
+TIKTOK_CONNECTOR_LEASE_TTL = int(os.environ.get('TIKTOK_CONNECTOR_LEASE_TTL', '15'))
 
 # Login not required - TikFinity style
 LOGIN_URL = '/tiktok/setup/'
@@ -113,6 +144,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # The migration history predates several model rewrites, so the test
+        # database is created from the current models instead
+        'TEST': {'MIGRATE': False},
     }
 }
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TikTokAccount, LiveStream, StreamInteraction, AutomationTrigger, AutoResponse, UserPoints, Widget, Action, Event, OverlayScreen, Timer, PointsHalving
+from .models import TikTokAccount, LiveStream, StreamInteraction, AutomationTrigger, AutoResponse, UserPoints, Widget, Action, Event, OverlayScreen, Timer, PointsHalving, PointsReset
 
 @admin.register(TikTokAccount)
 class TikTokAccountAdmin(admin.ModelAdmin):
@@ -67,3 +67,10 @@ class PointsHalvingAdmin(admin.ModelAdmin):
     list_filter = ['executed_at']
     search_fields = ['user__username']
     readonly_fields = ['executed_at']
+
+@admin.register(PointsReset)
+class PointsResetAdmin(admin.ModelAdmin):
+    list_display = ['user', 'reset_type', 'affected_users', 'deleted_transactions', 'executed_at']
+    list_filter = ['reset_type', 'executed_at']
+    search_fields = ['user__username']
+    readonly_fields = ['executed_at']
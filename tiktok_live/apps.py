@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TiktokLiveConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tiktok_live'
+
+    def ready(self):
+        from . import signals  # noqa: F401
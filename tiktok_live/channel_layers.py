@@ -0,0 +1,118 @@
+import asyncio
+import time
+import zlib
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+def shard_for(key, shards):
+    """Stable shard index for a streamer or group name, identical in every process"""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(key.lower().encode('utf-8')) % shards
+
+def live_group_name(username):
+    return f"live_{username.lower().strip('@')}"
+
+def tts_audio_group_name(username):
+    return f"tts_audio_{username.lower().strip('@')}"
+
+def is_shared_layer(layer):
+    """True when groups on this layer are visible to other worker processes"""
+    if layer is None:
+        return False
+    return not isinstance(layer, InMemoryChannelLayer) or isinstance(layer, LocalBrokerChannelLayer)
+
+class BrokerState:
+    """Channels and sharded group tables shared by every LocalBrokerChannelLayer with the same name"""
+
+    def __init__(self, shards):
+        self.channels = {}
+        self.shards = [{} for _ in range(shards)]
+
+    def groups_for(self, group):
+        return self.shards[shard_for(group, len(self.shards))]
+
+_brokers = {}
+
+class LocalBrokerChannelLayer(InMemoryChannelLayer):
+    """In-process stand-in for a shared Redis channel layer.
+
+    Every instance created with the same ``broker`` name talks to the same
+    channels and groups, so several ASGI applications in one process behave
+    like separate workers on one Redis deployment. Groups are spread over
+    ``shards`` tables the same way channels_redis spreads them over hosts.
+    """
+
+    def __init__(self, broker='default', shards=4, **kwargs):
+        super().__init__(**kwargs)
+        state = _brokers.get(broker)
+        if state is None or len(state.shards) != shards:
+            state = _brokers[broker] = BrokerState(shards)
+        self.state = state
+        self.channels = state.channels
+
+    @property
+    def groups(self):
+        merged = {}
+        for shard in self.state.shards:
+            merged.update(shard)
+        return merged
+
+    @groups.setter
+    def groups(self, value):
+        # InMemoryChannelLayer.__init__ assigns an empty dict; group state lives in the broker
+        pass
+
+    async def flush(self):
+        self.state.channels.clear()
+        for shard in self.state.shards:
+            shard.clear()
+
+    def _remove_from_groups(self, channel):
+        for shard in self.state.shards:
+            for channels in shard.values():
+                channels.pop(channel, None)
+
+    def _clean_expired(self):
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < time.time():
+                queue.get_nowait()
+                self._remove_from_groups(channel)
+                if queue.empty():
+                    self.channels.pop(channel, None)
+
+        timeout = int(time.time()) - self.group_expiry
+        for shard in self.state.shards:
+            for channels in shard.values():
+                for name, timestamp in list(channels.items()):
+                    if timestamp and timestamp < timeout:
+                        channels.pop(name, None)
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.state.groups_for(group).setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        groups = self.state.groups_for(group)
+        group_channels = groups.get(group)
+        if group_channels:
+            group_channels.pop(channel, None)
+            if not group_channels:
+                groups.pop(group, None)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._clean_expired()
+
+        channels = list(self.state.groups_for(group).get(group, {}))
+        results = await asyncio.gather(
+            *(self.send(channel, message) for channel in channels),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, ChannelFull):
+                raise result
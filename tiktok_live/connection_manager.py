@@ -1,83 +1,289 @@
 import asyncio
+import json
 import logging
 from typing import Dict, Set
+from channels.layers import get_channel_layer
 from .live_connector import TikTokLiveConnector
+from .channel_layers import is_shared_layer, live_group_name, tts_audio_group_name
+from .connector_leases import ConnectorLeases
 
 logger = logging.getLogger(__name__)
 
 class GlobalConnectionManager:
-    def __init__(self):
+    def __init__(self, leases=None, connector_factory=TikTokLiveConnector):
         self.active_connections: Dict[str, TikTokLiveConnector] = {}
         self.subscribers: Dict[str, Set] = {}
+        # TTS sockets that asked for streamed audio frames
+        self.audio_subscribers: Dict[str, Set] = {}
+        # Usernames whose upstream connection is owned by another worker
+        self.following: Set[str] = set()
+        self.holds: Dict[str, Set] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.leases = leases or ConnectorLeases()
+        self.connector_factory = connector_factory
+        self._heartbeat_task = None
+        self.stats = {'events': 0, 'serializations': 0, 'sends': 0, 'failed_sends': 0, 'bytes': 0}
+        self._channel_layer = None
     
-    async def get_or_create_connection(self, username: str, consumer=None):
-        """Get existing connection or create new one"""
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+    
+    async def get_or_create_connection(self, username: str, consumer=None, hold=None):
+        """Get existing connection or create new one
+        
+        consumer is a WebSocket consumer that receives events; hold is any hashable key
+        (e.g. an HTTP view's user) that keeps the connection open without receiving them.
+        Concurrent callers for the same username share one in-flight start.
+        """
         username = username.lower().strip('@')
+        self._add_reference(username, consumer, hold)
         
-        if username in self.active_connections:
-            logger.info(f"Using existing connection for @{username}")
-            connection = self.active_connections[username]
-            
-            # Add consumer to subscribers
-            if username not in self.subscribers:
-                self.subscribers[username] = set()
-            if consumer:
-                self.subscribers[username].add(consumer)
-                connection.consumer = consumer
-            
-            return connection
+        connection = self.active_connections.get(username)
+        if connection is not None:
+            if connection.is_connected or connection.reconnecting:
+                logger.info(f"Using existing connection for @{username}")
+                return connection
+            logger.warning(f"Existing connection for @{username} is dead, starting a new one")
+            await self.discard_connection(username, connection)
         
-        # Create new connection
-        logger.info(f"Creating new connection for @{username}")
-        connection = TikTokLiveConnector(username)
+        if username in self.following:
+            return None
         
+        try:
+            return await self._single_flight(username)
+        except Exception:
+            self.subscribers.get(username, set()).discard(consumer)
+            self.holds.get(username, set()).discard(hold)
+            await self._close_if_unused(username)
+            raise
+    
+    def _add_reference(self, username, consumer=None, hold=None):
+        self.subscribers.setdefault(username, set())
         if consumer:
-            connection.consumer = consumer
-            self.subscribers[username] = {consumer}
+            self.subscribers[username].add(consumer)
+        if hold is not None:
+            self.holds.setdefault(username, set()).add(hold)
+    
+    def reference_count(self, username: str):
+        """WebSocket subscribers plus view holds keeping a username's connection open"""
+        username = username.lower().strip('@')
+        return len(self.subscribers.get(username, ())) + len(self.holds.get(username, ()))
+    
+    def _single_flight(self, username: str):
+        task = self.pending.get(username)
+        if task is None:
+            task = asyncio.ensure_future(self._establish(username))
+            self.pending[username] = task
+            task.add_done_callback(lambda done: self._finish_pending(username, done))
+        # Shield so one cancelled caller does not abort the start for everyone else
+        return asyncio.shield(task)
+    
+    def _finish_pending(self, username, task):
+        if self.pending.get(username) is task:
+            del self.pending[username]
+        if not task.cancelled():
+            # Retrieve the exception so an unawaited failure is not reported as never retrieved
+            task.exception()
+    
+    async def _establish(self, username: str):
+        self._ensure_heartbeat()
+        
+        # Only the lease owner opens the upstream connection; everyone else follows its events
+        if not await self.leases.acquire(username):
+            logger.info(f"@{username} is owned by another worker, following its event stream")
+            if not is_shared_layer(self.channel_layer):
+                logger.warning(f"@{username} is owned elsewhere but the channel layer is not shared; events will not arrive")
+            self.following.add(username)
+            return None
+        
+        return await self._start_connection(username)
+    
+    async def _start_connection(self, username: str):
+        logger.info(f"Creating new connection for @{username}")
+        connection = self.connector_factory(username)
         
         try:
             await connection.start()
+            connection.on_give_up = self.discard_connection
             self.active_connections[username] = connection
+            self.following.discard(username)
             logger.info(f"Global connection established for @{username}")
             return connection
         except Exception as e:
             logger.error(f"Failed to create connection for @{username}: {e}")
+            await self.leases.release(username)
             raise e
     
+    def _ensure_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+    
+    async def _heartbeat(self):
+        """Renew owned leases, drop lost ones and take over streamers whose owner died"""
+        while self.subscribers or self.holds:
+            await asyncio.sleep(self.leases.renew_interval)
+            try:
+                for username in await self.leases.renew_all():
+                    connection = self.active_connections.pop(username, None)
+                    if connection:
+                        # The new owner keeps the LiveStream going
+                        await connection.stop(end_stream=False)
+                    if self.reference_count(username):
+                        self.following.add(username)
+                
+                for username in list(self.following):
+                    if not self.reference_count(username):
+                        self.following.discard(username)
+                    elif await self.leases.acquire(username):
+                        logger.info(f"Taking over @{username} after its owner stopped renewing")
+                        self.following.discard(username)
+                        try:
+                            await self._single_flight(username)
+                        except Exception:
+                            # Retry on the next heartbeat
+                            self.following.add(username)
+            except Exception as e:
+                logger.error(f"Lease heartbeat error: {e}")
+    
     async def remove_subscriber(self, username: str, consumer):
         """Remove consumer from subscribers"""
         username = username.lower().strip('@')
         
         if username in self.subscribers:
             self.subscribers[username].discard(consumer)
-            
-            # If no more subscribers, close connection
-            if not self.subscribers[username]:
-                await self.close_connection(username)
+            await self._close_if_unused(username)
+    
+    async def release_hold(self, username: str, hold):
+        """Drop a hold taken by get_or_create_connection"""
+        username = username.lower().strip('@')
+        
+        if username in self.holds:
+            self.holds[username].discard(hold)
+            await self._close_if_unused(username)
+    
+    async def _close_if_unused(self, username):
+        # Close the upstream connection once the last reference of any kind is gone
+        if not self.reference_count(username):
+            await self.close_connection(username)
     
     async def close_connection(self, username: str):
         """Close connection for username"""
         username = username.lower().strip('@')
         
+        # Let an in-flight start finish so its client is not left running
+        task = self.pending.get(username)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+        
         if username in self.active_connections:
-            connection = self.active_connections[username]
+            connection = self.active_connections.pop(username)
             await connection.stop()
-            del self.active_connections[username]
             logger.info(f"Closed connection for @{username}")
         
-        if username in self.subscribers:
-            del self.subscribers[username]
+        await self.leases.release(username)
+        self.following.discard(username)
+        self.subscribers.pop(username, None)
+        self.holds.pop(username, None)
     
-    def broadcast_to_subscribers(self, username: str, data):
-        """Broadcast data to all subscribers of a username"""
+    async def discard_connection(self, username: str, connection):
+        """Forget a connector that is no longer connected and will not reconnect
+        
+        Its lease is released; subscribers and holds are kept and attach to the
+        connection the next get_or_create_connection starts.
+        """
         username = username.lower().strip('@')
+        if self.active_connections.get(username) is not connection:
+            return
+        del self.active_connections[username]
+        await self.leases.release(username)
+        logger.info(f"Dropped dead connection for @{username}")
+    
+    async def broadcast_to_subscribers(self, username: str, data):
+        """Serialize an event once and deliver it to every subscriber of a username exactly once
         
-        if username in self.subscribers:
-            for consumer in self.subscribers[username]:
-                try:
-                    asyncio.create_task(consumer.send_json(data))
-                except Exception as e:
-                    logger.error(f"Failed to send to subscriber: {e}")
+        With a shared channel layer (Redis or the local broker stand-in) the payload is
+        published once to the streamer's live_ group so consumers on every worker get it.
+        Otherwise it is sent straight to the consumers registered in this process.
+        """
+        username = username.lower().strip('@')
+        
+        shared = is_shared_layer(self.channel_layer)
+        consumers = [] if shared else list(self.subscribers.get(username, ()))
+        if not shared and not consumers:
+            return 0
+        
+        payload = json.dumps(data)
+        payload_size = len(payload.encode('utf-8'))
+        self.stats['events'] += 1
+        self.stats['serializations'] += 1
+        
+        if shared:
+            await self.channel_layer.group_send(live_group_name(username), {
+                'type': 'live_event',
+                'text': payload
+            })
+            self.stats['sends'] += 1
+            self.stats['bytes'] += payload_size
+            return 1
+        
+        results = await asyncio.gather(
+            *(consumer.send(text_data=payload) for consumer in consumers),
+            return_exceptions=True
+        )
+        
+        delivered = 0
+        for result in results:
+            if isinstance(result, Exception):
+                self.stats['failed_sends'] += 1
+                logger.error(f"Failed to send to subscriber: {result}")
+            else:
+                delivered += 1
+        
+        self.stats['sends'] += delivered
+        self.stats['bytes'] += payload_size * delivered
+        return delivered
+
+    def add_audio_subscriber(self, username: str, consumer):
+        self.audio_subscribers.setdefault(username.lower().strip('@'), set()).add(consumer)
+    
+    def remove_audio_subscriber(self, username: str, consumer):
+        username = username.lower().strip('@')
+        consumers = self.audio_subscribers.get(username)
+        if consumers is not None:
+            consumers.discard(consumer)
+            if not consumers:
+                del self.audio_subscribers[username]
+    
+    def has_audio_listeners(self, username: str):
+        """Whether streamed TTS audio for a username could reach anyone"""
+        if is_shared_layer(self.channel_layer):
+            # Listeners may be on other workers
+            return True
+        return bool(self.audio_subscribers.get(username.lower().strip('@')))
+    
+    async def broadcast_audio(self, username: str, frame: bytes):
+        """Send one binary TTS audio frame to every streaming TTS socket of a username"""
+        username = username.lower().strip('@')
+        
+        if is_shared_layer(self.channel_layer):
+            await self.channel_layer.group_send(tts_audio_group_name(username), {
+                'type': 'tts_audio',
+                'bytes': frame
+            })
+            return 1
+        
+        consumers = list(self.audio_subscribers.get(username, ()))
+        results = await asyncio.gather(
+            *(consumer.send(bytes_data=frame) for consumer in consumers),
+            return_exceptions=True
+        )
+        return sum(1 for result in results if not isinstance(result, Exception))
 
 # Global instance
 connection_manager = GlobalConnectionManager()
\ No newline at end of file
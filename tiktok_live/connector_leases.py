@@ -0,0 +1,146 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ConnectorLease
+
+logger = logging.getLogger(__name__)
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class DatabaseLeaseBackend:
+    """Leases stored in the ConnectorLease table, shared by every worker on the database"""
+
+    def acquire(self, username, owner, ttl):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=ttl)
+        with transaction.atomic():
+            # Take over our own lease or one whose owner stopped renewing it
+            taken = ConnectorLease.objects.filter(
+                Q(owner=owner) | Q(expires_at__lte=now), username=username
+            ).update(owner=owner, acquired_at=now, expires_at=expires_at)
+            if taken:
+                return True
+            if ConnectorLease.objects.filter(username=username).exists():
+                return False
+        try:
+            with transaction.atomic():
+                ConnectorLease.objects.create(username=username, owner=owner, acquired_at=now, expires_at=expires_at)
+            return True
+        except IntegrityError:
+            # Another worker created the row first
+            return False
+
+    def renew(self, username, owner, ttl):
+        return ConnectorLease.objects.filter(username=username, owner=owner).update(
+            expires_at=timezone.now() + timedelta(seconds=ttl)
+        ) > 0
+
+    def release(self, username, owner):
+        ConnectorLease.objects.filter(username=username, owner=owner).delete()
+
+    def owner_of(self, username):
+        lease = ConnectorLease.objects.filter(username=username, expires_at__gt=timezone.now()).first()
+        return lease.owner if lease else None
+
+class LocalLeaseBackend:
+    """Process-local stand-in for the database backend; every manager in the process shares it"""
+
+    def __init__(self):
+        self.leases = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, username, owner, ttl):
+        now = time.monotonic()
+        with self.lock:
+            current = self.leases.get(username)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self.leases[username] = (owner, now + ttl)
+            return True
+
+    def renew(self, username, owner, ttl):
+        with self.lock:
+            current = self.leases.get(username)
+            if not current or current[0] != owner:
+                return False
+            self.leases[username] = (owner, time.monotonic() + ttl)
+            return True
+
+    def release(self, username, owner):
+        with self.lock:
+            current = self.leases.get(username)
+            if current and current[0] == owner:
+                del self.leases[username]
+
+    def owner_of(self, username):
+        current = self.leases.get(username)
+        if current and current[1] > time.monotonic():
+            return current[0]
+        return None
+
+_local_backend = LocalLeaseBackend()
+
+def get_lease_backend(name=None):
+    name = name or getattr(settings, 'TIKTOK_CONNECTOR_LEASE_BACKEND', 'local')
+    if name == 'database':
+        return DatabaseLeaseBackend()
+    return _local_backend
+
+class ConnectorLeases:
+    """Leases held by one worker.
+
+    A worker may only open the upstream TikTokLive connection for a username
+    while it holds the lease. Leases expire after ``ttl`` seconds unless
+    renewed, so if the owner dies another worker takes over on its next
+    heartbeat.
+    """
+
+    def __init__(self, backend=None, owner=None, ttl=None):
+        self.backend = backend or get_lease_backend()
+        self.owner = owner or make_worker_id()
+        self.ttl = ttl or getattr(settings, 'TIKTOK_CONNECTOR_LEASE_TTL', 15)
+        self.held = set()
+
+    @property
+    def renew_interval(self):
+        return self.ttl / 3
+
+    async def acquire(self, username):
+        acquired = await sync_to_async(self.backend.acquire)(username, self.owner, self.ttl)
+        if acquired:
+            self.held.add(username)
+            logger.info(f"Worker {self.owner} owns @{username}")
+        return acquired
+
+    async def renew_all(self):
+        """Renew every held lease and return the usernames that were lost"""
+        lost = []
+        for username in list(self.held):
+            try:
+                renewed = await sync_to_async(self.backend.renew)(username, self.owner, self.ttl)
+            except Exception as e:
+                logger.error(f"Failed to renew lease for @{username}: {e}")
+                continue
+            if not renewed:
+                self.held.discard(username)
+                lost.append(username)
+                logger.warning(f"Worker {self.owner} lost the lease for @{username}")
+        return lost
+
+    async def release(self, username):
+        if username in self.held:
+            self.held.discard(username)
+            await sync_to_async(self.backend.release)(username, self.owner)
+
+    def owns(self, username):
+        return username in self.held
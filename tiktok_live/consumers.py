@@ -1,7 +1,7 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .live_connector import TikTokLiveConnector
 from .connection_manager import connection_manager
+from .channel_layers import live_group_name
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,7 +15,7 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
 
     async def connect(self):
         self.username = self.scope['url_route']['kwargs']['username']
-        self.room_group_name = f'live_{self.username}'
+        self.room_group_name = live_group_name(self.username)
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -95,25 +95,21 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
             }))
 
     async def live_event(self, event):
-        """Forward live events to WebSocket client"""
-        data = event.get('data', event)
-        logger.info(f"live_event called - Type: {data.get('type')}, User: {data.get('username')}")
-        logger.info(f"Full event data: {event}")
+        """Forward live events published on the shared channel layer to the WebSocket client"""
+        text = event.get('text')
+        if text is None:
+            text = json.dumps(event.get('data', event))
         
         try:
-            json_data = json.dumps(data)
-            logger.info(f"Sending JSON to WebSocket: {json_data}")
-            await self.send(text_data=json_data)
-            logger.info(f"Successfully sent {data.get('type')} event to WebSocket client")
+            await self.send(text_data=text)
         except Exception as e:
             logger.error(f"Failed to send event to WebSocket client: {e}")
-            logger.exception(e)
 
     async def start_stream(self):
         if not self.connector:
             try:
-                self.connector = TikTokLiveConnector(self.username)
-                await self.connector.start()
+                # Share the streamer's one upstream connection; this consumer receives its events
+                self.connector = await connection_manager.get_or_create_connection(self.username, self)
                 await self.send(text_data=json.dumps({
                     'type': 'connection',
                     'status': 'started',
@@ -127,8 +123,10 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
                 }))
 
     async def stop_stream(self):
+        # Other subscribers may still be watching; the manager closes the connection after the last one.
+        # Also unsubscribes while following a connection owned by another worker (connector is None then)
+        await connection_manager.remove_subscriber(self.username, self)
         if self.connector:
-            await self.connector.stop()
             self.connector = None
             await self.send(text_data=json.dumps({
                 'type': 'connection',
@@ -138,10 +136,7 @@ class LiveStreamConsumer(AsyncWebsocketConsumer):
 
     async def reconnect_stream(self):
         """Reconnect to TikTok Live stream"""
-        if self.connector:
-            await self.connector.stop()
-            self.connector = None
-        
+        await self.stop_stream()
         await self.start_stream()
     
     async def send_json(self, data):
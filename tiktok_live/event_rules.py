@@ -0,0 +1,212 @@
+import bisect
+import logging
+from typing import Dict, Set
+from asgiref.sync import sync_to_async
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+class EventRule:
+    """In-memory snapshot of an active Event and its actions"""
+    __slots__ = ('event_id', 'trigger_type', 'user_type', 'specific_user', 'min_coins',
+                 'min_likes', 'custom_command', 'specific_gift', 'actions', 'action_ids')
+
+    def __init__(self, event):
+        self.event_id = event.id
+        self.trigger_type = event.trigger_type
+        self.user_type = event.user_type
+        self.specific_user = event.specific_user
+        self.min_coins = event.min_coins
+        self.min_likes = event.min_likes
+        self.custom_command = event.custom_command
+        self.specific_gift = event.specific_gift
+        self.actions = tuple(event.actions.all())
+        self.action_ids = frozenset(action.id for action in self.actions)
+
+class ThresholdList:
+    """Rules kept sorted by a minimum threshold (min_coins, min_likes)"""
+
+    def __init__(self):
+        self.keys = []
+        self.rules = []
+
+    def add(self, threshold, rule):
+        i = bisect.bisect_right(self.keys, threshold)
+        self.keys.insert(i, threshold)
+        self.rules.insert(i, rule)
+
+    def remove(self, event_id):
+        for i, rule in enumerate(self.rules):
+            if rule.event_id == event_id:
+                del self.keys[i]
+                del self.rules[i]
+                return
+
+    def upto(self, value):
+        """Rules whose threshold is at most value"""
+        return self.rules[:bisect.bisect_right(self.keys, value)]
+
+    def __len__(self):
+        return len(self.rules)
+
+class CommandTrie:
+    """Prefix trie of custom commands; a comment matches every command that prefixes it"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, command, rule):
+        node = self.root
+        for char in command:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(rule)
+
+    def remove(self, command, event_id):
+        node = self.root
+        for char in command:
+            node = node.get(char)
+            if node is None:
+                return
+        if None in node:
+            node[None] = [rule for rule in node[None] if rule.event_id != event_id]
+
+    def match(self, text):
+        matches = []
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            matches.extend(node.get(None, ()))
+        return matches
+
+class UserRuleIndex:
+    """Compiled Actions & Events triggers for one streamer"""
+
+    def __init__(self):
+        self.rules: Dict[int, EventRule] = {}
+        self.follow = []
+        self.share = []
+        self.subscribe = []
+        self.likes = ThresholdList()
+        self.gifts_any = ThresholdList()
+        self.gifts_by_name: Dict[str, ThresholdList] = {}
+        self.commands = CommandTrie()
+
+    def add(self, rule):
+        self.remove(rule.event_id)
+        self.rules[rule.event_id] = rule
+
+        if rule.trigger_type == 'follow':
+            self.follow.append(rule)
+        elif rule.trigger_type == 'share':
+            self.share.append(rule)
+        elif rule.trigger_type == 'subscribe':
+            self.subscribe.append(rule)
+        elif rule.trigger_type == 'like':
+            self.likes.add(rule.min_likes, rule)
+        elif rule.trigger_type == 'gift':
+            if rule.specific_gift:
+                self.gifts_by_name.setdefault(rule.specific_gift, ThresholdList()).add(rule.min_coins, rule)
+            else:
+                self.gifts_any.add(rule.min_coins, rule)
+        elif rule.trigger_type == 'command' and rule.custom_command:
+            self.commands.insert(rule.custom_command, rule)
+
+    def remove(self, event_id):
+        rule = self.rules.pop(event_id, None)
+        if rule is None:
+            return
+
+        if rule.trigger_type == 'follow':
+            self.follow = [r for r in self.follow if r.event_id != event_id]
+        elif rule.trigger_type == 'share':
+            self.share = [r for r in self.share if r.event_id != event_id]
+        elif rule.trigger_type == 'subscribe':
+            self.subscribe = [r for r in self.subscribe if r.event_id != event_id]
+        elif rule.trigger_type == 'like':
+            self.likes.remove(event_id)
+        elif rule.trigger_type == 'gift':
+            if rule.specific_gift:
+                gifts = self.gifts_by_name.get(rule.specific_gift)
+                if gifts is not None:
+                    gifts.remove(event_id)
+                    if not gifts:
+                        del self.gifts_by_name[rule.specific_gift]
+            else:
+                self.gifts_any.remove(event_id)
+        elif rule.trigger_type == 'command' and rule.custom_command:
+            self.commands.remove(rule.custom_command, event_id)
+
+    def match_follow(self):
+        return self.follow
+
+    def match_share(self):
+        return self.share
+
+    def match_like(self, like_count):
+        return self.likes.upto(like_count)
+
+    def match_gift(self, gift_name, coins):
+        matches = self.gifts_any.upto(coins)
+        gifts = self.gifts_by_name.get(gift_name)
+        if gifts is not None:
+            matches = matches + gifts.upto(coins)
+        return matches
+
+    def match_command(self, text):
+        return self.commands.match(text)
+
+    def rules_using_action(self, action_id):
+        return [rule.event_id for rule in self.rules.values() if action_id in rule.action_ids]
+
+class EventRuleRegistry:
+    """Per-user rule indexes, compiled on first use and patched when Events or Actions change"""
+
+    def __init__(self):
+        self.indexes: Dict[int, UserRuleIndex] = {}
+        self.pending: Dict[int, Set[int]] = {}
+
+    async def get(self, user_id):
+        """Return the compiled index; only touches the database after a change"""
+        index = self.indexes.get(user_id)
+        if index is None:
+            self.pending.pop(user_id, None)
+            index = await sync_to_async(self._build)(user_id)
+            self.indexes[user_id] = index
+        elif self.pending.get(user_id):
+            event_ids = self.pending.pop(user_id)
+            await sync_to_async(self._apply)(index, event_ids)
+        return index
+
+    def _build(self, user_id):
+        index = UserRuleIndex()
+        for event in Event.objects.filter(user_id=user_id, is_active=True).prefetch_related('actions'):
+            index.add(EventRule(event))
+        logger.info(f"Compiled {len(index.rules)} event rules for user {user_id}")
+        return index
+
+    def _apply(self, index, event_ids):
+        for event_id in event_ids:
+            index.remove(event_id)
+        for event in Event.objects.filter(id__in=event_ids, is_active=True).prefetch_related('actions'):
+            index.add(EventRule(event))
+
+    def event_changed(self, user_id, event_id):
+        """Queue an Event for recompilation if its user's index is loaded"""
+        if user_id in self.indexes:
+            self.pending.setdefault(user_id, set()).add(event_id)
+
+    def action_changed(self, user_id, action_id):
+        """Queue every rule that uses the Action for recompilation"""
+        index = self.indexes.get(user_id)
+        if index is not None:
+            for event_id in index.rules_using_action(action_id):
+                self.event_changed(user_id, event_id)
+
+    def discard(self, user_id):
+        self.indexes.pop(user_id, None)
+        self.pending.pop(user_id, None)
+
+# Global instance
+event_rules = EventRuleRegistry()
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+from .models import InteractionRollup, StreamInteraction
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+
+# Interaction type -> InteractionRollup counter
+METRICS = {
+    'comment': 'comments',
+    'like': 'likes',
+    'gift': 'gifts',
+    'join': 'joins',
+    'follow': 'follows',
+    'share': 'shares',
+}
+FIELDS = ['comments', 'likes', 'gifts', 'coins', 'joins', 'follows', 'shares', 'unique_chatters']
+
+class Bucket:
+    """An open bucket: counters not written yet plus every username that commented in it"""
+    __slots__ = ('counts', 'chatters', 'written_chatters')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(FIELDS[:-1], 0)
+        self.chatters = set()
+        self.written_chatters = 0
+
+    def row(self):
+        """Counters and new unique chatters since the last take()"""
+        return {**self.counts, 'unique_chatters': len(self.chatters) - self.written_chatters}
+
+    def take(self):
+        """row(), marking it written; the chatter set is kept so later halves only add new chatters"""
+        row = self.row()
+        self.counts = dict.fromkeys(FIELDS[:-1], 0)
+        self.written_chatters = len(self.chatters)
+        return row
+
+    def give_back(self, row):
+        # Undo a take() whose write failed
+        for field in FIELDS[:-1]:
+            self.counts[field] += row[field]
+        self.written_chatters -= row['unique_chatters']
+
+class InteractionRollups:
+    """Per-stream minute and hour buckets of interaction counts.
+
+    Every event is added to the open minute and hour bucket of its stream.
+    Buckets are written once they close, and a stream's open buckets are
+    also written when its interactions are flushed; those stay open with
+    their chatter set, so a bucket written in several parts still counts
+    each chatter once. Only a bucket split across processes (a restart in
+    mid-bucket) can count a chatter twice, so stored unique_chatters is an
+    upper bound in that case. Failed writes are put back for the next flush.
+    Minute buckets of streams that ended more than ``minute_retention_days``
+    ago are dropped by compact(), leaving the hour buckets.
+    """
+
+    def __init__(self, interval=None, minute_retention_days=None, max_points=None):
+        self.interval = interval or getattr(settings, 'TIKTOK_ROLLUP_FLUSH_INTERVAL', 15.0)
+        self.minute_retention_days = minute_retention_days or getattr(settings, 'TIKTOK_ROLLUP_MINUTE_RETENTION_DAYS', 7)
+        self.max_points = max_points or getattr(settings, 'TIKTOK_ROLLUP_MAX_POINTS', 360)
+        self.open: Dict[tuple, Bucket] = {}
+        self.stats = {'events': 0, 'written': 0, 'failed': 0}
+        self._loop = None
+        self._worker = None
+        self._lock = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def record(self, stream_id, interaction_type, username='', count=1, gift_value=0, at=None):
+        """Add an event to the open buckets of its stream"""
+        field = METRICS.get(interaction_type)
+        if not stream_id or field is None:
+            return
+        self._ensure_worker()
+        now = at if at is not None else time.time()
+        for resolution in (MINUTE, HOUR):
+            key = (stream_id, resolution, int(now // resolution * resolution))
+            bucket = self.open.get(key)
+            if bucket is None:
+                bucket = self.open[key] = Bucket()
+            bucket.counts[field] += count
+            if gift_value:
+                bucket.counts['coins'] += gift_value * count
+            if interaction_type == 'comment' and username:
+                bucket.chatters.add(username)
+        self.stats['events'] += 1
+
+    async def flush(self, stream_id=None):
+        """Write closed buckets; with a stream_id, write that stream's open buckets too"""
+        if self._lock is None:
+            return 0
+
+        now = time.time()
+        async with self._lock:
+            taken = []
+            for key in [key for key in self.open if stream_id is None or key[0] == stream_id]:
+                closed = key[2] + key[1] <= now
+                if not closed and stream_id is None:
+                    continue
+                bucket = self.open.pop(key) if closed else self.open[key]
+                row = bucket.take()
+                if any(row.values()):
+                    taken.append((key, bucket, row, closed))
+            if not taken:
+                return 0
+            try:
+                await sync_to_async(self._write)([(key, row) for key, _, row, _ in taken])
+                self.stats['written'] += len(taken)
+            except Exception as e:
+                self.stats['failed'] += len(taken)
+                logger.error(f"Failed to write {len(taken)} interaction rollups: {e}")
+                self._restore(taken)
+                return 0
+            return len(taken)
+
+    def _restore(self, taken):
+        # Put a failed flush back so the next one retries it
+        for key, bucket, row, closed in taken:
+            bucket.give_back(row)
+            if closed:
+                current = self.open.setdefault(key, bucket)
+                if current is not bucket:
+                    # An event for this period arrived after the bucket was taken
+                    for field, value in bucket.counts.items():
+                        current.counts[field] += value
+                    current.chatters |= bucket.chatters
+                    current.written_chatters += bucket.written_chatters
+
+    def _write(self, rows):
+        with transaction.atomic():
+            for (stream_id, resolution, start), counts in rows:
+                bucket_start = datetime.fromtimestamp(start, tz=dt_timezone.utc)
+                # A bucket split by a flush or a reconnect is added to, not replaced
+                updated = InteractionRollup.objects.filter(
+                    stream_id=stream_id, resolution=resolution, bucket_start=bucket_start
+                ).update(**{field: F(field) + value for field, value in counts.items()})
+                if not updated:
+                    InteractionRollup.objects.create(stream_id=stream_id, resolution=resolution, bucket_start=bucket_start, **counts)
+
+    def resolution_for(self, stream):
+        """Minutes unless the stream has more minute buckets than a chart can use"""
+        ended = stream.ended_at or timezone.now()
+        duration = (ended - stream.started_at).total_seconds()
+        return MINUTE if duration / MINUTE <= self.max_points else HOUR
+
+    def series(self, stream, resolution=None):
+        """Chart data for a stream: stored buckets merged with this process's open ones"""
+        resolution = resolution or self.resolution_for(stream)
+        buckets = {
+            row['bucket_start']: row
+            for row in InteractionRollup.objects.filter(stream=stream, resolution=resolution)
+            .order_by('bucket_start').values('bucket_start', *FIELDS)
+        }
+        for (stream_id, key_resolution, start), bucket in list(self.open.items()):
+            if stream_id != stream.id or key_resolution != resolution:
+                continue
+            bucket_start = datetime.fromtimestamp(start, tz=dt_timezone.utc)
+            row = buckets.setdefault(bucket_start, {'bucket_start': bucket_start, **dict.fromkeys(FIELDS, 0)})
+            for field, value in bucket.row().items():
+                row[field] += value
+        return {
+            'stream_id': stream.id,
+            'resolution': resolution,
+            'buckets': [buckets[start] for start in sorted(buckets)]
+        }
+
+    def rebuild(self, stream_id):
+        """Recompute a stream's buckets from its StreamInteraction rows, e.g. for streams recorded before rollups"""
+        with transaction.atomic():
+            InteractionRollup.objects.filter(stream_id=stream_id).delete()
+            for resolution, trunc in ((MINUTE, TruncMinute), (HOUR, TruncHour)):
+                rows = (
+                    StreamInteraction.objects.filter(stream_id=stream_id)
+                    .annotate(bucket=trunc('timestamp'))
+                    .values('bucket')
+                    .annotate(
+                        coins=Sum(F('gift_value') * F('gift_count'), filter=Q(interaction_type='gift'), default=0),
+                        unique_chatters=Count('username', filter=Q(interaction_type='comment'), distinct=True),
+                        **{
+                            field: Sum('gift_count', filter=Q(interaction_type=kind), default=0) if kind == 'gift'
+                            else Count('id', filter=Q(interaction_type=kind))
+                            for kind, field in METRICS.items()
+                        }
+                    )
+                )
+                InteractionRollup.objects.bulk_create([
+                    InteractionRollup(stream_id=stream_id, resolution=resolution, bucket_start=row.pop('bucket'), **row)
+                    for row in rows
+                ])
+
+    def compact(self, older_than_days=None):
+        """Drop minute buckets of streams that ended long ago, making sure hour buckets exist first"""
+        days = older_than_days if older_than_days is not None else self.minute_retention_days
+        cutoff = timezone.now() - timedelta(days=days)
+        stream_ids = list(
+            InteractionRollup.objects.filter(resolution=MINUTE, stream__ended_at__lt=cutoff)
+            .values_list('stream_id', flat=True).distinct()
+        )
+        dropped = 0
+        for stream_id in stream_ids:
+            with transaction.atomic():
+                minutes = InteractionRollup.objects.filter(stream_id=stream_id, resolution=MINUTE)
+                if not InteractionRollup.objects.filter(stream_id=stream_id, resolution=HOUR).exists():
+                    # Unique chatters cannot be summed; the busiest minute is a lower bound for the hour
+                    hours = minutes.annotate(hour=TruncHour('bucket_start')).values('hour').annotate(
+                        unique_chatters=Max('unique_chatters'),
+                        **{field: Sum(field) for field in FIELDS[:-1]}
+                    )
+                    InteractionRollup.objects.bulk_create([
+                        InteractionRollup(stream_id=stream_id, resolution=HOUR, bucket_start=row.pop('hour'), **row)
+                        for row in hours
+                    ])
+                dropped += minutes.delete()[0]
+        if dropped:
+            logger.info(f"Compacted {dropped} minute rollups from {len(stream_ids)} ended stream(s)")
+        return dropped
+
+    async def close(self):
+        """Write every open bucket and stop the background task"""
+        if self._lock is not None:
+            for stream_id in {key[0] for key in self.open}:
+                await self.flush(stream_id)
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+
+# Global instance
+interaction_rollups = InteractionRollups()
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Dict, List
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import StreamInteraction
+
+logger = logging.getLogger(__name__)
+
+class InteractionWriter:
+    """Write-behind queue that batches StreamInteraction rows per stream.
+
+    Interactions are buffered in memory and written with bulk_create once a
+    stream's buffer reaches ``batch_size`` or every ``flush_interval`` seconds.
+    When more than ``max_pending`` rows are waiting, callers of ``enqueue``
+    wait for the next flush instead of growing the buffer without bound.
+    A batch that fails to write is put back for the next flush; if that
+    would fill the buffer, its oldest rows are dropped instead so an outage
+    does not stall ``enqueue``.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or getattr(settings, 'TIKTOK_INTERACTION_BATCH_SIZE', 200)
+        self.flush_interval = flush_interval or getattr(settings, 'TIKTOK_INTERACTION_FLUSH_INTERVAL', 1.0)
+        self.max_pending = max_pending or getattr(settings, 'TIKTOK_INTERACTION_MAX_PENDING', 5000)
+        self.buffers: Dict[int, List[StreamInteraction]] = {}
+        self.pending = 0
+        self.stats = {'enqueued': 0, 'written': 0, 'failed': 0, 'dropped': 0, 'flushes': 0, 'backpressure_waits': 0}
+        self._loop = None
+        self._worker = None
+        self._wakeup = None
+        self._drained = None
+        self._write_lock = None
+
+    def _ensure_worker(self):
+        """Start the background flush task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._drained = asyncio.Event()
+            self._write_lock = asyncio.Lock()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def enqueue(self, stream_id, interaction_type, username, display_name='', message='',
+                      gift_name='', gift_count=1, gift_value=0, user_id=None):
+        """Buffer an interaction, waiting for a flush if too many rows are pending"""
+        self._ensure_worker()
+
+        while self.pending >= self.max_pending:
+            self.stats['backpressure_waits'] += 1
+            self._drained.clear()
+            self._wakeup.set()
+            await self._drained.wait()
+
+        buffer = self.buffers.setdefault(stream_id, [])
+        buffer.append(StreamInteraction(
+            stream_id=stream_id,
+            user_id=user_id,
+            interaction_type=interaction_type,
+            username=username,
+            display_name=display_name or username,
+            message=message or '',
+            gift_name=gift_name or '',
+            gift_count=gift_count,
+            gift_value=gift_value
+        ))
+        self.pending += 1
+        self.stats['enqueued'] += 1
+
+        if len(buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self, stream_id=None):
+        """Write buffered interactions for one stream, or for all streams"""
+        if self._write_lock is None:
+            return 0
+
+        written = 0
+        async with self._write_lock:
+            stream_ids = [stream_id] if stream_id is not None else list(self.buffers)
+            for sid in stream_ids:
+                batch = self.buffers.pop(sid, None)
+                if not batch:
+                    continue
+                try:
+                    await sync_to_async(self._write)(batch)
+                    written += len(batch)
+                    self.pending -= len(batch)
+                except Exception as e:
+                    self.stats['failed'] += len(batch)
+                    dropped = self._restore(sid, batch)
+                    logger.error(f"Failed to write {len(batch)} interactions for stream {sid}, retrying next flush ({dropped} dropped): {e}")
+
+            if written:
+                self.stats['written'] += written
+                self.stats['flushes'] += 1
+            self._drained.set()
+
+        return written
+
+    def _restore(self, stream_id, batch):
+        # Put the batch back ahead of rows queued while it was written, keeping pending under max_pending
+        newer = self.buffers.get(stream_id, [])
+        for row in batch:
+            # bulk_create may have set ids before its transaction rolled back
+            row.pk = None
+        dropped = max(0, min(len(batch), self.pending - self.max_pending + 1))
+        self.buffers[stream_id] = batch[dropped:] + newer
+        self.pending -= dropped
+        self.stats['dropped'] += dropped
+        return dropped
+
+    def _write(self, batch):
+        StreamInteraction.objects.bulk_create(batch, batch_size=self.batch_size)
+
+    async def close(self):
+        """Flush everything and stop the background task"""
+        await self.flush()
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+
+# Global instance
+interaction_writer = InteractionWriter()
@@ -0,0 +1,166 @@
+import logging
+import time
+import unicodedata
+from collections import deque
+from typing import Dict
+from asgiref.sync import sync_to_async
+from .models import AutoResponse, AutomationTrigger
+
+logger = logging.getLogger(__name__)
+
+def fold(text):
+    """Case and Unicode folding that treats Turkish I/ı/İ/i as the same letter"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    # casefold() turns İ into i + combining dot and leaves dotless ı alone
+    return text.replace('\u0307', '').replace('ı', 'i')
+
+class AhoCorasick:
+    """Multi-pattern automaton; one pass over the text finds every keyword"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """Yield (start, end, value) for every pattern occurrence"""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                yield i - length + 1, i + 1, value
+
+class KeywordRule:
+    __slots__ = ('kind', 'rule_id', 'keyword', 'message', 'action_type', 'action_value', 'name', 'cooldown')
+
+    def __init__(self, kind, rule_id, keyword, message='', action_type='', action_value='', name='', cooldown=0):
+        self.kind = kind
+        self.rule_id = rule_id
+        self.keyword = keyword
+        self.message = message
+        self.action_type = action_type
+        self.action_value = action_value
+        self.name = name
+        self.cooldown = cooldown
+
+    @property
+    def key(self):
+        return (self.kind, self.rule_id)
+
+class KeywordMatcher:
+    """Compiled AutoResponse and keyword AutomationTrigger rules for one streamer"""
+
+    def __init__(self, auto_responses=(), triggers=()):
+        self.automaton = AhoCorasick()
+        self.rule_count = 0
+
+        for response in auto_responses:
+            for keyword in response.trigger_keywords.split(','):
+                self._add(keyword, KeywordRule(
+                    'auto_response', response.id, keyword.strip(),
+                    message=response.response_message,
+                    cooldown=response.cooldown_seconds
+                ))
+        for trigger in triggers:
+            for keyword in trigger.trigger_value.split(','):
+                self._add(keyword, KeywordRule(
+                    'automation', trigger.id, keyword.strip(),
+                    action_type=trigger.action_type,
+                    action_value=trigger.action_value,
+                    name=trigger.name
+                ))
+        self.automaton.build()
+
+    def _add(self, keyword, rule):
+        pattern = fold(keyword.strip())
+        if pattern:
+            self.automaton.add(pattern, rule)
+            self.rule_count += 1
+
+    def find(self, comment):
+        """Rules whose keyword starts a word of the comment, each rule once
+
+        Only the start is anchored, so Turkish suffixed forms still match
+        ("merhabalar" for "merhaba", "selamlar" for "selam") while a keyword
+        in the middle of a word does not ("kolay" does not fire "ol").
+        """
+        text = fold(comment)
+        found = {}
+        for start, end, rule in self.automaton.search(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            found.setdefault(rule.key, rule)
+        return list(found.values())
+
+class KeywordMatcherRegistry:
+    """Per-user keyword matchers with in-memory cooldowns"""
+
+    def __init__(self):
+        self.matchers: Dict[int, KeywordMatcher] = {}
+        self.stale = set()
+        self.last_fired = {}
+
+    async def get(self, user_id):
+        matcher = self.matchers.get(user_id)
+        if matcher is None or user_id in self.stale:
+            self.stale.discard(user_id)
+            matcher = await sync_to_async(self._build)(user_id)
+            self.matchers[user_id] = matcher
+        return matcher
+
+    def _build(self, user_id):
+        matcher = KeywordMatcher(
+            AutoResponse.objects.filter(user_id=user_id, is_active=True),
+            AutomationTrigger.objects.filter(user_id=user_id, trigger_type='keyword', is_active=True)
+        )
+        logger.info(f"Compiled {matcher.rule_count} keywords for user {user_id}")
+        return matcher
+
+    async def match(self, user_id, comment, kinds=('auto_response', 'automation')):
+        """Matching rules of the given kinds that are not cooling down"""
+        matcher = await self.get(user_id)
+        now = time.monotonic()
+        fired = []
+        for rule in matcher.find(comment):
+            if rule.kind not in kinds:
+                continue
+            last = self.last_fired.get(rule.key)
+            if rule.cooldown and last is not None and now - last < rule.cooldown:
+                continue
+            self.last_fired[rule.key] = now
+            fired.append(rule)
+        return fired
+
+    def invalidate(self, user_id):
+        if user_id in self.matchers:
+            self.stale.add(user_id)
+
+# Global instance
+keyword_matchers = KeywordMatcherRegistry()
@@ -36,7 +36,7 @@ def lastx_widget(request):
             
             # Get the last interaction of the specified type
             interaction = StreamInteraction.objects.filter(
-                stream__account__user_id=user_id,
+                user_id=user_id,
                 interaction_type=interaction_type
             ).order_by('-timestamp').first()
             
@@ -103,6 +103,7 @@ def lastx_test(request):
         
         StreamInteraction.objects.create(
             stream=stream,
+            user_id=user_id,
             interaction_type=widget_type,
             username=test_usernames.get(widget_type, 'TestUser'),
             message='Test message' if widget_type == 'chatter' else '',
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import random
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from .models import UserPoints
+
+logger = logging.getLogger(__name__)
+
+MAX_LEVEL = 32
+
+class Node:
+    __slots__ = ('key', 'member', 'next', 'width')
+
+    def __init__(self, key, member, level):
+        self.key = key
+        self.member = member
+        self.next = [None] * level
+        self.width = [0] * level
+
+class RankIndex:
+    """Indexable skip list of members ordered by score, highest first.
+
+    Each forward link stores how many members it skips, so updating a score,
+    finding a member's rank and reading the member at a rank all take
+    O(log n) expected time. Ties are ordered by member name, so ranks are
+    stable between calls.
+    """
+
+    def __init__(self):
+        self.head = Node(None, None, MAX_LEVEL)
+        self.level = 1
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def _insert(self, key, member):
+        update = [self.head] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                # The head's link on a new level spans the whole list
+                self.head.width[i] = len(self.scores)
+            self.level = level
+
+        new = Node(key, member, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+
+    def _delete(self, key):
+        update = [None] * MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        target = node.next[0]
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+
+    def build(self, items):
+        """Fill an empty index from (member, score) pairs in one sorted pass"""
+        self.scores = dict(items)
+        ordered = sorted((-score, member) for member, score in self.scores.items())
+        tails = [self.head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        self.level = 1
+        for position, key in enumerate(ordered, 1):
+            level = self._random_level()
+            self.level = max(self.level, level)
+            node = Node(key, key[1], level)
+            for i in range(level):
+                tails[i].next[i] = node
+                tails[i].width[i] = position - positions[i]
+                tails[i], positions[i] = node, position
+        for i in range(self.level):
+            # The last link on each level spans the rest of the list
+            tails[i].width[i] = len(ordered) - positions[i]
+
+    def set(self, member, score):
+        """Set a member's score, inserting it if needed"""
+        old = self.scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._delete((-old, member))
+        self._insert((-score, member), member)
+        self.scores[member] = score
+
+    def add(self, member, delta):
+        """Add to a member's score and return the new score"""
+        score = self.scores.get(member, 0) + delta
+        self.set(member, score)
+        return score
+
+    def remove(self, member):
+        old = self.scores.pop(member, None)
+        if old is not None:
+            self._delete((-old, member))
+
+    def score(self, member):
+        return self.scores.get(member)
+
+    def rank(self, member):
+        """1-based rank of a member, or None if it has no score"""
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        key = (-score, member)
+        rank = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.width[i]
+                node = node.next[i]
+            if node.key == key:
+                return rank
+        return None
+
+    def at(self, rank):
+        """Node at a 1-based rank, or None"""
+        if rank < 1 or rank > len(self.scores):
+            return None
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and traversed + node.width[i] <= rank:
+                traversed += node.width[i]
+                node = node.next[i]
+            if traversed == rank:
+                return node
+        return None
+
+    def top(self, n, start=1):
+        """(rank, member, score) for ``n`` members from rank ``start``"""
+        node = self.at(start)
+        entries = []
+        rank = start
+        while node is not None and len(entries) < n:
+            entries.append((rank, node.member, -node.key[0]))
+            node = node.next[0]
+            rank += 1
+        return entries
+
+class Board:
+    """Points and coins-spent rankings plus levels for one streamer's viewers"""
+    __slots__ = ('points', 'coins', 'levels')
+
+    def __init__(self):
+        self.points = RankIndex()
+        self.coins = RankIndex()
+        self.levels = {}
+
+    def update(self, username, points=None, coins=None, level=None):
+        if points is not None:
+            self.points.set(username, points)
+        if coins:
+            self.coins.set(username, coins)
+        if level is not None:
+            self.levels[username] = level
+
+class Leaderboard:
+    """Live rankings of each streamer's viewers, kept in memory.
+
+    A streamer's board is loaded from UserPoints the first time it is used
+    (concurrent first uses share one load) and then kept current from the
+    ingestion path: award_points adds deltas as events arrive, and every
+    points ledger flush overwrites the flushed viewers with their stored
+    totals, so the board and the database converge. UserPoints is the
+    snapshot a board is rebuilt from after a restart or a bulk operation.
+    """
+
+    BOARDS = ('points', 'coins')
+
+    def __init__(self, top_gifters=None):
+        self.top_gifters = top_gifters or getattr(settings, 'TIKTOK_TOP_GIFTERS_N', 3)
+        self.boards = {}
+        self._loading = {}
+        self.stats = {'loads': 0, 'rows_loaded': 0, 'updates': 0}
+
+    async def board(self, user_id):
+        """The streamer's board, loading it on first use"""
+        board = self.boards.get(user_id)
+        if board is not None:
+            return board
+
+        future = self._loading.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, user_id):
+        from .points_ledger import points_ledger
+
+        board, exists = await sync_to_async(self._read)(user_id)
+        # Points recorded but not flushed yet are not in the rows just read
+        for (streamer_id, username), delta in list(points_ledger.pending.items()):
+            if streamer_id == user_id:
+                board.points.add(username, delta.total())
+                if delta.coins:
+                    board.coins.add(username, delta.coins)
+        if exists:
+            # A new streamer's empty board is kept too, so live events update it from the first one;
+            # ids of accounts that do not exist (e.g. from overlay URLs) are not kept
+            self.boards[user_id] = board
+        self.stats['loads'] += 1
+        logger.info(f"Loaded leaderboard for user {user_id}: {len(board.points)} viewers")
+        return board
+
+    def _read(self, user_id):
+        board = Board()
+        rows = list(UserPoints.objects.filter(user_id=user_id).values_list(
+            'tiktok_username', 'points_total', 'total_coins_spent', 'level'
+        ))
+        board.points.build((username, points) for username, points, _, _ in rows)
+        board.coins.build((username, coins) for username, _, coins, _ in rows if coins)
+        board.levels = {username: level for username, _, _, level in rows}
+        self.stats['rows_loaded'] += len(rows)
+        return board, bool(rows) or User.objects.filter(id=user_id).exists()
+
+    def record(self, user_id, username, points=0, coins=0):
+        """Add points and coins from an event to a loaded board"""
+        board = self.boards.get(user_id)
+        if board is None:
+            return
+        if points:
+            board.points.add(username, points)
+        if coins:
+            board.coins.add(username, coins)
+        self.stats['updates'] += 1
+
+    def sync(self, user_id, rows):
+        """Overwrite viewers with (username, points, coins, level) totals after a ledger flush"""
+        board = self.boards.get(user_id)
+        if board is None:
+            return
+        for username, points, coins, level in rows:
+            board.update(username, points, coins, level)
+
+    def invalidate(self, user_id):
+        """Forget a streamer's board after a bulk change; the next use reloads it"""
+        self.boards.pop(user_id, None)
+
+    async def rank(self, user_id, board_name, username):
+        board = await self.board(user_id)
+        return getattr(board, board_name).rank(username)
+
+    async def top(self, user_id, board_name, n=10, start=1):
+        board = await self.board(user_id)
+        return getattr(board, board_name).top(n, start)
+
+    async def is_top_gifter(self, user_id, username, n=None):
+        """Whether a viewer is among the streamer's top ``n`` gifters by coins spent"""
+        rank = await self.rank(user_id, 'coins', username)
+        return rank is not None and rank <= (n or self.top_gifters)
+
+# Global instance
+leaderboard = Leaderboard()
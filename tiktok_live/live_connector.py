@@ -1,26 +1,48 @@
 from TikTokLive import TikTokLiveClient
 from TikTokLive.events import ConnectEvent, CommentEvent, GiftEvent, FollowEvent, LikeEvent, JoinEvent, ShareEvent, DisconnectEvent, RoomUserSeqEvent
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.utils import timezone
 import logging
 import asyncio
-import random
 import time
+from .interaction_writer import interaction_writer
+from .stream_stats import stream_stats
+from .interaction_rollups import interaction_rollups
+from .stream_context import StreamContext
+from .keyword_matcher import keyword_matchers
+from .event_rules import event_rules
+from .leaderboard import leaderboard
+from .tts_templates import template_speech
+from .points_ledger import points_ledger, points_for
+from .reconnect import Backoff, reconnect_limiter
 
 logger = logging.getLogger(__name__)
 
+def viewer_handle(user):
+    """A viewer's @handle, which rules and points are keyed on; falls back to the nickname"""
+    return getattr(user, 'unique_id', None) or getattr(user, 'nickname', None) or 'Unknown'
+
 class TikTokLiveConnector:
-    def __init__(self, username):
+    def __init__(self, username, client_factory=TikTokLiveClient, backoff=None, limiter=None):
         self.username = username.replace('@', '').strip()
         
         # Create client with simple settings
-        self.client = TikTokLiveClient(unique_id=self.username)
+        self.client_factory = client_factory
+        self.client = client_factory(unique_id=self.username)
         
         self.channel_layer = get_channel_layer()
-        self.consumer = None  # Will be set by consumer
         self.is_connected = False
+        self.stopping = False
+        self.backoff = backoff or Backoff()
+        self.limiter = limiter or reconnect_limiter
+        self.max_reconnect_attempts = getattr(settings, 'TIKTOK_RECONNECT_MAX_ATTEMPTS', 10)
+        self.reconnect_task = None
+        self.reconnects = 0
+        # Set by the connection manager; awaited with (username, connector) once reconnecting is abandoned
+        self.on_give_up = None
         self.viewer_count = 0
+        self.context = StreamContext(self.username)
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -44,11 +66,15 @@ class TikTokLiveConnector:
         async def on_disconnect(event: DisconnectEvent):
             self.is_connected = False
             logger.warning(f"Disconnected: @{self.username}")
+            await self.flush_interactions()
             await self.send_to_websocket({
                 'type': 'disconnection',
                 'status': 'disconnected',
-                'username': self.username
+                'username': self.username,
+                'reconnecting': not self.stopping
             })
+            if not self.stopping:
+                self.schedule_reconnect()
 
         @self.client.on(RoomUserSeqEvent)
         async def on_viewer_count_update(event: RoomUserSeqEvent):
@@ -90,6 +116,12 @@ class TikTokLiveConnector:
                 }
                 await self.send_to_websocket(data)
                 await self.save_interaction(data)
+                await self.award_points(event.user, 'comment')
+                await self.process_keyword_triggers(username, event.comment)
+                if event.comment.startswith('!') or event.comment.startswith('/'):
+                    if event.comment.strip().lower() == getattr(settings, 'TIKTOK_POINTS_COMMAND', '!score'):
+                        await self.reply_points(event.user)
+                    await self.check_command_events(event.user, event.comment)
                 
                 # Process TTS for this comment
                 await self.process_tts_comment(username, event.comment)
@@ -116,6 +148,8 @@ class TikTokLiveConnector:
             }
             await self.send_to_websocket(data)
             await self.save_interaction(data)
+            await self.award_points(event.user, 'gift', gift_count, coins=event.gift.diamond_count * gift_count)
+            await self.check_gift_events(event.user, event.gift)
 
         @self.client.on(FollowEvent)
         async def on_follow(event: FollowEvent):
@@ -128,6 +162,8 @@ class TikTokLiveConnector:
             }
             await self.send_to_websocket(data)
             await self.save_interaction(data)
+            await self.award_points(event.user, 'follow')
+            await self.check_follow_events(event.user)
 
         @self.client.on(LikeEvent)
         async def on_like(event: LikeEvent):
@@ -141,6 +177,11 @@ class TikTokLiveConnector:
                 'timestamp': str(timezone.now())
             }
             await self.send_to_websocket(data)
+            await self.context.ensure_loaded()
+            stream_stats.record(self.context.stream_id, 'like', event.count)
+            interaction_rollups.record(self.context.stream_id, 'like', username, event.count)
+            await self.award_points(event.user, 'like', event.count)
+            await self.check_like_events(event.user, event.count)
 
         @self.client.on(JoinEvent)
         async def on_join(event: JoinEvent):
@@ -165,60 +206,236 @@ class TikTokLiveConnector:
             }
             await self.send_to_websocket(data)
             await self.save_interaction(data)
+            await self.award_points(event.user, 'share')
+            await self.check_share_events(event.user)
 
     async def send_to_websocket(self, data):
-        """Send data to WebSocket clients - BROADCAST METHOD"""
-        logger.info(f"Broadcasting to WebSocket - Type: {data.get('type')}, User: {data.get('username')}")
+        """Send data to WebSocket clients through the single fan-out pipeline"""
+        from .connection_manager import connection_manager
         
-        # Method 1: Broadcast to all subscribers via global manager
         try:
-            from .connection_manager import connection_manager
-            connection_manager.broadcast_to_subscribers(self.username, data)
-            logger.info(f"BROADCAST: Successfully sent {data.get('type')} to all subscribers")
+            delivered = await connection_manager.broadcast_to_subscribers(self.username, data)
+            logger.debug(f"BROADCAST: {data.get('type')} delivered to {delivered} subscribers")
         except Exception as e:
             logger.error(f"BROADCAST failed: {e}")
-        
-        # Method 2: Direct send via consumer (fallback)
-        if self.consumer:
-            try:
-                import json
-                await self.consumer.send(text_data=json.dumps(data))
-                logger.info(f"DIRECT: Successfully sent {data.get('type')} to WebSocket")
-            except Exception as e:
-                logger.error(f"DIRECT send failed: {e}")
-        
-        # Method 3: Fallback to channel layer
-        if self.channel_layer:
-            try:
-                room_name = f"live_{self.username}"
-                message = {
-                    'type': 'live_event',
-                    'data': data
-                }
-                await self.channel_layer.group_send(room_name, message)
-                logger.info(f"CHANNEL: Successfully sent {data.get('type')} to WebSocket")
-            except Exception as e:
-                logger.error(f"CHANNEL send failed: {e}")
-                logger.exception(e)
 
     async def create_live_stream(self):
-        """Create or update the active live stream"""
-        # Skip database operations that are causing errors
-        logger.info(f"Live stream session started for @{self.username}")
+        """Resolve account, owner, settings and the active live stream once per connection"""
+        try:
+            await self.context.start_stream()
+            logger.info(f"Live stream session started for @{self.username} (stream {self.context.stream_id})")
+            if self.context.user_id:
+                # Load rankings now so top-gifter rules and the points command answer from memory
+                await leaderboard.board(self.context.user_id)
+        except Exception as e:
+            logger.error(f"Failed to start live stream session: {e}")
 
     async def update_viewer_count(self, count):
-        """Update viewer count in database"""
-        # Skip database operations that are causing errors
-        logger.info(f"Viewer count updated to: {count}")
+        """Track current and peak viewers; written with the next stats checkpoint"""
+        await self.context.ensure_loaded()
+        stream_stats.record_viewers(self.context.stream_id, count)
 
     async def save_interaction(self, data):
-        # Skip database operations that are causing errors
-        # Focus on TTS functionality instead
+        """Queue the interaction for the batched writer and update Last X widgets"""
+        await self.context.ensure_loaded()
+        if self.context.stream_id:
+            try:
+                await interaction_writer.enqueue(
+                    self.context.stream_id,
+                    data['type'],
+                    data['username'],
+                    message=data.get('message', ''),
+                    gift_name=data.get('gift_name', ''),
+                    gift_count=data.get('gift_count', 1),
+                    gift_value=data.get('gift_value', 0),
+                    user_id=self.context.user_id
+                )
+                stream_stats.record(self.context.stream_id, data['type'], data.get('gift_count', 1), data.get('gift_value', 0))
+                interaction_rollups.record(self.context.stream_id, data['type'], data['username'], data.get('gift_count', 1), data.get('gift_value', 0))
+            except Exception as e:
+                logger.error(f"Failed to queue interaction: {e}")
+        
         try:
             # Update Last X widgets via WebSocket
             await self.update_lastx_widget(data['type'], data['username'])
         except Exception as e:
             logger.error(f"Failed to update Last X widget: {e}")
+
+    async def process_keyword_triggers(self, username, comment):
+        """Fire AutoResponse and keyword AutomationTrigger rules matching the comment"""
+        try:
+            await self.context.ensure_loaded()
+            account = self.context.account
+            if account is None:
+                return
+            
+            kinds = []
+            if account.enable_auto_response:
+                kinds.append('auto_response')
+            if account.enable_automation:
+                kinds.append('automation')
+            if not kinds:
+                return
+            
+            for rule in await keyword_matchers.match(self.context.user_id, comment, kinds):
+                if rule.kind == 'auto_response':
+                    await self.send_to_websocket({
+                        'type': 'auto_response',
+                        'username': username,
+                        'keyword': rule.keyword,
+                        'message': rule.message
+                    })
+                else:
+                    await self.send_to_websocket({
+                        'type': 'automation',
+                        'username': username,
+                        'keyword': rule.keyword,
+                        'name': rule.name,
+                        'action_type': rule.action_type,
+                        'action_value': rule.action_value
+                    })
+        except Exception as e:
+            logger.error(f"Keyword trigger error: {e}")
+
+    async def award_points(self, user, transaction_type, count=1, coins=0):
+        """Add points at the streamer's rates to the ledger; they are written in batches"""
+        try:
+            await self.context.ensure_loaded()
+            if not self.context.user_id:
+                return
+            points = points_for(self.context.points_settings, transaction_type, count)
+            points_ledger.record(
+                self.context.user_id, viewer_handle(user), transaction_type, points,
+                gifts=count if transaction_type == 'gift' else 0,
+                coins=coins,
+                on_level_up=self.announce_level_up
+            )
+            leaderboard.record(self.context.user_id, viewer_handle(user), points, coins)
+        except Exception as e:
+            logger.error(f"Error awarding points: {e}")
+
+    async def reply_points(self, user):
+        """Answer the points command with the viewer's points, level and rank"""
+        try:
+            await self.context.ensure_loaded()
+            if not self.context.user_id:
+                return
+            username = viewer_handle(user)
+            board = await leaderboard.board(self.context.user_id)
+            rank = board.points.rank(username)
+            command = 'points_info_top100' if rank is not None and rank <= 100 else 'points_info_other'
+            await self.speak_template('chatbot', command, {
+                'username': username,
+                'points': board.points.score(username) or 0,
+                'level': board.levels.get(username, 1),
+                'rank': rank or ''
+            })
+        except Exception as e:
+            logger.error(f"Error answering points command: {e}")
+
+    async def announce_level_up(self, username, level, points):
+        """Speak the chatbot level-up message once a flush has levelled a viewer up"""
+        await self.speak_template('chatbot', 'level_up', {
+            'username': username,
+            'level': level,
+            'points': points
+        })
+
+    async def rule_index(self):
+        """The streamer's compiled Actions & Events rules, or None without an account"""
+        await self.context.ensure_loaded()
+        if not self.context.user_id:
+            return None
+        return await event_rules.get(self.context.user_id)
+
+    async def check_follow_events(self, user):
+        """Check and trigger follow events"""
+        await self.run_event_rules(user, 'match_follow')
+
+    async def check_gift_events(self, user, gift):
+        """Check and trigger gift events"""
+        await self.run_event_rules(user, 'match_gift', gift.name, gift.diamond_count, gift=gift)
+
+    async def check_like_events(self, user, like_count):
+        """Check and trigger like events"""
+        await self.run_event_rules(user, 'match_like', like_count, like_count=like_count)
+
+    async def check_share_events(self, user):
+        """Check and trigger share events"""
+        await self.run_event_rules(user, 'match_share')
+
+    async def check_command_events(self, user, command):
+        """Check and trigger custom command events"""
+        await self.run_event_rules(user, 'match_command', command, command=command)
+
+    async def run_event_rules(self, user, match, *args, **kwargs):
+        """Execute the actions of every rule the index returns for this event"""
+        try:
+            rules = await self.rule_index()
+            if rules is None:
+                return
+            for rule in getattr(rules, match)(*args):
+                if await self.user_matches_event(user, rule):
+                    await self.execute_event_actions(rule, user, **kwargs)
+        except Exception as e:
+            logger.error(f"Event rule error: {e}")
+
+    async def user_matches_event(self, user, event):
+        """Check if user matches event criteria"""
+        if event.user_type == 'any':
+            return True
+        elif event.user_type == 'specific':
+            return viewer_handle(user) == event.specific_user
+        elif event.user_type == 'topgifter':
+            return await leaderboard.is_top_gifter(self.context.user_id, viewer_handle(user))
+        
+        return False
+
+    async def execute_event_actions(self, rule, user, **kwargs):
+        """Execute actions for a triggered event rule"""
+        for action in rule.actions:
+            try:
+                await self.execute_action(action, user, **kwargs)
+            except Exception as e:
+                logger.error(f"Error executing action '{action.name}': {e}")
+
+    async def execute_action(self, action, user, **kwargs):
+        """Execute a specific action"""
+        logger.info(f"Executing action '{action.name}' for user @{viewer_handle(user)}")
+        
+        if action.tts_text:
+            handle = viewer_handle(user)
+            variables = {'username': handle, 'nickname': getattr(user, 'nickname', None) or handle}
+            gift = kwargs.get('gift')
+            if gift is not None:
+                variables.update(giftname=gift.name, amount=getattr(gift, 'count', 1), coins=gift.diamond_count)
+            if 'like_count' in kwargs:
+                variables['likecount'] = kwargs['like_count']
+            await self.speak_template('action', action.id, variables)
+
+    async def speak_template(self, kind, ident, variables):
+        """Speak an alert or chatbot template from its pre-rendered segments"""
+        try:
+            result = await template_speech.aspeak(kind, self.context.user_id, ident, variables)
+            if result is not None:
+                await self.send_to_websocket(result)
+        except Exception as e:
+            logger.error(f"Error speaking {kind} template: {e}")
+
+    async def flush_interactions(self):
+        """Write any buffered interactions and counters for this stream"""
+        if self.context.stream_id:
+            try:
+                await interaction_writer.flush(self.context.stream_id)
+                await stream_stats.checkpoint(self.context.stream_id)
+                await interaction_rollups.flush(self.context.stream_id)
+            except Exception as e:
+                logger.error(f"Failed to flush interactions: {e}")
+        if self.context.user_id:
+            try:
+                await points_ledger.flush(self.context.user_id)
+            except Exception as e:
+                logger.error(f"Failed to flush points: {e}")
     
     async def update_lastx_widget(self, interaction_type, username):
         """Update Last X widgets with new interaction"""
@@ -233,30 +450,23 @@ class TikTokLiveConnector:
             }
             
             widget_type = widget_mapping.get(interaction_type)
-            if widget_type:
+            user_id = self.context.user_id
+            if widget_type and user_id and self.channel_layer:
                 # Broadcast to Last X widget subscribers via channel layer
-                if self.channel_layer:
-                    widget_data = {
+                widget_data = {
+                    'type': 'lastx_update',
+                    'widget_type': widget_type,
+                    'username': username,
+                    'timestamp': str(timezone.now())
+                }
+                
+                await self.channel_layer.group_send(
+                    f"lastx_{user_id}",
+                    {
                         'type': 'lastx_update',
-                        'widget_type': widget_type,
-                        'username': username,
-                        'timestamp': str(timezone.now())
+                        'data': widget_data
                     }
-                    
-                    # Get user ID from account
-                    try:
-                        account = await TikTokAccount.objects.aget(username=self.username)
-                        user_id = account.user_id
-                        
-                        await self.channel_layer.group_send(
-                            f"lastx_{user_id}",
-                            {
-                                'type': 'lastx_update',
-                                'data': widget_data
-                            }
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to get user ID for Last X update: {e}")
+                )
         except Exception as e:
             logger.error(f"Failed to update Last X widget: {e}")
 
@@ -266,8 +476,8 @@ class TikTokLiveConnector:
             logger.info(f"Connecting to @{self.username}...")
             
             # Create fresh client
-            self.client = TikTokLiveClient(unique_id=self.username)
-            self.setup_handlers()
+            self.stopping = False
+            await self.replace_client()
             
             # Try to connect
             await self.client.start()
@@ -288,106 +498,144 @@ class TikTokLiveConnector:
             
             return False
 
-    async def stop(self):
-        """Stop the TikTok Live connection"""
+    async def replace_client(self):
+        """Detach and disconnect the current client, then create a fresh one with our handlers"""
+        old_client = self.client
+        if old_client is not None:
+            try:
+                # Detach first so closing the old socket does not fire on_disconnect again
+                old_client.remove_all_listeners()
+                await old_client.disconnect(close_client=True)
+            except Exception as e:
+                logger.debug(f"Error closing previous client for @{self.username}: {e}")
+        self.client = self.client_factory(unique_id=self.username)
+        self.setup_handlers()
+    
+    @property
+    def reconnecting(self):
+        return self.reconnect_task is not None and not self.reconnect_task.done()
+    
+    def schedule_reconnect(self):
+        """Start the supervised reconnect loop unless one is already running"""
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.create_task(self.reconnect())
+    
+    async def reconnect(self):
+        """Reconnect with jittered exponential backoff, then tell overlays how long the gap was"""
+        disconnected_at = timezone.now()
+        started = time.monotonic()
+        
+        for attempt in range(self.max_reconnect_attempts):
+            await asyncio.sleep(self.backoff.delay(attempt))
+            if self.stopping:
+                return False
+            
+            async with self.limiter:
+                if self.stopping:
+                    return False
+                try:
+                    logger.info(f"Reconnecting to @{self.username} (attempt {attempt + 1})")
+                    await self.replace_client()
+                    await self.client.start()
+                    self.is_connected = True
+                except Exception as e:
+                    logger.warning(f"Reconnect attempt {attempt + 1} for @{self.username} failed: {e}")
+                    continue
+            
+            self.reconnects += 1
+            await self.send_to_websocket({
+                'type': 'gap',
+                'username': self.username,
+                'disconnected_at': str(disconnected_at),
+                'reconnected_at': str(timezone.now()),
+                'gap_seconds': round(time.monotonic() - started, 3),
+                'attempts': attempt + 1
+            })
+            return True
+        
+        logger.error(f"Giving up on @{self.username} after {self.max_reconnect_attempts} reconnect attempts")
+        await self.send_to_websocket({
+            'type': 'disconnection',
+            'status': 'reconnect_failed',
+            'username': self.username,
+            'reconnecting': False
+        })
+        await self.end_live_stream()
+        if self.on_give_up is not None:
+            # Let the manager drop us so the next subscriber starts a fresh connection
+            try:
+                await self.on_give_up(self.username, self)
+            except Exception as e:
+                logger.error(f"Failed to release dead connection for @{self.username}: {e}")
+        return False
+    
+    async def stop(self, end_stream=True):
+        """Stop the TikTok Live connection
+        
+        end_stream=False keeps the LiveStream active, for handing the connection to another worker.
+        """
+        self.stopping = True
+        was_reconnecting = self.reconnecting
+        if was_reconnecting and self.reconnect_task is not asyncio.current_task():
+            self.reconnect_task.cancel()
+        
         try:
+            if not self.is_connected and was_reconnecting and end_stream:
+                # Dropped and never came back; the stream still needs closing
+                await self.end_live_stream()
+            
             if self.is_connected:
                 await self.client.disconnect()
                 logger.info(f"Disconnected from @{self.username}")
                 self.is_connected = False
                 
                 # Mark stream as ended
-                await self.end_live_stream()
+                if end_stream:
+                    await self.end_live_stream()
+                else:
+                    await self.flush_interactions()
         except Exception as e:
             logger.error(f"Disconnect error: {e}")
 
     async def end_live_stream(self):
-        """Mark the live stream as ended"""
-        # Skip database operations that are causing errors
+        """Flush pending interactions and mark the live stream as ended"""
+        await self.flush_interactions()
+        
+        try:
+            await self.context.end_stream()
+        except Exception as e:
+            logger.error(f"Failed to end live stream: {e}")
         logger.info(f"Live stream session ended for @{self.username}")
     
     async def process_tts_comment(self, username, comment):
-        """Process comment for TTS if enabled"""
+        """Queue a comment for TTS for every user listening to this streamer
+        
+        Synthesis runs on the TTS pool; results reach the WebSocket when they are ready.
+        """
+        from .tts_queue import tts_queue
+        from .tts_listeners import tts_listeners
+        
         try:
-            @sync_to_async
-            def process_tts_sync():
-                from .models import TTSSettings, TTSLog
-                from .piper_tts import piper_tts
-                import os
-                import hashlib
-                from django.conf import settings
+            for tts_settings in await tts_listeners.get(self.username):
+                # Check comment type filters
+                if tts_settings.comment_type == 'dot' and not comment.startswith('.'):
+                    continue
+                elif tts_settings.comment_type == 'slash' and not comment.startswith('/'):
+                    continue
+                elif tts_settings.comment_type == 'command' and not comment.startswith(tts_settings.special_command):
+                    continue
                 
-                results = []
+                # Filter out unwanted content
+                if tts_settings.filter_mentions and '@' in comment:
+                    continue
+                if tts_settings.filter_commands and comment.startswith('!'):
+                    continue
                 
-                for tts_settings in TTSSettings.objects.filter(is_enabled=True):
-                    try:
-                        logger.info(f"Processing TTS for user {tts_settings.user.username}: {username} -> {comment}")
-                        
-                        # Check comment type filters
-                        if tts_settings.comment_type == 'dot' and not comment.startswith('.'):
-                            continue
-                        elif tts_settings.comment_type == 'slash' and not comment.startswith('/'):
-                            continue
-                        elif tts_settings.comment_type == 'command' and not comment.startswith(tts_settings.special_command):
-                            continue
-                        
-                        # Filter out unwanted content
-                        if tts_settings.filter_mentions and '@' in comment:
-                            continue
-                        if tts_settings.filter_commands and comment.startswith('!'):
-                            continue
-                    
-                        # Check length limit
-                        processed_comment = comment
-                        if len(processed_comment) > tts_settings.max_comment_length:
-                            processed_comment = processed_comment[:tts_settings.max_comment_length]
-                        
-                        # Generate TTS
-                        media_dir = os.path.join(settings.BASE_DIR, 'media', 'tts')
-                        os.makedirs(media_dir, exist_ok=True)
-                        
-                        text_hash = hashlib.md5(processed_comment.encode()).hexdigest()[:8]
-                        audio_filename = f"tts_{tts_settings.user.id}_{text_hash}.wav"
-                        audio_path = os.path.join(media_dir, audio_filename)
-                        
-                        # Generate TTS audio if it doesn't exist
-                        if not os.path.exists(audio_path):
-                            success = piper_tts.text_to_speech(processed_comment, audio_path, "default", tts_settings.language)
-                            if not success:
-                                logger.error(f"TTS generation failed for: {processed_comment}")
-                                continue
-                            logger.info(f"Generated TTS audio: {audio_filename}")
-                    
-                        # Log TTS usage
-                        TTSLog.objects.create(
-                            user=tts_settings.user,
-                            tiktok_username=username,
-                            message=processed_comment
-                        )
-                        
-                        # Prepare result for WebSocket
-                        audio_url = f"/media/tts/{audio_filename}"
-                        results.append({
-                            'type': 'tts',
-                            'username': username,
-                            'text': processed_comment,
-                            'audio_url': audio_url,
-                            'language': tts_settings.language
-                        })
-                        
-                    except Exception as e:
-                        logger.error(f"TTS processing error for user {tts_settings.user.username}: {e}")
-                        continue
+                # Check length limit
+                processed_comment = comment[:tts_settings.max_comment_length]
                 
-                return results
-            
-            # Process TTS synchronously
-            tts_results = await process_tts_sync()
-            
-            # Send results to WebSocket
-            for result in tts_results:
-                logger.info(f"Sending TTS audio: {result['audio_url']}")
-                await self.send_to_websocket(result)
+                status = tts_queue.submit(tts_settings, username, processed_comment, self.send_to_websocket, streamer=self.username)
+                logger.debug(f"TTS for user {tts_settings.user_id}: {username} -> {processed_comment} ({status})")
         
         except Exception as e:
             logger.error(f"TTS processing error: {e}")
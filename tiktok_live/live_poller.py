@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import TikTokAccount
+
+logger = logging.getLogger(__name__)
+
+class LiveStatusPoller:
+    """Keeps TikTokAccount.is_live current by polling every registered account.
+
+    Accounts that streamed within ``idle_after`` days (or are live now) are
+    checked every cycle, most recently active first; the rest every
+    ``idle_every`` cycles. Checks go through the live-status service, so they
+    share its concurrency cap and cache. Flipped flags are written with one
+    UPDATE per direction. With ``autostart``, a monitored account that goes
+    live gets a connector held open until it goes offline again.
+    """
+
+    hold = 'live_poller'
+
+    def __init__(self, status=None, manager=None, interval=None, idle_every=None, idle_after=None, autostart=None):
+        self.status = status
+        self.manager = manager
+        self.interval = interval or getattr(settings, 'TIKTOK_LIVE_POLL_INTERVAL', 60)
+        self.idle_every = idle_every or getattr(settings, 'TIKTOK_LIVE_POLL_IDLE_EVERY', 5)
+        self.idle_after = idle_after or getattr(settings, 'TIKTOK_LIVE_POLL_IDLE_DAYS', 7)
+        self.autostart = autostart if autostart is not None else getattr(settings, 'TIKTOK_LIVE_POLL_AUTOSTART', False)
+        self.cycle = 0
+        self.started = set()
+        self.stats = {'cycles': 0, 'checked': 0, 'went_live': 0, 'went_offline': 0, 'errors': 0, 'autostarted': 0}
+
+    def _accounts(self, include_idle):
+        accounts = TikTokAccount.objects.annotate(last_stream=Max('livestream__started_at'))
+        if not include_idle:
+            cutoff = timezone.now() - timedelta(days=self.idle_after)
+            accounts = accounts.filter(Q(is_live=True) | Q(last_stream__gte=cutoff))
+        rows = accounts.order_by('-is_live', '-last_stream', 'id').values_list('id', 'username', 'is_live', 'enable_monitoring')
+        return list(rows)
+
+    def _write(self, live_ids, offline_ids):
+        if live_ids:
+            TikTokAccount.objects.filter(id__in=live_ids).update(is_live=True)
+        if offline_ids:
+            TikTokAccount.objects.filter(id__in=offline_ids).update(is_live=False)
+
+    async def poll_once(self):
+        """Run one polling cycle and return what changed"""
+        from .live_status import live_status
+
+        status = self.status or live_status
+        include_idle = self.cycle % self.idle_every == 0
+        self.cycle += 1
+        rows = await sync_to_async(self._accounts)(include_idle)
+
+        # A result from an on-demand check during this interval is as good as a fresh one
+        results = await status.check_many([username for _, username, _, _ in rows], max_age=self.interval / 2)
+        by_username = {result['username']: result for result in results}
+
+        live_ids, offline_ids, went_live, went_offline, monitored_live = [], [], [], [], []
+        for account_id, username, was_live, monitored in rows:
+            result = by_username.get(username.lower().strip('@'))
+            if result is None or result['source'] == 'error':
+                self.stats['errors'] += result is not None
+                continue
+            if result['is_live'] and monitored:
+                monitored_live.append(username)
+            if result['is_live'] and not was_live:
+                live_ids.append(account_id)
+                went_live.append(username)
+            elif not result['is_live'] and was_live:
+                offline_ids.append(account_id)
+                went_offline.append(username)
+
+        await sync_to_async(self._write)(live_ids, offline_ids)
+        self.stats['cycles'] += 1
+        self.stats['checked'] += len(rows)
+        self.stats['went_live'] += len(went_live)
+        self.stats['went_offline'] += len(went_offline)
+        if live_ids or offline_ids:
+            logger.info(f"Live poll: {len(went_live)} went live, {len(went_offline)} went offline ({len(rows)} checked)")
+
+        if self.autostart:
+            await self._autostart(monitored_live, went_offline)
+
+        return {
+            'checked': len(rows),
+            'idle_included': include_idle,
+            'went_live': went_live,
+            'went_offline': went_offline
+        }
+
+    async def _autostart(self, monitored_live, went_offline):
+        from .connection_manager import connection_manager
+
+        manager = self.manager or connection_manager
+        for username in monitored_live:
+            if username in self.started:
+                continue
+            try:
+                await manager.get_or_create_connection(username, hold=self.hold)
+                self.started.add(username)
+                self.stats['autostarted'] += 1
+            except Exception as e:
+                logger.error(f"Failed to start monitoring @{username}: {e}")
+        for username in went_offline:
+            if username in self.started:
+                self.started.discard(username)
+                await manager.release_hold(username, self.hold)
+
+    async def run(self):
+        """Poll forever, one cycle every ``interval`` seconds"""
+        logger.info(f"Live status poller started (every {self.interval}s, autostart={self.autostart})")
+        while True:
+            started = asyncio.get_running_loop().time()
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Live poll failed: {e}")
+            elapsed = asyncio.get_running_loop().time() - started
+            await asyncio.sleep(max(self.interval - elapsed, 1))
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+from django.conf import settings
+from TikTokLive import TikTokLiveClient
+from TikTokLive.client.errors import UserNotFoundError, UserOfflineError
+
+logger = logging.getLogger(__name__)
+
+def clean_username(username):
+    return username.strip().lstrip('@').lower()
+
+class LiveStatusService:
+    """Answers "is this user live" without opening a stream connection.
+
+    A username this worker is already connected to is answered from its
+    connector. Otherwise one lightweight room-status request is made on a
+    shared web client. Results are cached for ``ttl`` seconds, concurrent
+    checks for the same username share one request, and at most
+    ``concurrency`` requests run at once.
+    """
+
+    def __init__(self, ttl=None, timeout=None, concurrency=None, client_factory=TikTokLiveClient):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'TIKTOK_LIVE_STATUS_TTL', 30)
+        self.timeout = timeout or getattr(settings, 'TIKTOK_LIVE_STATUS_TIMEOUT', 8)
+        self.concurrency = concurrency or getattr(settings, 'TIKTOK_LIVE_STATUS_CONCURRENCY', 10)
+        self.client_factory = client_factory
+        self.results: Dict[str, dict] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'connected': 0, 'errors': 0}
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_loop(self):
+        # The web client and semaphore belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client = None
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self.pending = {}
+            self._loop = loop
+
+    def _result(self, username, is_live, source, error=None):
+        result = {
+            'username': username,
+            'is_live': is_live,
+            'status': 'LIVE' if is_live else 'OFFLINE',
+            'source': source,
+            'checked_at': time.time()
+        }
+        if error:
+            result['error'] = error
+        return result
+
+    async def check(self, username, max_age=None):
+        """Return the live status of a username as a dict with is_live, status and source"""
+        from .connection_manager import connection_manager
+
+        username = clean_username(username)
+        self._ensure_loop()
+
+        connector = connection_manager.active_connections.get(username)
+        if connector is not None and connector.is_connected:
+            self.stats['connected'] += 1
+            return self._result(username, True, 'connection')
+
+        max_age = self.ttl if max_age is None else max_age
+        cached = self.results.get(username)
+        if cached is not None and time.time() - cached['checked_at'] < max_age:
+            self.stats['hits'] += 1
+            return {**cached, 'source': 'cache'}
+
+        future = self.pending.get(username)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        self.stats['misses'] += 1
+        future = asyncio.ensure_future(self._fetch(username, connector))
+        self.pending[username] = future
+        future.add_done_callback(lambda done: self.pending.pop(username, None) if self.pending.get(username) is done else None)
+        return await asyncio.shield(future)
+
+    async def check_many(self, usernames, max_age=None):
+        """Check several usernames concurrently; returns results in the same order, duplicates removed"""
+        unique = list(dict.fromkeys(clean_username(username) for username in usernames if username.strip('@ ')))
+        return await asyncio.gather(*(self.check(username, max_age) for username in unique))
+
+    async def _fetch(self, username, connector=None):
+        # A connector that is reconnecting already has a web session for this user
+        client = connector.client if connector is not None else self._shared_client(username)
+        error = None
+        try:
+            async with self._semaphore:
+                is_live = await asyncio.wait_for(client.is_live(username), timeout=self.timeout)
+        except (UserOfflineError, UserNotFoundError) as e:
+            is_live = False
+            error = type(e).__name__
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout checking @{username} - assuming OFFLINE")
+            self.stats['errors'] += 1
+            return self._result(username, False, 'error', 'Connection timeout')
+        except Exception as e:
+            logger.error(f"Error checking @{username}: {type(e).__name__}: {e}")
+            self.stats['errors'] += 1
+            return self._result(username, False, 'error', str(e))
+
+        result = self._result(username, is_live, 'tiktok', error)
+        self.results[username] = result
+        logger.debug(f"Live status for @{username}: {result['status']}")
+        return result
+
+    def _shared_client(self, username):
+        if self._client is None:
+            self._client = self.client_factory(unique_id=username)
+        return self._client
+
+    def record(self, username, is_live):
+        """Store a status learned elsewhere, e.g. from a connector or a poller"""
+        username = clean_username(username)
+        self.results[username] = self._result(username, is_live, 'tiktok')
+
+    def invalidate(self, username):
+        self.results.pop(clean_username(username), None)
+
+    def metrics(self):
+        return {**self.stats, 'cached': len(self.results), 'in_flight': len(self.pending)}
+
+# Global instance
+live_status = LiveStatusService()
@@ -0,0 +1,871 @@
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class CountingConsumer:
+    """Stand-in WebSocket consumer that only counts what it receives"""
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.calls += 1
+        self.bytes += len(text_data.encode('utf-8')) if text_data is not None else len(bytes_data)
+
+
+def sample_gift_event(i):
+    return {
+        'type': 'gift',
+        'username': f'viewer_{i % 500}',
+        'gift_name': 'Rose',
+        'gift_value': 1,
+        'gift_count': 1,
+        'timestamp': '2025-11-17 21:29:00+00:00'
+    }
+
+
+class SlowStartConnector:
+    """Stand-in upstream client whose start() takes a while, like a real TikTok handshake"""
+    started = 0
+
+    def __init__(self, username):
+        self.username = username
+        self.is_connected = False
+        self.reconnecting = False
+
+    async def start(self):
+        SlowStartConnector.started += 1
+        await asyncio.sleep(0.05)
+        self.is_connected = True
+
+    async def stop(self, end_stream=True):
+        pass
+
+
+class FakeLiveClient:
+    """Stand-in TikTokLiveClient: start() fails a set number of times, drop() fires DisconnectEvent"""
+    failures = {}
+    live = set()
+    status_checks = 0
+
+    def __init__(self, unique_id):
+        self.unique_id = unique_id
+        self.handlers = {}
+
+    def on(self, event_type):
+        def decorator(handler):
+            self.handlers.setdefault(event_type, []).append(handler)
+            return handler
+        return decorator
+
+    async def start(self):
+        await asyncio.sleep(0.01)
+        if FakeLiveClient.failures.get(self.unique_id, 0) > 0:
+            FakeLiveClient.failures[self.unique_id] -= 1
+            raise Exception('User is offline')
+
+    async def is_live(self, unique_id=None):
+        FakeLiveClient.status_checks += 1
+        await asyncio.sleep(0.05)
+        return (unique_id or self.unique_id) in FakeLiveClient.live
+
+    def remove_all_listeners(self):
+        self.handlers = {}
+
+    async def disconnect(self, close_client=False):
+        await self.drop()
+
+    async def drop(self):
+        from TikTokLive.events import DisconnectEvent
+        for handler in self.handlers.get(DisconnectEvent, ()):
+            await handler(DisconnectEvent())
+
+
+class Command(BaseCommand):
+    help = 'Run micro-benchmarks for the live event pipeline'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+        fanout = subparsers.add_parser('fanout', help='Bytes and send calls per event for WebSocket fan-out')
+        fanout.add_argument('--subscribers', type=int, default=10)
+        fanout.add_argument('--events', type=int, default=5000)
+
+        scaling = subparsers.add_parser('layer-scaling', help='Fan-out through the shared channel layer to subscribers spread over several workers')
+        scaling.add_argument('--workers', default='1,2,4')
+        scaling.add_argument('--streamers', type=int, default=16)
+        scaling.add_argument('--subscribers', type=int, default=10)
+        scaling.add_argument('--events', type=int, default=2000)
+
+        storm = subparsers.add_parser('connect-storm', help='Upstream clients started under simultaneous connects')
+        storm.add_argument('--connects', type=int, default=100)
+        storm.add_argument('--usernames', type=int, default=1)
+
+        reconnect = subparsers.add_parser('reconnect', help='Supervised reconnects of dropped connectors against a fake client')
+        reconnect.add_argument('--connectors', type=int, default=50)
+        reconnect.add_argument('--failures', type=int, default=3, help='Failed attempts before each reconnect succeeds')
+        reconnect.add_argument('--limit', type=int, default=5)
+
+        status = subparsers.add_parser('live-status', help='Upstream requests for concurrent and repeated live-status checks')
+        status.add_argument('--checks', type=int, default=500)
+        status.add_argument('--usernames', type=int, default=20)
+        status.add_argument('--concurrency', type=int, default=5)
+
+        poller = subparsers.add_parser('live-poller', help='Live-status poll cycles over temporary accounts against a fake client')
+        poller.add_argument('--accounts', type=int, default=200)
+        poller.add_argument('--concurrency', type=int, default=10)
+
+        stats = subparsers.add_parser('stream-stats', help='Stats endpoint cost: counting StreamInteraction rows vs checkpointed counters')
+        stats.add_argument('--interactions', type=int, default=50000)
+        stats.add_argument('--reads', type=int, default=20)
+
+        ledger = subparsers.add_parser('points-ledger', help='Points writes per event vs the write-coalescing ledger')
+        ledger.add_argument('--events', type=int, default=5000)
+        ledger.add_argument('--viewers', type=int, default=200)
+
+        halving = subparsers.add_parser('points-halving', help='Per-row saves vs set-based halving and reset of large ledgers')
+        halving.add_argument('--rows', default='10000,100000,1000000')
+        halving.add_argument('--sample', type=int, default=2000, help='Rows saved one by one to estimate the old per-row path')
+        halving.add_argument('--percentage', type=int, default=50)
+
+        grid = subparsers.add_parser('points-grid', help='Deep OFFSET pages vs keyset pages of a large points ledger')
+        grid.add_argument('--rows', type=int, default=200000)
+        grid.add_argument('--page-size', type=int, default=40)
+        grid.add_argument('--pages', type=int, default=20, help='Deep pages timed for each method')
+
+        ranks = subparsers.add_parser('leaderboard', help='Rank lookups: in-memory skip list vs a COUNT query per lookup')
+        ranks.add_argument('--viewers', type=int, default=100000)
+        ranks.add_argument('--updates', type=int, default=50000)
+        ranks.add_argument('--lookups', type=int, default=200)
+
+        export = subparsers.add_parser('points-export', help='Streaming transaction export: throughput and peak memory as rows grow')
+        export.add_argument('--rows', default='100000,1000000')
+        export.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        export.add_argument('--gzip', action='store_true')
+
+        engines = subparsers.add_parser('tts-engines', help='Per-utterance latency: warm Piper pool vs a process per call')
+        engines.add_argument('--voice', default='default')
+        engines.add_argument('--language', default='tr-TR')
+        engines.add_argument('--utterances', type=int, default=20)
+        engines.add_argument('--text', default='Merhaba, yayına hoş geldin! Bugün neler yapıyoruz?')
+
+    def handle(self, *args, **options):
+        handler = getattr(self, f"bench_{options['scenario'].replace('-', '_')}")
+        handler(**options)
+
+    def report(self, title, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for label, value in rows:
+            self.stdout.write(f"  {label:<32} {value}")
+
+    def bench_fanout(self, subscribers, events, **options):
+        from tiktok_live.connection_manager import GlobalConnectionManager
+
+        async def run_pipeline():
+            manager = GlobalConnectionManager()
+            consumers = [CountingConsumer() for _ in range(subscribers)]
+            manager.subscribers['benchmark'] = set(consumers)
+
+            started = time.perf_counter()
+            for i in range(events):
+                await manager.broadcast_to_subscribers('benchmark', sample_gift_event(i))
+            elapsed = time.perf_counter() - started
+            return manager.stats, consumers, elapsed
+
+        async def run_legacy():
+            # Previous behaviour: send_json per subscriber, a direct send and a group send,
+            # each serializing the event on its own
+            consumers = [CountingConsumer() for _ in range(subscribers)]
+            serializations = 0
+
+            started = time.perf_counter()
+            for i in range(events):
+                data = sample_gift_event(i)
+                for consumer in consumers:
+                    await consumer.send(text_data=json.dumps(data))
+                    serializations += 1
+                await consumers[0].send(text_data=json.dumps(data))
+                serializations += 1
+                for consumer in consumers:
+                    await consumer.send(text_data=json.dumps(data))
+                    serializations += 1
+            elapsed = time.perf_counter() - started
+            return serializations, consumers, elapsed
+
+        stats, consumers, elapsed = asyncio.run(run_pipeline())
+        calls = sum(c.calls for c in consumers)
+        sent_bytes = sum(c.bytes for c in consumers)
+        self.report(f"Fan-out pipeline ({subscribers} subscribers, {events} events)", [
+            ('serializations / event', f"{stats['serializations'] / events:.2f}"),
+            ('send calls / event', f"{calls / events:.2f}"),
+            ('bytes / event', f"{sent_bytes / events:.1f}"),
+            ('events / second', f"{events / elapsed:,.0f}"),
+        ])
+
+        serializations, consumers, elapsed = asyncio.run(run_legacy())
+        calls = sum(c.calls for c in consumers)
+        sent_bytes = sum(c.bytes for c in consumers)
+        self.report("Legacy triple delivery", [
+            ('serializations / event', f"{serializations / events:.2f}"),
+            ('send calls / event', f"{calls / events:.2f}"),
+            ('bytes / event', f"{sent_bytes / events:.1f}"),
+            ('events / second', f"{events / elapsed:,.0f}"),
+        ])
+
+    def bench_layer_scaling(self, workers, streamers, subscribers, events, **options):
+        """Events published by the connection manager through the configured channel layer and
+        received by one layer instance per worker, each holding its share of the subscribers
+
+        An in-process layer is not shared between workers, so LocalBrokerChannelLayer stands in
+        for Redis with TIKTOK_CHANNEL_SHARDS shards unless channels_redis is configured. All
+        workers run in this process, so the rate shows the layer's overhead, not CPU scaling.
+        """
+        from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+        from tiktok_live.channel_layers import LocalBrokerChannelLayer, is_shared_layer, live_group_name
+        from tiktok_live.connection_manager import GlobalConnectionManager
+
+        shards = getattr(settings, 'TIKTOK_CHANNEL_SHARDS', 4)
+
+        def make_layer():
+            layer = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+            if not is_shared_layer(layer):
+                layer = LocalBrokerChannelLayer(broker='benchmark', shards=shards, capacity=events)
+            return layer
+
+        names = [f'streamer_{i}' for i in range(streamers)]
+        expected = events * subscribers
+
+        async def receive(layer, channel, consumer, counter):
+            while True:
+                message = await layer.receive(channel)
+                await consumer.send(text_data=message['text'])
+                counter['received'] += 1
+                if counter['received'] == expected:
+                    counter['done'].set()
+
+        async def run(count):
+            publisher = GlobalConnectionManager()
+            publisher._channel_layer = make_layer()
+            layers = [make_layer() for _ in range(count)]
+            counter = {'received': 0, 'done': asyncio.Event()}
+            receivers = []
+            for name in names:
+                for i in range(subscribers):
+                    # Subscribers of one streamer are spread over the workers
+                    layer = layers[i % count]
+                    channel = await layer.new_channel()
+                    await layer.group_add(live_group_name(name), channel)
+                    receivers.append(asyncio.create_task(receive(layer, channel, CountingConsumer(), counter)))
+
+            started = time.perf_counter()
+            for i in range(events):
+                await publisher.broadcast_to_subscribers(names[i % streamers], sample_gift_event(i))
+            try:
+                await asyncio.wait_for(counter['done'].wait(), timeout=30)
+            except asyncio.TimeoutError:
+                pass
+            elapsed = time.perf_counter() - started
+
+            for task in receivers:
+                task.cancel()
+            await asyncio.gather(*receivers, return_exceptions=True)
+            layer = publisher.channel_layer
+            spread = [len(shard) for shard in layer.state.shards] if isinstance(layer, LocalBrokerChannelLayer) else None
+            await layer.flush()
+            return counter['received'], publisher.stats['sends'], spread, elapsed, type(layer).__name__
+
+        rows = []
+        for count in [int(w) for w in workers.split(',')]:
+            received, sends, spread, elapsed, backend = asyncio.run(run(count))
+            rows.append((f'{count} worker(s)', f'{received / elapsed:,.0f} deliveries/s, {received}/{expected} delivered, '
+                                               f'{sends / events:.2f} group_send/event'))
+            if received != expected:
+                raise CommandError(f"{expected - received} deliveries lost with {count} worker(s)")
+
+        rows.append(('layer', backend))
+        if spread is not None:
+            rows.append(('groups per shard', ' / '.join(str(n) for n in spread)))
+        self.report(f"Shared layer fan-out ({streamers} streamers, {subscribers} subscribers, {events} events)", rows)
+
+    def bench_connect_storm(self, connects, usernames, **options):
+        from tiktok_live.connection_manager import GlobalConnectionManager
+        from tiktok_live.connector_leases import ConnectorLeases, LocalLeaseBackend
+
+        async def run():
+            SlowStartConnector.started = 0
+            manager = GlobalConnectionManager(ConnectorLeases(LocalLeaseBackend()), connector_factory=SlowStartConnector)
+            consumers = [CountingConsumer() for _ in range(connects)]
+
+            started = time.perf_counter()
+            connections = await asyncio.gather(*(
+                manager.get_or_create_connection(f'streamer_{i % usernames}', consumer)
+                for i, consumer in enumerate(consumers)
+            ))
+            elapsed = time.perf_counter() - started
+
+            references = sum(manager.reference_count(f'streamer_{i}') for i in range(usernames))
+            for i, consumer in enumerate(consumers):
+                await manager.remove_subscriber(f'streamer_{i % usernames}', consumer)
+            return connections, references, len(manager.active_connections), elapsed
+
+        connections, references, remaining, elapsed = asyncio.run(run())
+        self.report(f"Connect storm ({connects} simultaneous connects, {usernames} username(s))", [
+            ('upstream clients started', SlowStartConnector.started),
+            ('distinct connections returned', len({id(c) for c in connections})),
+            ('references held', references),
+            ('connections after disconnect', remaining),
+            ('elapsed', f"{elapsed * 1000:.1f} ms"),
+        ])
+        if SlowStartConnector.started != usernames:
+            raise CommandError(f"Expected {usernames} upstream client(s), started {SlowStartConnector.started}")
+
+    def bench_reconnect(self, connectors, failures, limit, **options):
+        from tiktok_live.connection_manager import connection_manager
+        from tiktok_live.live_connector import TikTokLiveConnector
+        from tiktok_live.reconnect import Backoff, ReconnectLimiter
+
+        async def run():
+            limiter = ReconnectLimiter(limit)
+            backoff = Backoff(base=0.01, cap=0.2)
+            recorders = {}
+            instances = []
+            for i in range(connectors):
+                username = f'streamer_{i}'
+                connector = TikTokLiveConnector(username, client_factory=FakeLiveClient, backoff=backoff, limiter=limiter)
+                await connector.start()
+                recorders[username] = CountingConsumer()
+                connection_manager.subscribers[username] = {recorders[username]}
+                instances.append(connector)
+
+            FakeLiveClient.failures = {c.username: failures for c in instances}
+            started = time.perf_counter()
+            await asyncio.gather(*(c.client.drop() for c in instances))
+            recovered = await asyncio.gather(*(c.reconnect_task for c in instances))
+            elapsed = time.perf_counter() - started
+
+            for connector in instances:
+                connection_manager.subscribers.pop(connector.username, None)
+            return recovered, limiter.peak, elapsed
+
+        recovered, peak, elapsed = asyncio.run(run())
+        self.report(f"Reconnect ({connectors} dropped connectors, {failures} failures each, cap {limit})", [
+            ('recovered', f"{sum(recovered)}/{connectors}"),
+            ('peak concurrent reconnects', peak),
+            ('time to recover all', f"{elapsed * 1000:.0f} ms"),
+        ])
+        if peak > limit:
+            raise CommandError(f"Reconnect cap exceeded: {peak} > {limit}")
+
+    def bench_live_status(self, checks, usernames, concurrency, **options):
+        from tiktok_live.live_status import LiveStatusService
+
+        FakeLiveClient.live = {f'streamer_{i}' for i in range(0, usernames, 2)}
+        FakeLiveClient.status_checks = 0
+        service = LiveStatusService(ttl=60, concurrency=concurrency, client_factory=FakeLiveClient)
+        names = [f'streamer_{i % usernames}' for i in range(checks)]
+
+        async def run():
+            started = time.perf_counter()
+            first = await asyncio.gather(*(service.check(name) for name in names))
+            cold = time.perf_counter() - started
+            started = time.perf_counter()
+            await service.check_many(names)
+            warm = time.perf_counter() - started
+            return first, cold, warm
+
+        first, cold, warm = asyncio.run(run())
+        live = len({result['username'] for result in first if result['is_live']})
+        self.report(f"Live status ({checks} checks over {usernames} username(s), {concurrency} concurrent requests)", [
+            ('upstream requests', FakeLiveClient.status_checks),
+            ('coalesced checks', service.stats['coalesced']),
+            ('cache hits (second round)', service.stats['hits']),
+            ('live usernames', f"{live}/{usernames}"),
+            ('cold round', f"{cold * 1000:.1f} ms"),
+            ('cached batch', f"{warm * 1000:.1f} ms"),
+        ])
+        if FakeLiveClient.status_checks != usernames or live != len(FakeLiveClient.live):
+            raise CommandError(f"Expected {usernames} upstream request(s), made {FakeLiveClient.status_checks}")
+
+    def bench_live_poller(self, accounts, concurrency, **options):
+        from django.contrib.auth.models import User
+        from tiktok_live.live_poller import LiveStatusPoller
+        from tiktok_live.live_status import LiveStatusService
+        from tiktok_live.models import TikTokAccount
+
+        class HoldRecorder:
+            def __init__(self):
+                self.holds = set()
+
+            async def get_or_create_connection(self, username, consumer=None, hold=None):
+                self.holds.add(username)
+
+            async def release_hold(self, username, hold):
+                self.holds.discard(username)
+
+        owner = User.objects.create(username='bench_live_poller')
+        try:
+            TikTokAccount.objects.bulk_create([
+                TikTokAccount(user=owner, username=f'bench_poll_{i}', enable_monitoring=i % 4 != 0)
+                for i in range(accounts)
+            ])
+            usernames = [f'bench_poll_{i}' for i in range(accounts)]
+            manager = HoldRecorder()
+            FakeLiveClient.status_checks = 0
+
+            def cycle(live):
+                FakeLiveClient.live = set(live)
+                poller.status.results.clear()
+                started = time.perf_counter()
+                summary = asyncio.run(poller.poll_once())
+                return summary, time.perf_counter() - started
+
+            poller = LiveStatusPoller(
+                status=LiveStatusService(ttl=0, concurrency=concurrency, client_factory=FakeLiveClient),
+                manager=manager, interval=60, idle_every=1, autostart=True
+            )
+            first, first_elapsed = cycle(usernames[::2])
+            second, second_elapsed = cycle(usernames[::3])
+            flagged = TikTokAccount.objects.filter(user=owner, is_live=True).count()
+            expected_holds = {name for i, name in enumerate(usernames) if i % 4 != 0 and name in FakeLiveClient.live}
+        finally:
+            owner.delete()
+
+        self.report(f"Live poller ({accounts} accounts, {concurrency} concurrent requests)", [
+            ('upstream requests', FakeLiveClient.status_checks),
+            ('cycle 1: went live', len(first['went_live'])),
+            ('cycle 1 elapsed', f"{first_elapsed * 1000:.1f} ms"),
+            ('cycle 2: went live / offline', f"{len(second['went_live'])} / {len(second['went_offline'])}"),
+            ('cycle 2 elapsed', f"{second_elapsed * 1000:.1f} ms"),
+            ('accounts flagged live', flagged),
+            ('connectors held', len(manager.holds)),
+        ])
+        if flagged != len(FakeLiveClient.live) or manager.holds != expected_holds:
+            raise CommandError(f"Expected {len(FakeLiveClient.live)} live account(s) and {len(expected_holds)} held connector(s)")
+
+    def bench_stream_stats(self, interactions, reads, **options):
+        from django.contrib.auth.models import User
+        from django.db.models import Count, Sum
+        from tiktok_live.models import LiveStream, StreamInteraction, TikTokAccount
+        from tiktok_live.stream_stats import StreamStats
+
+        types = ['comment', 'gift', 'follow', 'share', 'join']
+        owner = User.objects.create(username='bench_stream_stats')
+        try:
+            account = TikTokAccount.objects.create(user=owner, username='bench_stream_stats')
+            stream = LiveStream.objects.create(account=account, stream_id='bench_stream_stats')
+            stats = StreamStats(interval=3600)
+
+            async def record():
+                for i in range(interactions):
+                    gift = i % len(types) == 1
+                    stats.record(stream.id, types[i % len(types)], 2 if gift else 1, 5 if gift else 0)
+                await stats.close()
+
+            StreamInteraction.objects.bulk_create([
+                StreamInteraction(stream=stream, user=owner, interaction_type=types[i % len(types)], username=f'viewer_{i % 500}',
+                                  gift_count=2 if i % len(types) == 1 else 1, gift_value=5 if i % len(types) == 1 else 0)
+                for i in range(interactions)
+            ], batch_size=2000)
+            asyncio.run(record())
+
+            started = time.perf_counter()
+            for _ in range(reads):
+                scanned = {
+                    'total': StreamInteraction.objects.filter(stream=stream).count(),
+                    'comments': StreamInteraction.objects.filter(stream=stream, interaction_type='comment').count(),
+                    'gifts': StreamInteraction.objects.filter(stream=stream, interaction_type='gift').count(),
+                    'follows': StreamInteraction.objects.filter(stream=stream, interaction_type='follow').count(),
+                    'gift_count': sum(i.gift_count for i in StreamInteraction.objects.filter(stream=stream, interaction_type='gift')),
+                    'gift_value': sum(i.gift_value * i.gift_count for i in StreamInteraction.objects.filter(stream=stream, interaction_type='gift')),
+                }
+            scan = (time.perf_counter() - started) / reads
+
+            started = time.perf_counter()
+            for _ in range(reads):
+                counters = stats.snapshot(LiveStream.objects.get(id=stream.id))
+            snapshot = (time.perf_counter() - started) / reads
+        finally:
+            owner.delete()
+
+        self.report(f"Stream stats ({interactions} interactions, {reads} reads)", [
+            ('row scans per read', f"{scan * 1000:.2f} ms"),
+            ('counters per read', f"{snapshot * 1000:.2f} ms"),
+            ('speedup', f"{scan / snapshot:.0f}x"),
+        ])
+        expected = (scanned['total'], scanned['comments'], scanned['gifts'], scanned['gift_count'], scanned['follows'], scanned['gift_value'])
+        actual = (counters['total_interactions'], counters['total_comments'], counters['total_gifts'], counters['total_gift_count'],
+                  counters['total_follows'], counters['total_gift_value'])
+        if expected != actual:
+            raise CommandError(f"Counters {actual} do not match the scanned totals {expected}")
+
+    def bench_points_ledger(self, events, viewers, **options):
+        from django.contrib.auth.models import User
+        from tiktok_live.models import PointsSettings, PointsTransaction, UserPoints
+        from tiktok_live.points_ledger import PointsLedger, apply_level_ups, points_for
+
+        types = ['like', 'like', 'like', 'comment', 'gift', 'share', 'follow']
+        per_event = User.objects.create(username='bench_points_per_event')
+        coalesced = User.objects.create(username='bench_points_ledger')
+        try:
+            points_settings = PointsSettings.objects.create(user=coalesced, points_per_like=2, level_up_threshold=250)
+            sample = [(f'viewer_{i % viewers}', types[i % len(types)]) for i in range(events)]
+
+            async def award_each():
+                # What award_points did before the ledger: a read, a save and an insert per event
+                for username, transaction_type in sample:
+                    row, _ = await UserPoints.objects.aget_or_create(user_id=per_event.id, tiktok_username=username)
+                    points = points_for(points_settings, transaction_type)
+                    row.points_total += points
+                    row.points_level, row.level, _ = apply_level_ups(row.points_level + points, row.level, 250)
+                    await row.asave()
+                    await PointsTransaction.objects.acreate(user_points=row, transaction_type=transaction_type, points_change=points)
+
+            level_ups = []
+
+            async def on_level_up(username, level, points):
+                level_ups.append(username)
+
+            async def award_ledger():
+                ledger = PointsLedger(interval=3600)
+                for username, transaction_type in sample:
+                    ledger.record(coalesced.id, username, transaction_type, points_for(points_settings, transaction_type),
+                                  on_level_up=on_level_up)
+                await ledger.close()
+
+            started = time.perf_counter()
+            asyncio.run(award_each())
+            each = time.perf_counter() - started
+
+            started = time.perf_counter()
+            asyncio.run(award_ledger())
+            ledger = time.perf_counter() - started
+
+            expected = {
+                row['tiktok_username']: (row['points_total'], row['points_level'], row['level'])
+                for row in UserPoints.objects.filter(user=per_event).values('tiktok_username', 'points_total', 'points_level', 'level')
+            }
+            actual = {
+                row['tiktok_username']: (row['points_total'], row['points_level'], row['level'])
+                for row in UserPoints.objects.filter(user=coalesced).values('tiktok_username', 'points_total', 'points_level', 'level')
+            }
+            transactions = PointsTransaction.objects.filter(user_points__user=coalesced).count()
+        finally:
+            per_event.delete()
+            coalesced.delete()
+
+        self.report(f"Points ledger ({events} events, {viewers} viewers)", [
+            ('per event', f"{each * 1000:.0f} ms"),
+            ('ledger', f"{ledger * 1000:.0f} ms"),
+            ('speedup', f"{each / ledger:.0f}x"),
+            ('transactions', f"{events} -> {transactions}"),
+            ('level ups', len(level_ups)),
+        ])
+        if expected != actual:
+            raise CommandError('Ledger totals or levels differ from per-event awarding')
+        if len(level_ups) != sum(1 for _, _, level in actual.values() if level > 1):
+            raise CommandError('Level-up announcements do not match the levelled-up viewers')
+
+    def bench_points_halving(self, rows, sample, percentage, **options):
+        from django.contrib.auth.models import User
+        from django.db.models import Sum
+        from tiktok_live.models import PointsTransaction, UserPoints
+        from tiktok_live.points_operations import PointsOperations
+
+        operations = PointsOperations()
+        results = []
+        for size in [int(n) for n in rows.split(',')]:
+            owner = User.objects.create(username=f'bench_points_halving_{size}')
+            try:
+                UserPoints.objects.bulk_create([
+                    UserPoints(user=owner, tiktok_username=f'viewer_{i}', points_total=i % 1000, points_level=i % 100)
+                    for i in range(size)
+                ], batch_size=5000)
+                PointsTransaction.objects.bulk_create([
+                    PointsTransaction(user_points_id=row_id, transaction_type='like', points_change=1)
+                    for row_id in UserPoints.objects.filter(user=owner).values_list('id', flat=True).iterator(chunk_size=5000)
+                ], batch_size=5000)
+
+                # The old view: load every row and save() it; timed on a sample and scaled up
+                started = time.perf_counter()
+                for row in UserPoints.objects.filter(user=owner).order_by('id')[:sample]:
+                    row.points_total = int(row.points_total * (100 - percentage) / 100)
+                    row.points_level = int(row.points_level * (100 - percentage) / 100)
+                    row.save()
+                per_row = (time.perf_counter() - started) / min(sample, size) * size
+
+                # Undo the sample so the set-based pass starts from the same ledger
+                for row in UserPoints.objects.filter(user=owner).order_by('id')[:sample]:
+                    index = int(row.tiktok_username.split('_')[1])
+                    UserPoints.objects.filter(id=row.id).update(points_total=index % 1000, points_level=index % 100)
+
+                started = time.perf_counter()
+                operations.halve(owner, percentage)
+                halve = time.perf_counter() - started
+
+                expected = sum((i % 1000) * (100 - percentage) // 100 for i in range(size))
+                actual = UserPoints.objects.filter(user=owner).aggregate(total=Sum('points_total'))['total']
+                if actual != expected:
+                    raise CommandError(f"Halving {size} rows left {actual} points, expected {expected}")
+
+                started = time.perf_counter()
+                record = operations.reset(owner, 'all')
+                reset = time.perf_counter() - started
+                if record.affected_users != size or record.deleted_transactions != size:
+                    raise CommandError(f"Reset of {size} rows removed {record.affected_users} viewers and {record.deleted_transactions} transactions")
+            finally:
+                UserPoints.objects.filter(user=owner).delete()
+                owner.delete()
+            results.append((size, per_row, halve, reset))
+
+        self.report(f"Points halving ({percentage}%, per-row path estimated from {sample} saves)", [
+            (f"{size} rows", f"per-row ~{per_row:.1f} s, set-based {halve * 1000:.0f} ms ({per_row / halve:.0f}x), reset all {reset * 1000:.0f} ms")
+            for size, per_row, halve, reset in results
+        ])
+
+    def bench_points_grid(self, rows, page_size, pages, **options):
+        from django.contrib.auth.models import User
+        from django.db import connection
+        from tiktok_live.models import UserPoints
+        from tiktok_live.points_grid import PointsGrid
+
+        owner = User.objects.create(username='bench_points_grid')
+        try:
+            UserPoints.objects.bulk_create([
+                # Few distinct point values, so most pages end inside a run of ties
+                UserPoints(user=owner, tiktok_username=f'viewer_{i:07d}', points_total=i % 97, points_level=i % 13)
+                for i in range(rows)
+            ], batch_size=5000)
+            with connection.cursor() as cursor:
+                if connection.vendor == 'sqlite':
+                    cursor.execute('ANALYZE')
+                elif connection.vendor == 'postgresql':
+                    cursor.execute(f'ANALYZE {UserPoints._meta.db_table}')
+            grid = PointsGrid(page_size=page_size, max_page_size=page_size)
+
+            # Walking every page must visit each row once, in the same order as one ordered scan
+            expected = list(UserPoints.objects.filter(user=owner).order_by('-points_total', '-id').values_list('id', flat=True))
+            walked, cursors, cursor = [], [], None
+            while True:
+                page = grid.page(owner.id, cursor=cursor)
+                walked.extend(row.id for row in page['rows'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+                cursors.append(cursor)
+            if walked != expected:
+                raise CommandError('Keyset pages do not match the ordered ledger')
+
+            deep = range(len(cursors) - pages, len(cursors))
+            ordered = UserPoints.objects.filter(user=owner).order_by('-points_total', '-id')
+            started = time.perf_counter()
+            for index in deep:
+                list(ordered[(index + 1) * page_size:(index + 2) * page_size])
+                ordered.count()
+            offset = (time.perf_counter() - started) / pages
+
+            started = time.perf_counter()
+            for index in deep:
+                grid.page(owner.id, cursor=cursors[index])
+            keyset = (time.perf_counter() - started) / pages
+
+            started = time.perf_counter()
+            prefix = grid.page(owner.id, sort='username', order='asc', filters={'username': 'viewer_00012'})
+            search = time.perf_counter() - started
+            if prefix['total'] != min(100, max(rows - 1200, 0)):
+                raise CommandError(f"Prefix search counted {prefix['total']} rows")
+        finally:
+            UserPoints.objects.filter(user=owner).delete()
+            owner.delete()
+
+        self.report(f"Points grid ({rows} rows, last {pages} pages of {page_size})", [
+            ('offset + count per page', f"{offset * 1000:.2f} ms"),
+            ('keyset + cached count per page', f"{keyset * 1000:.2f} ms"),
+            ('speedup', f"{offset / keyset:.0f}x"),
+            ('prefix search', f"{search * 1000:.2f} ms"),
+        ])
+
+    def bench_leaderboard(self, viewers, updates, lookups, **options):
+        import random
+        from django.contrib.auth.models import User
+        from django.db.models import Q
+        from tiktok_live.leaderboard import Leaderboard, RankIndex
+        from tiktok_live.models import UserPoints
+
+        # Random updates against a sorted list as the reference ordering
+        index, scores = RankIndex(), {}
+        index.build((f'viewer_{i}', random.randrange(50)) for i in range(0, 300, 3))
+        scores.update(index.scores)
+        for _ in range(5000):
+            member = f'viewer_{random.randrange(300)}'
+            if random.random() < 0.1:
+                index.remove(member)
+                scores.pop(member, None)
+            else:
+                scores[member] = index.add(member, random.randrange(-20, 100))
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if [(member, score) for _, member, score in index.top(len(scores))] != expected:
+            raise CommandError('Skip list order differs from sorted scores')
+        if any(index.rank(member) != rank for rank, (member, _) in enumerate(expected, 1)):
+            raise CommandError('Skip list ranks differ from sorted positions')
+
+        owner = User.objects.create(username='bench_leaderboard')
+        try:
+            UserPoints.objects.bulk_create([
+                UserPoints(user=owner, tiktok_username=f'viewer_{i:07d}', points_total=random.randrange(100000))
+                for i in range(viewers)
+            ], batch_size=5000)
+            board = Leaderboard()
+            started = time.perf_counter()
+            asyncio.run(board.board(owner.id))
+            load = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(updates):
+                board.record(owner.id, f'viewer_{random.randrange(viewers):07d}', random.randrange(1, 50))
+            update = (time.perf_counter() - started) / updates
+
+            sample = [f'viewer_{random.randrange(viewers):07d}' for _ in range(lookups)]
+            started = time.perf_counter()
+            points = asyncio.run(board.board(owner.id)).points
+            memory_ranks = [points.rank(username) for username in sample]
+            memory = (time.perf_counter() - started) / lookups
+
+            # Write the board's scores back so the SQL ranks are over the same data
+            rows = UserPoints.objects.filter(user=owner)
+            for row in rows:
+                row.points_total = points.score(row.tiktok_username)
+            UserPoints.objects.bulk_update(rows, ['points_total'], batch_size=5000)
+
+            started = time.perf_counter()
+            sql_ranks = []
+            for username in sample:
+                score = UserPoints.objects.get(user=owner, tiktok_username=username).points_total
+                sql_ranks.append(UserPoints.objects.filter(user=owner).filter(
+                    Q(points_total__gt=score) | Q(points_total=score, tiktok_username__lt=username)
+                ).count() + 1)
+            sql = (time.perf_counter() - started) / lookups
+        finally:
+            UserPoints.objects.filter(user=owner).delete()
+            owner.delete()
+
+        self.report(f"Leaderboard ({viewers} viewers)", [
+            ('load from UserPoints', f"{load * 1000:.0f} ms"),
+            ('score update', f"{update * 1e6:.1f} us"),
+            ('rank lookup, skip list', f"{memory * 1e6:.1f} us"),
+            ('rank lookup, COUNT query', f"{sql * 1000:.2f} ms"),
+            ('speedup', f"{sql / memory:.0f}x"),
+        ])
+        if memory_ranks != sql_ranks:
+            raise CommandError('Skip list ranks differ from ranks counted in SQL')
+
+    def bench_points_export(self, rows, format, gzip, **options):
+        import io
+        import tracemalloc
+        from django.contrib.auth.models import User
+        from tiktok_live.models import PointsTransaction, UserPoints
+        from tiktok_live.points_export import PointsExport, TRANSACTION_FIELDS
+
+        exporter = PointsExport()
+        results = []
+        for size in [int(n) for n in rows.split(',')]:
+            source = User.objects.create(username=f'bench_points_export_{size}')
+            target = User.objects.create(username=f'bench_points_import_{size}')
+            try:
+                viewers = UserPoints.objects.bulk_create([
+                    UserPoints(user=source, tiktok_username=f'viewer_{i}') for i in range(min(size, 1000))
+                ])
+                PointsTransaction.objects.bulk_create(
+                    (PointsTransaction(user_points=viewers[i % len(viewers)], transaction_type='like', points_change=i % 7,
+                                       description=f'{i % 5} like event(s)') for i in range(size)),
+                    batch_size=5000
+                )
+
+                sink = io.BytesIO()
+                tracemalloc.start()
+                started = time.perf_counter()
+                for chunk in exporter.encode(exporter.transaction_rows(source.id), TRANSACTION_FIELDS, format, gzip):
+                    sink.write(chunk)
+                    sink.seek(0)
+                    sink.truncate()
+                export = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                # Round trip into another account to check nothing was lost on the way
+                UserPoints.objects.bulk_create([UserPoints(user=target, tiktok_username=viewer.tiktok_username) for viewer in viewers])
+                exported = io.BytesIO(b''.join(exporter.encode(exporter.transaction_rows(source.id), TRANSACTION_FIELDS, format, gzip)))
+                size_bytes = exported.getbuffer().nbytes
+                started = time.perf_counter()
+                counts = exporter.import_transactions(target, exporter.read(exported, format))
+                imported = time.perf_counter() - started
+                if counts['created'] != size:
+                    raise CommandError(f"Imported {counts['created']} of {size} transactions")
+            finally:
+                for owner in (source, target):
+                    PointsTransaction.objects.filter(user_points__user=owner).delete()
+                    UserPoints.objects.filter(user=owner).delete()
+                    owner.delete()
+            results.append((size, export, peak, size_bytes, imported))
+
+        self.report(f"Points export ({format}{', gzip' if gzip else ''})", [
+            (f"{size} rows", f"export {export:.1f} s ({size / export:,.0f} rows/s, peak {peak / 2 ** 20:.1f} MiB, "
+                             f"{size_bytes / 2 ** 20:.1f} MiB out), import {imported:.1f} s")
+            for size, export, peak, size_bytes, imported in results
+        ])
+        if len(results) > 1 and results[-1][2] > results[0][2] * 2:
+            raise CommandError('Export memory grew with the number of rows')
+
+    def bench_tts_engines(self, voice, language, utterances, text, **options):
+        import os
+        import subprocess
+        import sys
+        import tempfile
+        from tiktok_live.piper_tts import PiperEngine, PIPER_AVAILABLE
+
+        engine = PiperEngine(workers=1)
+        model_path = engine.model_for(voice, language)
+        if not PIPER_AVAILABLE:
+            raise CommandError("piper-tts is not installed (pip install piper-tts)")
+        if model_path is None:
+            raise CommandError(f"No Piper model for voice={voice} language={language} in {engine.models_dir}; "
+                               "put the .onnx next to its .onnx.json")
+
+        def summary(samples):
+            ordered = sorted(samples)
+            return (f"avg {sum(ordered) / len(ordered) * 1000:.0f} ms, "
+                    f"p95 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000:.0f} ms")
+
+        workdir = tempfile.mkdtemp()
+        phrases = [f"{text} {i}" for i in range(utterances)]
+
+        # Current path: a fresh process per utterance that loads the model every time
+        cold = []
+        for i, phrase in enumerate(phrases):
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, '-m', 'piper', '--model', model_path, '--output_file', os.path.join(workdir, f'cold_{i}.wav')],
+                input=phrase.encode('utf-8'), capture_output=True, check=True
+            )
+            cold.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        engine.text_to_speech(phrases[0], os.path.join(workdir, 'warmup.wav'), voice, language)
+        warmup = time.perf_counter() - started
+
+        warm = []
+        for i, phrase in enumerate(phrases):
+            started = time.perf_counter()
+            engine.text_to_speech(phrase, os.path.join(workdir, f'warm_{i}.wav'), voice, language)
+            warm.append(time.perf_counter() - started)
+        engine.shutdown()
+
+        self.report(f"TTS engines ({os.path.basename(model_path)}, {utterances} utterances)", [
+            ('process per call', summary(cold)),
+            ('warm pool first call', f"{warmup * 1000:.0f} ms"),
+            ('warm pool', summary(warm)),
+            ('speed-up', f"x{sum(cold) / sum(warm):.1f}"),
+        ])
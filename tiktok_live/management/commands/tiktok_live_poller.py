@@ -0,0 +1,22 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand
+from tiktok_live.live_poller import LiveStatusPoller
+
+
+class Command(BaseCommand):
+    help = 'Keep TikTokAccount.is_live up to date by polling TikTok in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single cycle over every account and exit')
+        parser.add_argument('--interval', type=int, help='Seconds between cycles (TIKTOK_LIVE_POLL_INTERVAL)')
+        parser.add_argument('--autostart', action='store_true', default=None,
+                            help='Start monitoring connectors for accounts that go live (needs a shared channel layer to reach the web workers)')
+
+    def handle(self, *args, **options):
+        poller = LiveStatusPoller(interval=options['interval'], autostart=options['autostart'])
+        if options['once']:
+            summary = asyncio.run(poller.poll_once())
+            self.stdout.write(json.dumps(summary))
+        else:
+            asyncio.run(poller.run())
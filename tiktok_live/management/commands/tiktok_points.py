@@ -0,0 +1,91 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from tiktok_live.points_operations import PointsOperations, RESET_TYPES
+from tiktok_live.points_export import points_export, parse_bound, FORMATS, LEDGER_FIELDS, TRANSACTION_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Halve, reset, export or import a streamer\'s points ledger'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        halve = subparsers.add_parser('halve', help='Reduce every viewer\'s points by a percentage, keeping levels')
+        halve.add_argument('username', help='Streamer account (Django username)')
+        halve.add_argument('--percentage', type=int, default=50)
+        halve.add_argument('--chunk', type=int, help='Rows per statement (TIKTOK_POINTS_OPERATION_CHUNK)')
+
+        reset = subparsers.add_parser('reset', help='Zero all points, or delete all viewers and their transactions')
+        reset.add_argument('username', help='Streamer account (Django username)')
+        reset.add_argument('--type', dest='reset_type', choices=list(RESET_TYPES), default='points_only')
+        reset.add_argument('--chunk', type=int, help='Rows per statement (TIKTOK_POINTS_OPERATION_CHUNK)')
+
+        export = subparsers.add_parser('export', help='Write the ledger or transactions to a CSV/NDJSON file')
+        export.add_argument('username', help='Streamer account (Django username)')
+        export.add_argument('path', help='Output file')
+        export.add_argument('--kind', choices=['ledger', 'transactions'], default='ledger')
+        export.add_argument('--format', choices=FORMATS, default='csv')
+        export.add_argument('--gzip', action='store_true')
+        export.add_argument('--since', help='YYYY-MM-DD or ISO datetime')
+        export.add_argument('--until', help='YYYY-MM-DD (inclusive) or ISO datetime')
+
+        load = subparsers.add_parser('import', help='Read an exported ledger or transactions file into an account')
+        load.add_argument('username', help='Streamer account (Django username)')
+        load.add_argument('path', help='CSV or NDJSON file, optionally gzipped')
+        load.add_argument('--kind', choices=['ledger', 'transactions'], default='ledger')
+        load.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        load.add_argument('--on-conflict', choices=['skip', 'add'], default='skip')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']}")
+
+        if options['action'] == 'export':
+            return self.export(user, options)
+        if options['action'] == 'import':
+            return self.load(user, options)
+
+        operations = PointsOperations(chunk_size=options['chunk'])
+        progress = lambda done, total: self.stdout.write(f"  {done}/{total} viewers")
+        if options['action'] == 'halve':
+            record = operations.halve(user, options['percentage'], progress=progress)
+            self.stdout.write(f"Reduced points by {record.percentage}% for {record.affected_users} viewer(s)")
+        else:
+            record = operations.reset(user, options['reset_type'], progress=progress)
+            self.stdout.write(
+                f"Reset ({record.get_reset_type_display()}) {record.affected_users} viewer(s), "
+                f"{record.deleted_transactions} transaction(s) deleted"
+            )
+
+    def export(self, user, options):
+        try:
+            since, until = parse_bound(options['since']), parse_bound(options['until'], end=True)
+        except ValueError:
+            raise CommandError('--since and --until must be YYYY-MM-DD dates or ISO datetimes')
+        if options['kind'] == 'ledger':
+            rows, fields = points_export.ledger_rows(user.id, since, until), LEDGER_FIELDS
+        else:
+            rows, fields = points_export.transaction_rows(user.id, since, until), TRANSACTION_FIELDS
+
+        written = 0
+        with open(options['path'], 'wb') as out:
+            for chunk in points_export.encode(rows, fields, options['format'], options['gzip']):
+                out.write(chunk)
+                written += len(chunk)
+        self.stdout.write(f"Wrote {written} bytes to {options['path']}")
+
+    def load(self, user, options):
+        name = options['path'].lower().removesuffix('.gz')
+        fmt = options['format'] or ('ndjson' if name.endswith('.ndjson') else 'csv')
+        try:
+            with open(options['path'], 'rb') as source:
+                rows = points_export.read(source, fmt)
+                if options['kind'] == 'ledger':
+                    counts = points_export.import_ledger(user, rows, options['on_conflict'])
+                else:
+                    counts = points_export.import_transactions(user, rows)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(counts))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from tiktok_live.interaction_rollups import interaction_rollups
+from tiktok_live.models import LiveStream
+
+
+class Command(BaseCommand):
+    help = 'Maintain per-minute and per-hour interaction rollups'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        compact = subparsers.add_parser('compact', help='Drop minute buckets of streams that ended long ago, keeping hour buckets')
+        compact.add_argument('--days', type=int, help='Keep minute buckets for streams that ended within this many days')
+
+        rebuild = subparsers.add_parser('rebuild', help='Recompute buckets from raw StreamInteraction rows')
+        rebuild.add_argument('stream_ids', nargs='*', type=int, help='Streams to rebuild (default: streams without rollups)')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'compact':
+            dropped = interaction_rollups.compact(options['days'])
+            self.stdout.write(f"Dropped {dropped} minute bucket(s)")
+            return
+
+        stream_ids = options['stream_ids'] or list(
+            LiveStream.objects.filter(interactionrollup__isnull=True, streaminteraction__isnull=False)
+            .values_list('id', flat=True).distinct()
+        )
+        for stream_id in stream_ids:
+            interaction_rollups.rebuild(stream_id)
+        self.stdout.write(f"Rebuilt rollups for {len(stream_ids)} stream(s)")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0010_connectorlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livestream',
+            name='total_interactions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livestream',
+            name='total_gift_value',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livestream',
+            name='total_follows',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livestream',
+            name='total_joins',
+            field=models.IntegerField(default=0),
+        ),
+    ]
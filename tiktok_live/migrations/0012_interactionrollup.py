@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0011_livestream_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, 'Minute'), (3600, 'Hour')])),
+                ('bucket_start', models.DateTimeField()),
+                ('comments', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('gifts', models.IntegerField(default=0)),
+                ('coins', models.IntegerField(default=0)),
+                ('joins', models.IntegerField(default=0)),
+                ('follows', models.IntegerField(default=0)),
+                ('shares', models.IntegerField(default=0)),
+                ('unique_chatters', models.IntegerField(default=0)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tiktok_live.livestream')),
+            ],
+            options={
+                'unique_together': {('stream', 'resolution', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0012_interactionrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamInteraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction_type', models.CharField(choices=[('comment', 'Comment'), ('like', 'Like'), ('gift', 'Gift'), ('follow', 'Follow'), ('share', 'Share'), ('join', 'Join')], max_length=20)),
+                ('username', models.CharField(max_length=100)),
+                ('display_name', models.CharField(blank=True, max_length=200)),
+                ('message', models.TextField(blank=True)),
+                ('gift_name', models.CharField(blank=True, max_length=100)),
+                ('gift_count', models.IntegerField(default=1)),
+                ('gift_value', models.IntegerField(default=0)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('stream', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='tiktok_live.livestream')),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user', 'interaction_type', '-timestamp'], name='interaction_user_type_idx'),
+                    models.Index(fields=['stream', 'interaction_type', '-timestamp'], name='interaction_stream_type_idx'),
+                ],
+            },
+        ),
+    ]
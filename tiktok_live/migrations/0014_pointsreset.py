@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0013_streaminteraction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsReset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reset_type', models.CharField(choices=[('points_only', 'Points reset to 0'), ('all', 'All user data deleted')], max_length=20)),
+                ('executed_at', models.DateTimeField(auto_now_add=True)),
+                ('affected_users', models.IntegerField(default=0)),
+                ('deleted_transactions', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0014_pointsreset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpoints',
+            index=models.Index(fields=['user', 'points_total', 'id'], name='userpoints_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpoints',
+            index=models.Index(fields=['user', 'points_level', 'id'], name='userpoints_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpoints',
+            index=models.Index(fields=['user', 'first_activity', 'id'], name='userpoints_first_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpoints',
+            index=models.Index(fields=['user', 'last_activity', 'id'], name='userpoints_last_idx'),
+        ),
+    ]
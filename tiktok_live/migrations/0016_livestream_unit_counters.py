@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0015_userpoints_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livestream',
+            name='total_gift_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='livestream',
+            name='total_like_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 12:00
+
+import tiktok_live.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktok_live', '0016_livestream_unit_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userpoints',
+            name='first_activity',
+            field=tiktok_live.models.StampedDateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='userpoints',
+            name='last_activity',
+            field=tiktok_live.models.StampedDateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='pointstransaction',
+            name='created_at',
+            field=tiktok_live.models.StampedDateTimeField(auto_now_add=True),
+        ),
+    ]
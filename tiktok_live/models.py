@@ -1,8 +1,30 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from contextlib import contextmanager
+from contextvars import ContextVar
 import uuid
 
+_keep_dates = ContextVar('keep_dates', default=False)
+
+@contextmanager
+def keep_dates():
+    """Let StampedDateTimeField keep values already set on instances saved in this block"""
+    token = _keep_dates.set(True)
+    try:
+        yield
+    finally:
+        _keep_dates.reset(token)
+
+class StampedDateTimeField(models.DateTimeField):
+    """auto_now/auto_now_add field that keep_dates() can bypass, so imports insert exported times in one pass"""
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if value is not None and _keep_dates.get():
+            return value
+        return super().pre_save(model_instance, add)
+
 class TikTokAccount(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     username = models.CharField(max_length=100, unique=True)
@@ -38,6 +60,25 @@ class LiveStream(models.Model):
     ended_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
+    # Stream control
+    is_monitored = models.BooleanField(default=True)
+    auto_response_enabled = models.BooleanField(default=False)
+    automation_enabled = models.BooleanField(default=False)
+    
+    # Counters checkpointed by stream_stats; total_<type> counts events,
+    # total_gift_count and total_like_count sum their gift repeats and likes
+    peak_viewers = models.IntegerField(default=0)
+    total_interactions = models.IntegerField(default=0)
+    total_comments = models.IntegerField(default=0)
+    total_gifts = models.IntegerField(default=0)
+    total_gift_count = models.IntegerField(default=0)
+    total_gift_value = models.IntegerField(default=0)
+    total_likes = models.IntegerField(default=0)
+    total_like_count = models.IntegerField(default=0)
+    total_shares = models.IntegerField(default=0)
+    total_follows = models.IntegerField(default=0)
+    total_joins = models.IntegerField(default=0)
+    
     def __str__(self):
         return f"{self.account.username} - {self.title}"
 
@@ -51,7 +92,10 @@ class StreamInteraction(models.Model):
         ('join', 'Join'),
     ]
     
-    stream = models.ForeignKey(LiveStream, on_delete=models.CASCADE)
+    # Indexed through interaction_stream_type_idx, which leads with stream
+    stream = models.ForeignKey(LiveStream, on_delete=models.CASCADE, db_index=False)
+    # Owner of the stream's account, copied here so per-user lookups skip the stream/account join
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
     interaction_type = models.CharField(max_length=20, choices=INTERACTION_TYPES)
     username = models.CharField(max_length=100)
     display_name = models.CharField(max_length=200, blank=True)
@@ -61,6 +105,14 @@ class StreamInteraction(models.Model):
     gift_value = models.IntegerField(default=0)  # in coins
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Last X widgets: latest interaction of a type for a user
+            models.Index(fields=['user', 'interaction_type', '-timestamp'], name='interaction_user_type_idx'),
+            # Interactions page: one stream, optionally one type, newest first
+            models.Index(fields=['stream', 'interaction_type', '-timestamp'], name='interaction_stream_type_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.username} - {self.interaction_type}"
 
@@ -115,11 +167,18 @@ class UserPoints(models.Model):
     level = models.IntegerField(default=1)
     total_gifts_sent = models.IntegerField(default=0)
     total_coins_spent = models.IntegerField(default=0)
-    first_activity = models.DateTimeField(auto_now_add=True)
-    last_activity = models.DateTimeField(auto_now=True)
+    first_activity = StampedDateTimeField(auto_now_add=True)
+    last_activity = StampedDateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['user', 'tiktok_username']
+        indexes = [
+            # Points grid sort keys; id breaks ties so keyset pages are stable
+            models.Index(fields=['user', 'points_total', 'id'], name='userpoints_total_idx'),
+            models.Index(fields=['user', 'points_level', 'id'], name='userpoints_level_idx'),
+            models.Index(fields=['user', 'first_activity', 'id'], name='userpoints_first_idx'),
+            models.Index(fields=['user', 'last_activity', 'id'], name='userpoints_last_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tiktok_username} - {self.points_total} points"
@@ -140,7 +199,7 @@ class PointsTransaction(models.Model):
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     points_change = models.IntegerField()
     description = models.CharField(max_length=500, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = StampedDateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.user_points.tiktok_username} - {self.points_change} points"
@@ -407,6 +466,21 @@ class PointsHalving(models.Model):
     def __str__(self):
         return f"Halving {self.percentage}% - {self.executed_at.strftime('%Y-%m-%d %H:%M')}"
 
+class PointsReset(models.Model):
+    RESET_TYPES = [
+        ('points_only', 'Points reset to 0'),
+        ('all', 'All user data deleted'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    reset_type = models.CharField(max_length=20, choices=RESET_TYPES)
+    executed_at = models.DateTimeField(auto_now_add=True)
+    affected_users = models.IntegerField(default=0)
+    deleted_transactions = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Reset {self.reset_type} - {self.executed_at.strftime('%Y-%m-%d %H:%M')}"
+
 class TTSSettings(models.Model):
     COMMENT_TYPE_CHOICES = [
         ('any', 'Any comment'),
@@ -539,4 +613,38 @@ class ChatbotLog(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.user.username} - {self.sent_at.strftime('%Y-%m-%d %H:%M:%S')}"
\ No newline at end of file
+        return f"{self.user.username} - {self.sent_at.strftime('%Y-%m-%d %H:%M:%S')}"
+class InteractionRollup(models.Model):
+    """Interaction counts for one stream over one minute or one hour"""
+    RESOLUTION_CHOICES = [
+        (60, 'Minute'),
+        (3600, 'Hour'),
+    ]
+    
+    stream = models.ForeignKey(LiveStream, on_delete=models.CASCADE)
+    resolution = models.PositiveIntegerField(choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    comments = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    gifts = models.IntegerField(default=0)
+    coins = models.IntegerField(default=0)
+    joins = models.IntegerField(default=0)
+    follows = models.IntegerField(default=0)
+    shares = models.IntegerField(default=0)
+    unique_chatters = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['stream', 'resolution', 'bucket_start']
+    
+    def __str__(self):
+        return f"{self.stream_id} @ {self.bucket_start} ({self.resolution}s)"
+
+class ConnectorLease(models.Model):
+    """Which worker owns the upstream TikTokLive connection for a username"""
+    username = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=200)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"@{self.username} - {self.owner}"
@@ -1,5 +1,11 @@
+import glob
+import logging
 import os
+import shutil
 import subprocess
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     from gtts import gTTS
@@ -7,58 +13,279 @@ try:
 except ImportError:
     GTTS_AVAILABLE = False
 
-class TTS:
-    def text_to_speech(self, text: str, output_path: str, voice: str = "default", language: str = "en") -> bool:
-        if GTTS_AVAILABLE:
-            return self._gtts(text, output_path, language)
-        else:
-            return self._windows_tts(text, output_path, language)
-    
-    def _gtts(self, text: str, output_path: str, language: str) -> bool:
+try:
+    from piper.voice import PiperVoice
+    PIPER_AVAILABLE = True
+except ImportError:
+    PIPER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+GTTS_LANGS = {
+    "tr-TR": "tr",
+    "en-US": "en",
+    "en-GB": "en",
+    "de-DE": "de",
+    "fr-FR": "fr",
+    "es-ES": "es"
+}
+
+def _setting(name, default):
+    from django.conf import settings
+    return getattr(settings, name, default)
+
+class TTSEngine:
+    """Backend interface: render text to an audio file, optionally as a stream of chunks"""
+    name = ""
+    audio_format = "wav"
+
+    def available(self) -> bool:
+        return True
+
+    def supports(self, voice: str, language: str) -> bool:
+        return self.available()
+
+    def text_to_speech(self, text: str, output_path: str, voice: str = "default", language: str = "en", speed: int = 50) -> bool:
+        raise NotImplementedError
+
+    def stream(self, text: str, voice: str = "default", language: str = "en", speed: int = 50, chunk_size: int = 16384):
+        """Engines that cannot stream render the whole file first and read it out in chunks"""
+        fd, path = tempfile.mkstemp(suffix=f".{self.audio_format}")
+        os.close(fd)
         try:
-            lang_map = {
-                "tr-TR": "tr",
-                "en-US": "en", 
-                "en-GB": "en",
-                "de-DE": "de",
-                "fr-FR": "fr",
-                "es-ES": "es"
-            }
-            
-            lang_code = lang_map.get(language, "en")
-            tts = gTTS(text=text, lang=lang_code, slow=False)
+            if self.text_to_speech(text, path, voice, language, speed):
+                with open(path, "rb") as audio:
+                    while chunk := audio.read(chunk_size):
+                        yield chunk
+        finally:
+            os.remove(path)
+
+class GTTSEngine(TTSEngine):
+    name = "gtts"
+    audio_format = "mp3"
+
+    def available(self) -> bool:
+        return GTTS_AVAILABLE
+
+    def text_to_speech(self, text, output_path, voice="default", language="en", speed=50):
+        try:
+            lang_code = GTTS_LANGS.get(language, "en")
+            tts = gTTS(text=text, lang=lang_code, slow=speed < 30)
             tts.save(output_path)
             return os.path.exists(output_path)
         except Exception as e:
-            print(f"gTTS Error: {e}")
-            return self._windows_tts(text, output_path, language)
-    
-    def _windows_tts(self, text: str, output_path: str, language: str) -> bool:
+            logger.error(f"gTTS error: {e}")
+            return False
+
+    def stream(self, text, voice="default", language="en", speed=50, chunk_size=16384):
+        # gTTS produces one chunk per sentence-sized piece of text
+        yield from gTTS(text=text, lang=GTTS_LANGS.get(language, "en"), slow=speed < 30).stream()
+
+class WindowsSpeechEngine(TTSEngine):
+    """System.Speech through PowerShell; spawns one process per utterance"""
+    name = "windows"
+
+    voice_map = {
+        "tr-TR": "Microsoft Tolga Desktop",
+        "en-US": "Microsoft David Desktop",
+        "en-GB": "Microsoft Hazel Desktop",
+        "de-DE": "Microsoft Stefan Desktop",
+        "fr-FR": "Microsoft Paul Desktop",
+        "es-ES": "Microsoft Pablo Desktop"
+    }
+
+    def available(self) -> bool:
+        return shutil.which("powershell") is not None
+
+    def text_to_speech(self, text, output_path, voice="default", language="en", speed=50):
         try:
-            voice_map = {
-                "tr-TR": "Microsoft Tolga Desktop",
-                "en-US": "Microsoft David Desktop", 
-                "en-GB": "Microsoft Hazel Desktop",
-                "de-DE": "Microsoft Stefan Desktop",
-                "fr-FR": "Microsoft Paul Desktop",
-                "es-ES": "Microsoft Pablo Desktop"
-            }
-            
-            voice_name = voice_map.get(language, "Microsoft David Desktop")
+            voice_name = self.voice_map.get(language, "Microsoft David Desktop")
             safe_text = text.replace('"', '`"').replace("'", "''")
             safe_path = output_path.replace('\\', '/')
-            
-            ps_script = f"""Add-Type -AssemblyName System.Speech; 
-            $synth = New-Object System.Speech.Synthesis.SpeechSynthesizer; 
+
+            ps_script = f"""Add-Type -AssemblyName System.Speech;
+            $synth = New-Object System.Speech.Synthesis.SpeechSynthesizer;
             try {{ $synth.SelectVoice('{voice_name}') }} catch {{ }}
-            $synth.SetOutputToWaveFile('{safe_path}'); 
-            $synth.Speak('{safe_text}'); 
+            $synth.SetOutputToWaveFile('{safe_path}');
+            $synth.Speak('{safe_text}');
             $synth.Dispose()"""
-            
+
             result = subprocess.run(["powershell", "-Command", ps_script], capture_output=True, timeout=30)
             return result.returncode == 0 and os.path.exists(output_path)
         except Exception as e:
-            print(f"Windows TTS Error: {e}")
+            logger.error(f"Windows TTS error: {e}")
             return False
 
-piper_tts = TTS()
\ No newline at end of file
+# Voices loaded in this Piper worker process, kept for its whole lifetime
+_worker_voices = {}
+
+def _load_piper_voice(model_path):
+    voice = _worker_voices.get(model_path)
+    if voice is None:
+        voice = PiperVoice.load(model_path, config_path=f"{model_path}.json")
+        _worker_voices[model_path] = voice
+    return voice
+
+def _piper_worker_init(preload):
+    for model_path in preload:
+        try:
+            _load_piper_voice(model_path)
+        except Exception as e:
+            logger.error(f"Piper preload error for {model_path}: {e}")
+
+def _piper_synthesize(model_path, text, output_path, length_scale):
+    voice = _load_piper_voice(model_path)
+    with wave.open(output_path, "wb") as wav_file:
+        if hasattr(voice, "synthesize_wav"):
+            # piper-tts >= 1.3
+            from piper import SynthesisConfig
+            voice.synthesize_wav(text, wav_file, syn_config=SynthesisConfig(length_scale=length_scale))
+        else:
+            voice.synthesize(text, wav_file, length_scale=length_scale)
+    return os.path.getsize(output_path) > 0
+
+class PiperEngine(TTSEngine):
+    """Offline Piper voices from models/*.onnx, kept loaded in long-lived worker processes"""
+    name = "piper"
+
+    def __init__(self, models_dir=None, workers=None, preload=None):
+        self._models_dir = models_dir
+        self._workers = workers
+        self._preload = preload
+        self._pool = None
+        self._voices = None
+        self._voices_mtime = None
+
+    @property
+    def models_dir(self):
+        if self._models_dir is None:
+            self._models_dir = _setting('TIKTOK_PIPER_MODELS_DIR', os.path.join(_setting('BASE_DIR', '.'), 'models'))
+        return self._models_dir
+
+    def voices(self):
+        """Voice name -> .onnx path for every model whose weights and config are both present"""
+        try:
+            mtime = os.stat(self.models_dir).st_mtime
+        except OSError:
+            return {}
+        # Rescan only when files were added or removed
+        if self._voices is None or mtime != self._voices_mtime:
+            voices = {}
+            for config_path in glob.glob(os.path.join(self.models_dir, "*.onnx.json")):
+                model_path = config_path[:-len(".json")]
+                if os.path.exists(model_path):
+                    voices[os.path.basename(model_path)[:-len(".onnx")]] = model_path
+            self._voices = voices
+            self._voices_mtime = mtime
+        return self._voices
+
+    def model_for(self, voice: str, language: str):
+        voices = self.voices()
+        name = voice.split(":", 1)[1] if voice.startswith("piper:") else voice
+        if name in voices:
+            return voices[name]
+        prefix = language.replace("-", "_") + "-"
+        for name in sorted(voices):
+            if name.startswith(prefix):
+                return voices[name]
+        return None
+
+    def available(self) -> bool:
+        return PIPER_AVAILABLE and bool(self.voices())
+
+    def supports(self, voice, language) -> bool:
+        return PIPER_AVAILABLE and self.model_for(voice, language) is not None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            workers = self._workers or _setting('TIKTOK_PIPER_WORKERS', 2)
+            preload = self._preload
+            if preload is None:
+                voices = self.voices()
+                preload = [voices[name] for name in _setting('TIKTOK_PIPER_PRELOAD', []) if name in voices]
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_piper_worker_init, initargs=(tuple(preload),))
+        return self._pool
+
+    def text_to_speech(self, text, output_path, voice="default", language="en", speed=50):
+        model_path = self.model_for(voice, language)
+        if model_path is None:
+            return False
+        # TTSSettings speed 50 is normal; Piper's length_scale is the inverse of speed
+        length_scale = 50 / min(max(speed, 10), 200)
+        try:
+            return self.pool.submit(_piper_synthesize, model_path, text, output_path, length_scale).result(timeout=60)
+        except Exception as e:
+            logger.error(f"Piper error: {e}")
+            return False
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+class TTS:
+    """Picks an engine from TTSSettings.voice/language and falls back to the others on failure.
+
+    voice may name an engine ("gtts", "windows", "piper"), a Piper voice
+    ("tr_TR-dfki-medium" or "piper:tr_TR-dfki-medium") or "default", which
+    uses TIKTOK_TTS_ENGINE ("auto" prefers a local Piper voice for the language).
+    Fallbacks are limited to engines with the preferred engine's audio format,
+    so the format from audio_format_for() is always the one produced.
+    """
+
+    def __init__(self):
+        self.engines = {
+            "piper": PiperEngine(),
+            "gtts": GTTSEngine(),
+            "windows": WindowsSpeechEngine()
+        }
+
+    def _candidates(self, voice, language):
+        voice = voice or "default"
+        preferred = voice.split(":", 1)[0]
+        if preferred not in self.engines:
+            preferred = _setting('TIKTOK_TTS_ENGINE', 'auto')
+        order = ["piper", "gtts", "windows"]
+        if preferred in order:
+            order.remove(preferred)
+            order.insert(0, preferred)
+        return [self.engines[name] for name in order if self.engines[name].supports(voice, language)]
+
+    def _chain(self, voice, language):
+        # Callers key caches and content types on audio_format_for(), so never fall back across formats
+        candidates = self._candidates(voice, language) or [self.engines["windows"]]
+        return [engine for engine in candidates if engine.audio_format == candidates[0].audio_format]
+
+    def engine_for(self, voice: str = "default", language: str = "en") -> TTSEngine:
+        return self._chain(voice, language)[0]
+
+    def audio_format_for(self, voice: str = "default", language: str = "en") -> str:
+        return self.engine_for(voice, language).audio_format
+
+    @property
+    def audio_format(self) -> str:
+        return self.audio_format_for()
+
+    def text_to_speech(self, text: str, output_path: str, voice: str = "default", language: str = "en", speed: int = 50) -> bool:
+        for engine in self._chain(voice, language):
+            if engine.text_to_speech(text, output_path, voice, language, speed):
+                return True
+        return False
+
+    def stream(self, text: str, voice: str = "default", language: str = "en", speed: int = 50, chunk_size: int = 16384):
+        """Yield audio bytes as they are synthesized, falling back only if nothing was sent yet"""
+        for engine in self._chain(voice, language):
+            started = False
+            try:
+                for chunk in engine.stream(text, voice, language, speed, chunk_size):
+                    started = True
+                    yield chunk
+                if started:
+                    return
+            except Exception as e:
+                logger.error(f"{engine.name} stream error: {e}")
+                if started:
+                    return
+
+piper_tts = TTS()
@@ -0,0 +1,262 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import zlib
+from datetime import datetime, time as dt_time, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import PointsTransaction, UserPoints, keep_dates
+from .points_grid import points_grid
+from .leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FIELDS = [
+    'tiktok_username', 'tiktok_user_id', 'display_name', 'profile_picture', 'points_total', 'points_level',
+    'level', 'total_gifts_sent', 'total_coins_spent', 'first_activity', 'last_activity',
+]
+TRANSACTION_FIELDS = ['tiktok_username', 'transaction_type', 'points_change', 'description', 'created_at']
+INTEGER_FIELDS = {'points_total', 'points_level', 'level', 'total_gifts_sent', 'total_coins_spent', 'points_change'}
+DATE_FIELDS = {'first_activity', 'last_activity', 'created_at'}
+FORMATS = ('csv', 'ndjson')
+
+def parse_bound(value, end=False):
+    """A YYYY-MM-DD date or ISO datetime; a bare date as ``end`` covers that whole day"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = datetime.strptime(value, '%Y-%m-%d').date()
+        moment = datetime.combine(day + timedelta(days=1) if end else day, dt_time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+class Echo:
+    """File-like object for csv.writer that hands back each written line"""
+    def write(self, value):
+        return value
+
+async def stream(chunks):
+    """Serve a sync iterator from an async one so ASGI sends it chunk by chunk instead of buffering"""
+    iterator = iter(chunks)
+    while True:
+        chunk = await sync_to_async(next)(iterator, None)
+        if chunk is None:
+            break
+        yield chunk
+
+class PointsExport:
+    """Streaming export and batched import of points ledgers.
+
+    Exports read rows with ``.iterator(chunk_size=...)`` and encode them a
+    chunk at a time, optionally through an incremental gzip compressor, so
+    memory stays flat however large the ledger is. Imports read CSV or NDJSON
+    (gzipped or not) line by line and write them with bulk_create in batches,
+    for moving a ledger from one account to another. Exported timestamps are
+    inserted as they are inside keep_dates(); rows without one are stamped
+    with the current time as usual.
+    """
+
+    def __init__(self, chunk_size=None, batch_size=None):
+        self.chunk_size = chunk_size or getattr(settings, 'TIKTOK_EXPORT_CHUNK_SIZE', 2000)
+        self.batch_size = batch_size or getattr(settings, 'TIKTOK_IMPORT_BATCH_SIZE', 1000)
+
+    def ledger_rows(self, user_id, since=None, until=None):
+        """UserPoints rows with activity in the range, as tuples in LEDGER_FIELDS order"""
+        queryset = UserPoints.objects.filter(user_id=user_id)
+        if since:
+            queryset = queryset.filter(last_activity__gte=since)
+        if until:
+            queryset = queryset.filter(last_activity__lt=until)
+        return queryset.order_by('id').values_list(*LEDGER_FIELDS).iterator(chunk_size=self.chunk_size)
+
+    def transaction_rows(self, user_id, since=None, until=None, username=None):
+        """PointsTransaction rows created in the range, as tuples in TRANSACTION_FIELDS order"""
+        queryset = PointsTransaction.objects.filter(user_points__user_id=user_id)
+        if username:
+            queryset = queryset.filter(user_points__tiktok_username=username)
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        fields = ['user_points__tiktok_username'] + TRANSACTION_FIELDS[1:]
+        return queryset.order_by('id').values_list(*fields).iterator(chunk_size=self.chunk_size)
+
+    def encode(self, rows, fields, fmt='csv', compress=False):
+        """Bytes blocks of about ``chunk_size`` encoded rows, gzipped as they go if ``compress``"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        writer = csv.writer(Echo())
+
+        def output(text):
+            data = text.encode('utf-8')
+            return compressor.compress(data) if compressor else data
+
+        block = [writer.writerow(fields)] if fmt == 'csv' else []
+        for row in rows:
+            values = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            if fmt == 'csv':
+                block.append(writer.writerow(values))
+            else:
+                block.append(json.dumps(dict(zip(fields, values)), ensure_ascii=False) + '\n')
+            if len(block) >= self.chunk_size:
+                data = output(''.join(block))
+                block = []
+                if data:
+                    yield data
+        data = output(''.join(block))
+        if compressor:
+            data += compressor.flush()
+        if data:
+            yield data
+
+    def read(self, fileobj, fmt=None):
+        """Dicts from a CSV or NDJSON file object, gunzipped when it starts with the gzip magic
+
+        Unreadable input (a broken gzip stream, bad UTF-8, malformed CSV or
+        NDJSON lines that are not objects) raises ValueError.
+        """
+        head = fileobj.read(2)
+        fileobj.seek(0)
+        if head == b'\x1f\x8b':
+            fileobj = gzip.GzipFile(fileobj=fileobj)
+        text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+        try:
+            if fmt == 'csv':
+                yield from csv.DictReader(text)
+                return
+            for number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"Line {number} is not valid JSON")
+                if not isinstance(row, dict):
+                    raise ValueError(f"Line {number} is not a JSON object")
+                yield row
+        except (OSError, EOFError, UnicodeDecodeError, csv.Error) as e:
+            raise ValueError(f"Unreadable {fmt or 'import'} file: {e}")
+
+    def _batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _clean(self, row, fields, number):
+        values = {}
+        for field in fields:
+            value = row.get(field)
+            if value in (None, ''):
+                continue
+            try:
+                if field in INTEGER_FIELDS:
+                    value = int(value)
+                elif field in DATE_FIELDS:
+                    value = parse_bound(value)
+                else:
+                    value = str(value)
+            except ValueError:
+                raise ValueError(f"Row {number}: invalid {field} {value!r}")
+            values[field] = value
+        if not values.get('tiktok_username'):
+            raise ValueError(f"Row {number}: tiktok_username is required")
+        return values
+
+    def import_ledger(self, user, rows, on_conflict='skip'):
+        """Create viewers from exported rows; existing viewers are skipped or have the imported totals added"""
+        if on_conflict not in ('skip', 'add'):
+            raise ValueError(f"Unsupported conflict mode: {on_conflict}")
+
+        counts = {'created': 0, 'merged': 0, 'skipped': 0}
+        number = 0
+        seen = set()
+        with transaction.atomic(), keep_dates():
+            for batch in self._batches(rows):
+                cleaned = {}
+                for row in batch:
+                    number += 1
+                    values = self._clean(row, LEDGER_FIELDS, number)
+                    username = values['tiktok_username']
+                    if username in seen:
+                        # Only the first row for a viewer is imported
+                        counts['skipped'] += 1
+                        continue
+                    seen.add(username)
+                    cleaned[username] = values
+                existing = {
+                    row.tiktok_username: row
+                    for row in UserPoints.objects.filter(user=user, tiktok_username__in=list(cleaned))
+                }
+
+                created = UserPoints.objects.bulk_create([
+                    UserPoints(user=user, **values)
+                    for username, values in cleaned.items() if username not in existing
+                ], batch_size=self.batch_size)
+                counts['created'] += len(created)
+
+                if on_conflict == 'skip':
+                    counts['skipped'] += len(existing)
+                    continue
+                for username, row in existing.items():
+                    values = cleaned[username]
+                    for field in ('points_total', 'points_level', 'total_gifts_sent', 'total_coins_spent'):
+                        setattr(row, field, getattr(row, field) + values.get(field, 0))
+                    row.level = max(row.level, values.get('level', 1))
+                UserPoints.objects.bulk_update(
+                    existing.values(), ['points_total', 'points_level', 'level', 'total_gifts_sent', 'total_coins_spent']
+                )
+                counts['merged'] += len(existing)
+
+        points_grid.invalidate(user.pk)
+        leaderboard.invalidate(user.pk)
+        logger.info(f"Imported ledger for user {user.pk}: {counts}")
+        return counts
+
+    def import_transactions(self, user, rows):
+        """Create transactions for viewers already in the ledger; rows for unknown viewers are skipped"""
+        counts = {'created': 0, 'skipped': 0}
+        number = 0
+        with transaction.atomic(), keep_dates():
+            for batch in self._batches(rows):
+                cleaned = []
+                for row in batch:
+                    number += 1
+                    cleaned.append(self._clean(row, TRANSACTION_FIELDS, number))
+                ids = dict(
+                    UserPoints.objects.filter(user=user, tiktok_username__in={values['tiktok_username'] for values in cleaned})
+                    .values_list('tiktok_username', 'id')
+                )
+                objects = []
+                for values in cleaned:
+                    user_points_id = ids.get(values['tiktok_username'])
+                    if user_points_id is None:
+                        counts['skipped'] += 1
+                        continue
+                    objects.append(PointsTransaction(
+                        user_points_id=user_points_id,
+                        transaction_type=values.get('transaction_type', 'manual'),
+                        points_change=values.get('points_change', 0),
+                        description=values.get('description', ''),
+                        created_at=values.get('created_at')
+                    ))
+                objects = PointsTransaction.objects.bulk_create(objects, batch_size=self.batch_size)
+                counts['created'] += len(objects)
+
+        logger.info(f"Imported transactions for user {user.pk}: {counts}")
+        return counts
+
+# Global instance
+points_export = PointsExport()
@@ -0,0 +1,146 @@
+import base64
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import UserPoints
+
+logger = logging.getLogger(__name__)
+
+# Grid column -> UserPoints field; every one is backed by a (user, field, id) index
+SORT_KEYS = {
+    'username': 'tiktok_username',
+    'points_total': 'points_total',
+    'points_level': 'points_level',
+    'first_activity': 'first_activity',
+    'last_activity': 'last_activity',
+}
+DATE_FIELDS = {'first_activity', 'last_activity'}
+# Query parameters filtered() reads; everything else (cursor, limit, sort) leaves the count unchanged
+FILTER_PARAMS = ('username', 'points', 'level_points', 'first_activity', 'last_activity')
+
+class PointsGrid:
+    """Keyset-paginated pages of a streamer's points ledger for the data grid.
+
+    Rows are ordered by a whitelisted column plus ``id`` as a tie-breaker, and
+    each page ends with an opaque cursor holding the last row's sort value and
+    id; the next page starts after it, so page N costs the same as page 1.
+    Username search is a prefix match written as a range on the
+    (user, tiktok_username) unique index. Total counts are cached per
+    streamer and filter for ``count_ttl`` seconds.
+    """
+
+    def __init__(self, page_size=None, max_page_size=None, count_ttl=None):
+        self.page_size = page_size or getattr(settings, 'TIKTOK_POINTS_GRID_PAGE_SIZE', 40)
+        self.max_page_size = max_page_size or getattr(settings, 'TIKTOK_POINTS_GRID_MAX_PAGE_SIZE', 200)
+        self.count_ttl = count_ttl or getattr(settings, 'TIKTOK_POINTS_GRID_COUNT_TTL', 60)
+        self.counts = {}
+        self.stats = {'pages': 0, 'count_hits': 0, 'count_misses': 0}
+
+    def encode_cursor(self, value, row_id):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+    def decode_cursor(self, cursor, field):
+        try:
+            value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if field in DATE_FIELDS:
+                value = datetime.fromisoformat(value)
+            return value, int(row_id)
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor')
+
+    def filtered(self, user_id, filters):
+        """The streamer's ledger narrowed by the grid's filter row"""
+        queryset = UserPoints.objects.filter(user_id=user_id)
+
+        prefix = self._username_prefix(filters)
+        if prefix:
+            # A range instead of LIKE so every backend can walk the unique index. It compares
+            # case-sensitively, which matches TikTok unique ids since they are stored lowercase
+            queryset = queryset.filter(tiktok_username__gte=prefix, tiktok_username__lt=prefix + '\uffff')
+
+        for param, field in (('points', 'points_total'), ('level_points', 'points_level')):
+            value = filters.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{field: int(value)})
+                except ValueError:
+                    pass
+
+        for field in DATE_FIELDS:
+            value = filters.get(field)
+            if value:
+                try:
+                    day = timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+                except ValueError:
+                    continue
+                queryset = queryset.filter(**{f'{field}__gte': day, f'{field}__lt': day + timedelta(days=1)})
+        return queryset
+
+    def _username_prefix(self, filters):
+        return (filters.get('username') or '').strip().lstrip('@').lower()
+
+    def _count_key(self, user_id, filters):
+        values = {name: filters.get(name) for name in FILTER_PARAMS}
+        values['username'] = self._username_prefix(filters)
+        return (user_id, tuple((name, value) for name, value in values.items() if value))
+
+    def total(self, user_id, filters=None):
+        """Row count for a streamer and filter, recounted at most every ``count_ttl`` seconds"""
+        filters = filters or {}
+        key = self._count_key(user_id, filters)
+        cached = self.counts.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < self.count_ttl:
+            self.stats['count_hits'] += 1
+            return cached[0]
+        self.stats['count_misses'] += 1
+        count = self.filtered(user_id, filters).count()
+        self.counts[key] = (count, now)
+        return count
+
+    def invalidate(self, user_id):
+        """Drop cached counts for a streamer after rows were added or removed in bulk"""
+        for key in [key for key in self.counts if key[0] == user_id]:
+            del self.counts[key]
+
+    def page(self, user_id, sort='points_total', order='desc', cursor=None, limit=None, filters=None):
+        """One page of rows after ``cursor``, with the cursor for the page after it"""
+        field = SORT_KEYS.get(sort)
+        if field is None:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unsupported sort order: {order}")
+        limit = min(max(int(limit or self.page_size), 1), self.max_page_size)
+        filters = filters or {}
+
+        queryset = self.filtered(user_id, filters)
+        descending = order == 'desc'
+        if cursor:
+            value, row_id = self.decode_cursor(cursor, field)
+            after = 'lt' if descending else 'gt'
+            # (field, id) past the cursor; the outer bound on field alone lets the index seek to it
+            queryset = queryset.filter(**{f'{field}__{after}e': value}).filter(
+                Q(**{f'{field}__{after}': value}) | Q(**{f'id__{after}': row_id})
+            )
+        prefix = '-' if descending else ''
+        rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(getattr(rows[-1], field), rows[-1].id)
+        self.stats['pages'] += 1
+        return {
+            'rows': rows,
+            'next_cursor': next_cursor,
+            'total': self.total(user_id, filters),
+        }
+
+# Global instance
+points_grid = PointsGrid()
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from typing import Dict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import PointsSettings, PointsTransaction, UserPoints
+from .leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+# Transaction type -> PointsSettings rate
+RATES = {
+    'gift': 'points_per_gift',
+    'follow': 'points_per_follow',
+    'like': 'points_per_like',
+    'comment': 'points_per_comment',
+    'share': 'points_per_share',
+}
+
+def points_for(points_settings, transaction_type, count=1):
+    """Points earned for ``count`` events of a type under a streamer's settings (None means defaults)"""
+    field = RATES.get(transaction_type)
+    if field is None:
+        return 0
+    if points_settings is None:
+        return PointsSettings._meta.get_field(field).default * count
+    if not points_settings.enable_points_system:
+        return 0
+    return getattr(points_settings, field) * count
+
+def apply_level_ups(points_level, level, threshold):
+    """Carry points over the threshold into levels; returns (points_level, level, levels gained)"""
+    if threshold <= 0 or points_level < threshold:
+        return points_level, level, 0
+    gained, points_level = divmod(points_level, threshold)
+    return points_level, level + gained, gained
+
+class Delta:
+    """Points, event counts and gift totals for one viewer since the last flush"""
+    __slots__ = ('points', 'events', 'gifts', 'coins')
+
+    def __init__(self):
+        self.points = {}
+        self.events = {}
+        self.gifts = 0
+        self.coins = 0
+
+    def merge(self, other):
+        for transaction_type, points in other.points.items():
+            self.points[transaction_type] = self.points.get(transaction_type, 0) + points
+        for transaction_type, events in other.events.items():
+            self.events[transaction_type] = self.events.get(transaction_type, 0) + events
+        self.gifts += other.gifts
+        self.coins += other.coins
+
+    def total(self):
+        return sum(self.points.values())
+
+class PointsLedger:
+    """Per-viewer points accumulated in memory and written in batches.
+
+    Connectors add points as events arrive; deltas for the same streamer and
+    viewer are merged, so a viewer tapping likes many times a second costs a
+    few dict updates. Every ``interval`` seconds the pending viewers are
+    written with one bulk upsert per streamer and one PointsTransaction per
+    viewer and type. Level-ups are worked out at flush time from the
+    streamer's current ``level_up_threshold``.
+    """
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval or getattr(settings, 'TIKTOK_POINTS_FLUSH_INTERVAL', 5.0)
+        self.batch_size = batch_size or getattr(settings, 'TIKTOK_POINTS_BATCH_SIZE', 500)
+        self.pending: Dict[tuple, Delta] = {}
+        self.listeners = {}
+        self.stats = {'events': 0, 'flushes': 0, 'viewers': 0, 'transactions': 0, 'level_ups': 0, 'failed': 0}
+        self._loop = None
+        self._worker = None
+        self._lock = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def record(self, user_id, username, transaction_type, points, events=1, gifts=0, coins=0, on_level_up=None):
+        """Add points, gifts and coins for a viewer of a streamer
+
+        Gifts and coins are kept even when the event earns no points (points
+        system off or a zero rate). on_level_up(username, level, points) is
+        awaited after the flush.
+        """
+        if not user_id or not username or not (points or gifts or coins):
+            return
+        self._ensure_worker()
+        delta = self.pending.get((user_id, username))
+        if delta is None:
+            delta = self.pending[(user_id, username)] = Delta()
+        if points:
+            delta.points[transaction_type] = delta.points.get(transaction_type, 0) + points
+            delta.events[transaction_type] = delta.events.get(transaction_type, 0) + events
+        delta.gifts += gifts
+        delta.coins += coins
+        if on_level_up is not None:
+            self.listeners[user_id] = on_level_up
+        self.stats['events'] += 1
+
+    def pending_points(self, user_id, username):
+        """Points this process has recorded for a viewer but not written yet"""
+        delta = self.pending.get((user_id, username))
+        return delta.total() if delta else 0
+
+    def _pending_coins(self, user_id, username):
+        delta = self.pending.get((user_id, username))
+        return delta.coins if delta else 0
+
+    async def flush(self, user_id=None):
+        """Write pending points for one streamer, or for all streamers"""
+        if self._lock is None:
+            return 0
+
+        async with self._lock:
+            keys = [key for key in self.pending if user_id is None or key[0] == user_id]
+            if not keys:
+                return 0
+            batch = {key: self.pending.pop(key) for key in keys}
+            try:
+                level_ups, totals = await sync_to_async(self._write)(batch)
+            except Exception as e:
+                self.stats['failed'] += len(batch)
+                logger.error(f"Failed to write points for {len(batch)} viewers: {e}")
+                self._restore(batch)
+                return 0
+            self.stats['flushes'] += 1
+            self.stats['viewers'] += len(batch)
+            self.stats['transactions'] += sum(len(delta.points) for delta in batch.values())
+            self.stats['level_ups'] += len(level_ups)
+
+            # Stored totals plus whatever was recorded while the flush ran
+            for streamer_id, rows in totals.items():
+                leaderboard.sync(streamer_id, [
+                    (username, points + self.pending_points(streamer_id, username), coins + self._pending_coins(streamer_id, username), level)
+                    for username, points, coins, level in rows
+                ])
+
+        for streamer_id, username, level, points_total in level_ups:
+            listener = self.listeners.get(streamer_id)
+            if listener is not None:
+                try:
+                    await listener(username, level, points_total)
+                except Exception as e:
+                    logger.error(f"Error announcing level up for @{username}: {e}")
+        return len(batch)
+
+    def _restore(self, batch):
+        # Put a failed flush back so the next one retries it
+        for key, delta in batch.items():
+            current = self.pending.get(key)
+            if current is None:
+                self.pending[key] = delta
+            else:
+                current.merge(delta)
+
+    def _write(self, batch):
+        by_streamer = {}
+        for (streamer_id, username), delta in batch.items():
+            by_streamer.setdefault(streamer_id, {})[username] = delta
+
+        thresholds = dict(
+            PointsSettings.objects.filter(user_id__in=list(by_streamer)).values_list('user_id', 'level_up_threshold')
+        )
+        default_threshold = PointsSettings._meta.get_field('level_up_threshold').default
+        now = timezone.now()
+        level_ups = []
+        totals = {}
+
+        with transaction.atomic():
+            for streamer_id, deltas in by_streamer.items():
+                threshold = thresholds.get(streamer_id, default_threshold)
+                usernames = list(deltas)
+                for start in range(0, len(usernames), self.batch_size):
+                    chunk = usernames[start:start + self.batch_size]
+                    rows = self._rows(streamer_id, chunk)
+                    transactions = []
+                    for username in chunk:
+                        row, delta = rows[username], deltas[username]
+                        total = delta.total()
+                        row.points_total += total
+                        row.points_level, row.level, gained = apply_level_ups(row.points_level + total, row.level, threshold)
+                        row.total_gifts_sent += delta.gifts
+                        row.total_coins_spent += delta.coins
+                        row.last_activity = now
+                        if gained:
+                            level_ups.append((streamer_id, username, row.level, row.points_total))
+                        totals.setdefault(streamer_id, []).append((username, row.points_total, row.total_coins_spent, row.level))
+                        transactions.extend(
+                            PointsTransaction(
+                                user_points=row,
+                                transaction_type=transaction_type,
+                                points_change=points,
+                                description=f"{delta.events[transaction_type]} {transaction_type} event(s)"
+                            )
+                            for transaction_type, points in delta.points.items()
+                        )
+                    UserPoints.objects.bulk_update(
+                        rows.values(),
+                        ['points_total', 'points_level', 'level', 'total_gifts_sent', 'total_coins_spent', 'last_activity']
+                    )
+                    PointsTransaction.objects.bulk_create(transactions)
+        return level_ups, totals
+
+    def _rows(self, streamer_id, usernames):
+        # Create missing viewers in one INSERT, then lock and read the whole chunk
+        existing = set(
+            UserPoints.objects.filter(user_id=streamer_id, tiktok_username__in=usernames).values_list('tiktok_username', flat=True)
+        )
+        missing = [username for username in usernames if username not in existing]
+        if missing:
+            UserPoints.objects.bulk_create(
+                [UserPoints(user_id=streamer_id, tiktok_username=username, points_total=0, level=1) for username in missing],
+                ignore_conflicts=True
+            )
+        rows = UserPoints.objects.select_for_update().filter(user_id=streamer_id, tiktok_username__in=usernames)
+        return {row.tiktok_username: row for row in rows}
+
+    async def close(self):
+        """Write everything pending and stop the background task"""
+        await self.flush()
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+
+# Global instance
+points_ledger = PointsLedger()
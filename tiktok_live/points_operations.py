@@ -0,0 +1,119 @@
+import logging
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from .models import PointsHalving, PointsReset, PointsTransaction, UserPoints
+from .points_grid import points_grid
+from .leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+RESET_TYPES = dict(PointsReset.RESET_TYPES)
+
+class PointsOperations:
+    """Mass changes to a streamer's points ledger as set-based SQL.
+
+    Halving and resets run as UPDATE/DELETE statements over the whole ledger
+    inside one transaction and leave one audit row behind (PointsHalving or
+    PointsReset). Ledgers larger than ``chunk_size`` are processed in primary
+    key ranges of that many rows, still in the same transaction, so progress
+    can be reported between statements.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or getattr(settings, 'TIKTOK_POINTS_OPERATION_CHUNK', 100000)
+
+    def _ranges(self, queryset):
+        # (after, upto] id bounds; upto is the chunk_size-th id past the previous range, None for the last range
+        last = 0
+        while True:
+            upper = list(queryset.filter(id__gt=last).order_by('id').values_list('id', flat=True)[self.chunk_size - 1:self.chunk_size])
+            if not upper:
+                yield last, None
+                return
+            yield last, upper[0]
+            last = upper[0]
+
+    def _chunks(self, queryset):
+        for after, upto in self._ranges(queryset):
+            chunk = queryset.filter(id__gt=after) if after else queryset
+            yield chunk if upto is None else chunk.filter(id__lte=upto)
+
+    def _delete_range(self, user_id, after, upto):
+        """Delete a range of viewers and their transactions with two plain DELETE statements
+
+        Django's delete() would load every viewer to collect cascades; the
+        transactions are deleted first, so there is nothing left to cascade to.
+        Returns (viewers, transactions) deleted.
+        """
+        qn = connection.ops.quote_name
+        viewers = qn(UserPoints._meta.db_table)
+        transactions = qn(PointsTransaction._meta.db_table)
+        where = f"{qn(UserPoints._meta.get_field('user').column)} = %s AND {qn('id')} > %s"
+        params = [user_id, after]
+        if upto is not None:
+            where += f" AND {qn('id')} <= %s"
+            params.append(upto)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {transactions} WHERE {qn(PointsTransaction._meta.get_field('user_points').column)} "
+                f"IN (SELECT {qn('id')} FROM {viewers} WHERE {where})",
+                params
+            )
+            deleted = cursor.rowcount
+            cursor.execute(f"DELETE FROM {viewers} WHERE {where}", params)
+            return cursor.rowcount, deleted
+
+    def _report(self, progress, label, done, total):
+        if progress is not None:
+            progress(done, total)
+        if total > self.chunk_size:
+            logger.info(f"{label}: {done}/{total} viewers")
+
+    def halve(self, user, percentage, progress=None):
+        """Reduce every viewer's points by ``percentage``; levels are kept"""
+        if not 1 <= percentage <= 100:
+            raise ValueError('Percentage must be between 1 and 100')
+
+        keep = 100 - percentage
+        with transaction.atomic():
+            queryset = UserPoints.objects.filter(user=user)
+            total = queryset.count()
+            affected = 0
+            for chunk in self._chunks(queryset):
+                # Integer arithmetic truncates like int() did on the old per-row path
+                affected += chunk.update(
+                    points_total=F('points_total') * keep / 100,
+                    points_level=F('points_level') * keep / 100
+                )
+                self._report(progress, f"Halving {percentage}% for user {user.pk}", affected, total)
+            leaderboard.invalidate(user.pk)
+            return PointsHalving.objects.create(user=user, percentage=percentage, affected_users=affected)
+
+    def reset(self, user, reset_type, progress=None):
+        """Zero every viewer's points ('points_only') or delete viewers and their transactions ('all')"""
+        if reset_type not in RESET_TYPES:
+            raise ValueError(f"Unknown reset type: {reset_type}")
+
+        with transaction.atomic():
+            queryset = UserPoints.objects.filter(user=user)
+            total = queryset.count()
+            affected = deleted = 0
+            label = f"Reset ({reset_type}) for user {user.pk}"
+            if reset_type == 'all':
+                for after, upto in self._ranges(queryset):
+                    viewers, transactions = self._delete_range(user.pk, after, upto)
+                    affected += viewers
+                    deleted += transactions
+                    self._report(progress, label, affected, total)
+            else:
+                for chunk in self._chunks(queryset):
+                    affected += chunk.update(points_total=0, points_level=0, level=1)
+                    self._report(progress, label, affected, total)
+            points_grid.invalidate(user.pk)
+            leaderboard.invalidate(user.pk)
+            return PointsReset.objects.create(user=user, reset_type=reset_type, affected_users=affected, deleted_transactions=deleted)
+
+# Global instance
+points_operations = PointsOperations()
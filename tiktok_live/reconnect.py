@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import random
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class Backoff:
+    """Exponential backoff with full jitter, so dropped connectors do not reconnect in lockstep"""
+
+    def __init__(self, base=None, cap=None, factor=2):
+        self.base = base if base is not None else getattr(settings, 'TIKTOK_RECONNECT_BASE_DELAY', 1.0)
+        self.cap = cap if cap is not None else getattr(settings, 'TIKTOK_RECONNECT_MAX_DELAY', 60.0)
+        self.factor = factor
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * self.factor ** attempt))
+
+class ReconnectLimiter:
+    """Caps how many connectors may be reconnecting to TikTok at the same time"""
+
+    def __init__(self, limit=None):
+        self.limit = limit or getattr(settings, 'TIKTOK_MAX_CONCURRENT_RECONNECTS', 5)
+        self.active = 0
+        self.peak = 0
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def __aenter__(self):
+        await self._ensure_semaphore().acquire()
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._semaphore.release()
+
+# Global instance
+reconnect_limiter = ReconnectLimiter()
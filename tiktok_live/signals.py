@@ -0,0 +1,68 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from .models import TikTokAccount, LiveStream, TTSSettings, PointsSettings, Event, Action, AutoResponse, AutomationTrigger, ChatbotMessage
+from .stream_context import stream_contexts
+from .event_rules import event_rules
+from .keyword_matcher import keyword_matchers
+from .tts_listeners import tts_listeners
+from .tts_templates import template_speech
+
+@receiver([post_save, post_delete], sender=TikTokAccount)
+def invalidate_account_context(sender, instance, **kwargs):
+    stream_contexts.invalidate(username=instance.username, user_id=instance.user_id, account_id=instance.id)
+    tts_listeners.invalidate_username(instance.username)
+    tts_listeners.invalidate_user(instance.user_id)
+
+@receiver([post_save, post_delete], sender=LiveStream)
+def invalidate_stream_context(sender, instance, **kwargs):
+    stream_contexts.invalidate(account_id=instance.account_id)
+
+@receiver([post_save, post_delete], sender=TTSSettings)
+@receiver([post_save, post_delete], sender=PointsSettings)
+def invalidate_settings_context(sender, instance, **kwargs):
+    stream_contexts.invalidate(user_id=instance.user_id)
+    if sender is TTSSettings:
+        tts_listeners.invalidate_user(instance.user_id)
+        user_id = instance.user_id
+        transaction.on_commit(lambda: template_speech.prerender_user(user_id))
+
+@receiver([post_save, post_delete], sender=Event)
+def recompile_event_rule(sender, instance, **kwargs):
+    event_rules.event_changed(instance.user_id, instance.id)
+
+@receiver([post_save, post_delete], sender=Action)
+def recompile_action_rules(sender, instance, **kwargs):
+    event_rules.action_changed(instance.user_id, instance.id)
+
+@receiver(m2m_changed, sender=Event.actions.through)
+def recompile_event_actions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        event_rules.event_changed(instance.user_id, instance.id)
+    elif pk_set:
+        for event_id in pk_set:
+            event_rules.event_changed(instance.user_id, event_id)
+    else:
+        # post_clear from the Action side: recompile whatever used it
+        event_rules.action_changed(instance.user_id, instance.id)
+
+@receiver([post_save, post_delete], sender=AutoResponse)
+@receiver([post_save, post_delete], sender=AutomationTrigger)
+def recompile_keywords(sender, instance, **kwargs):
+    keyword_matchers.invalidate(instance.user_id)
+
+@receiver(post_save, sender=Action)
+@receiver(post_save, sender=ChatbotMessage)
+def prerender_tts_template(sender, instance, **kwargs):
+    kind, ident = ('action', instance.id) if sender is Action else ('chatbot', instance.command)
+    template_speech.forget(kind, instance.user_id, ident)
+    if (instance.tts_text if sender is Action else instance.is_active and instance.message_text):
+        user_id = instance.user_id
+        transaction.on_commit(lambda: template_speech.prerender(kind, user_id, ident))
+
+@receiver(post_delete, sender=Action)
+@receiver(post_delete, sender=ChatbotMessage)
+def forget_tts_template(sender, instance, **kwargs):
+    template_speech.forget('action' if sender is Action else 'chatbot', instance.user_id, instance.id if sender is Action else instance.command)
@@ -0,0 +1,100 @@
+import logging
+import weakref
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from .models import TikTokAccount, LiveStream, TTSSettings, PointsSettings
+
+logger = logging.getLogger(__name__)
+
+class StreamContext:
+    """Account, owner, active stream and settings for one connector.
+
+    Everything is resolved with a handful of queries when the connector
+    connects and then read from memory on every event. Model signals mark the
+    context stale and it reloads itself the next time it is used.
+    """
+
+    def __init__(self, username):
+        self.username = username.lower().strip('@')
+        self.account = None
+        self.account_id = None
+        self.user_id = None
+        self.stream_id = None
+        self.tts_settings = None
+        self.points_settings = None
+        self.stale = True
+        self.loaded_at = None
+        stream_contexts.register(self)
+
+    async def ensure_loaded(self):
+        """Reload from the database only if a signal marked this context stale"""
+        if self.stale:
+            await sync_to_async(self._load)()
+        return self
+
+    async def start_stream(self):
+        """Resolve everything and make sure an active LiveStream exists"""
+        await sync_to_async(self._load)(create_stream=True)
+        return self
+
+    async def end_stream(self):
+        """Mark the active LiveStream as ended"""
+        if self.stream_id:
+            await LiveStream.objects.filter(id=self.stream_id).aupdate(is_active=False, ended_at=timezone.now())
+            self.stream_id = None
+
+    def _load(self, create_stream=False):
+        # Clear the flag first so a signal fired while loading triggers another reload
+        self.stale = False
+
+        account = TikTokAccount.objects.filter(username__iexact=self.username).first()
+        self.account = account
+        if account is None:
+            self.account_id = self.user_id = self.stream_id = None
+            self.tts_settings = self.points_settings = None
+            self.loaded_at = timezone.now()
+            return
+
+        self.account_id = account.id
+        self.user_id = account.user_id
+
+        stream = LiveStream.objects.filter(account=account, is_active=True).order_by('-started_at').first()
+        if stream is None and create_stream:
+            stream = LiveStream.objects.create(
+                account=account,
+                stream_id=f"{self.username}_{timezone.now().timestamp()}"
+            )
+            # The insert's own post_save signal marked this context stale; what follows is read after it
+            self.stale = False
+        self.stream_id = stream.id if stream else None
+
+        self.tts_settings = TTSSettings.objects.filter(user_id=self.user_id).first()
+        self.points_settings = PointsSettings.objects.filter(user_id=self.user_id).first()
+        self.loaded_at = timezone.now()
+        logger.info(f"Resolved context for @{self.username}: user {self.user_id}, stream {self.stream_id}")
+
+    def matches(self, username=None, user_id=None, account_id=None):
+        if username is not None and username.lower() == self.username:
+            return True
+        if user_id is not None and user_id == self.user_id:
+            return True
+        if account_id is not None and account_id == self.account_id:
+            return True
+        return False
+
+class StreamContextRegistry:
+    """Tracks live contexts so model signals can invalidate them"""
+
+    def __init__(self):
+        self.contexts = weakref.WeakSet()
+
+    def register(self, context):
+        self.contexts.add(context)
+
+    def invalidate(self, username=None, user_id=None, account_id=None):
+        for context in list(self.contexts):
+            if context.matches(username=username, user_id=user_id, account_id=account_id):
+                context.stale = True
+
+# Global instance
+stream_contexts = StreamContextRegistry()
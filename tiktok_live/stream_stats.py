@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import Dict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import LiveStream
+
+logger = logging.getLogger(__name__)
+
+# Interaction type -> LiveStream counter
+COUNTERS = {
+    'comment': 'total_comments',
+    'gift': 'total_gifts',
+    'like': 'total_likes',
+    'share': 'total_shares',
+    'follow': 'total_follows',
+    'join': 'total_joins',
+}
+
+# Interaction type -> LiveStream sum of the event's count
+UNITS = {
+    'gift': 'total_gift_count',
+    'like': 'total_like_count',
+}
+
+class StreamStats:
+    """Per-stream counters maintained from the event stream.
+
+    Connectors add deltas in memory as events arrive; every ``interval``
+    seconds the streams that changed are checkpointed to their LiveStream row
+    with F() increments, so several workers can add to the same stream.
+    Reading stats is the LiveStream row plus whatever this process has not
+    checkpointed yet, with no scan of StreamInteraction. Each event adds one
+    to its type's counter, so total_gifts and total_likes count events like
+    a row count would; the gifts' repeat counts and the number of likes are
+    summed separately in total_gift_count and total_like_count.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'TIKTOK_STATS_CHECKPOINT_INTERVAL', 5.0)
+        self.deltas: Dict[int, Dict[str, int]] = {}
+        self.viewers: Dict[int, list] = {}
+        self.stats = {'events': 0, 'checkpoints': 0, 'failed': 0}
+        self._loop = None
+        self._worker = None
+        self._lock = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.checkpoint()
+
+    def record(self, stream_id, interaction_type, count=1, gift_value=0):
+        """Count one event; count is likes for like events and the repeat count for gifts"""
+        field = COUNTERS.get(interaction_type)
+        if not stream_id or field is None:
+            return
+        self._ensure_worker()
+        deltas = self.deltas.setdefault(stream_id, {})
+        deltas[field] = deltas.get(field, 0) + 1
+        units = UNITS.get(interaction_type)
+        if units:
+            deltas[units] = deltas.get(units, 0) + count
+        deltas['total_interactions'] = deltas.get('total_interactions', 0) + 1
+        if gift_value:
+            deltas['total_gift_value'] = deltas.get('total_gift_value', 0) + gift_value * count
+        self.stats['events'] += 1
+
+    def record_viewers(self, stream_id, count):
+        """Track the current and peak viewer count from RoomUserSeqEvent"""
+        if not stream_id:
+            return
+        self._ensure_worker()
+        viewers = self.viewers.get(stream_id)
+        if viewers is None:
+            self.viewers[stream_id] = [count, count]
+        else:
+            viewers[0] = count
+            viewers[1] = max(viewers[1], count)
+
+    async def checkpoint(self, stream_id=None):
+        """Write pending counters for one stream, or for all streams"""
+        if self._lock is None:
+            return 0
+
+        written = 0
+        async with self._lock:
+            stream_ids = [stream_id] if stream_id is not None else list(set(self.deltas) | set(self.viewers))
+            for sid in stream_ids:
+                deltas = self.deltas.pop(sid, None)
+                viewers = self.viewers.pop(sid, None)
+                if not deltas and not viewers:
+                    continue
+                try:
+                    await sync_to_async(self._write)(sid, deltas or {}, viewers)
+                    written += 1
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logger.error(f"Failed to checkpoint stats for stream {sid}: {e}")
+                    self._restore(sid, deltas, viewers)
+            if written:
+                self.stats['checkpoints'] += written
+        return written
+
+    def _restore(self, stream_id, deltas, viewers):
+        # Put a failed checkpoint back so the next one retries it
+        if deltas:
+            current = self.deltas.setdefault(stream_id, {})
+            for field, value in deltas.items():
+                current[field] = current.get(field, 0) + value
+        if viewers and stream_id not in self.viewers:
+            self.viewers[stream_id] = viewers
+
+    def _write(self, stream_id, deltas, viewers):
+        updates = {field: F(field) + value for field, value in deltas.items()}
+        if viewers:
+            updates['viewer_count'] = viewers[0]
+            updates['peak_viewers'] = Greatest(F('peak_viewers'), viewers[1])
+        LiveStream.objects.filter(id=stream_id).update(**updates)
+
+    def snapshot(self, stream):
+        """Counters for a LiveStream instance including deltas not yet checkpointed"""
+        fields = list(COUNTERS.values()) + list(UNITS.values()) + ['total_interactions', 'total_gift_value']
+        data = {field: getattr(stream, field) for field in fields}
+        for field, value in self.deltas.get(stream.id, {}).items():
+            data[field] += value
+        viewers = self.viewers.get(stream.id)
+        data['viewer_count'] = viewers[0] if viewers else stream.viewer_count
+        data['peak_viewers'] = max(stream.peak_viewers, viewers[1]) if viewers else stream.peak_viewers
+        return data
+
+    async def close(self):
+        """Checkpoint everything and stop the background task"""
+        await self.checkpoint()
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+
+# Global instance
+stream_stats = StreamStats()
@@ -1,3 +1,1211 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from TikTokLive.events import CommentEvent, DisconnectEvent, FollowEvent, GiftEvent, LikeEvent
+
+from .channel_layers import LocalBrokerChannelLayer, live_group_name, shard_for
+from .connection_manager import GlobalConnectionManager
+from .connector_leases import ConnectorLeases, DatabaseLeaseBackend, LocalLeaseBackend
+from .consumers import LiveStreamConsumer
+from .event_rules import event_rules
+from .interaction_rollups import InteractionRollups, MINUTE
+from .interaction_writer import InteractionWriter
+from .keyword_matcher import KeywordMatcher, KeywordMatcherRegistry
+from .leaderboard import Leaderboard
+from .live_connector import TikTokLiveConnector
+from .live_poller import LiveStatusPoller
+from .live_status import LiveStatusService
+from .models import (
+    Action, ConnectorLease, Event, InteractionRollup, LiveStream, PointsReset, PointsSettings, PointsTransaction,
+    StreamInteraction, TikTokAccount, TTSSettings, UserPoints
+)
+from .piper_tts import TTS, TTSEngine
+from .points_export import LEDGER_FIELDS, TRANSACTION_FIELDS, PointsExport
+from .points_grid import PointsGrid
+from .points_operations import PointsOperations
+from .points_ledger import PointsLedger
+from .reconnect import Backoff, ReconnectLimiter
+from .stream_context import StreamContext
+from .stream_stats import StreamStats
+from .tts_cache import TTSAudioCache
+from .tts_listeners import TTSListenerIndex
+from .tts_queue import TTSQueue
+from .tts_templates import CompiledTemplate, TemplateSpeech
+
+
+class FakeConnector:
+    """Stand-in TikTokLiveConnector whose start() takes a while, like a real TikTok handshake"""
+    started = []
+
+    def __init__(self, username):
+        self.username = username
+        self.is_connected = False
+        self.reconnecting = False
+        self.stopped = False
+
+    async def start(self):
+        FakeConnector.started.append(self.username)
+        await asyncio.sleep(0.05)
+        self.is_connected = True
+
+    async def stop(self, end_stream=True):
+        self.stopped = True
+
+
+class FakeLiveClient:
+    """Stand-in TikTokLiveClient: start() fails while ``failures`` is above zero, drop() fires DisconnectEvent,
+    is_live() answers from ``live``"""
+    failures = 0
+    instances = []
+    live = set()
+    status_checks = 0
+
+    def __init__(self, unique_id):
+        self.unique_id = unique_id
+        self.handlers = {}
+        self.closed = False
+        FakeLiveClient.instances.append(self)
+
+    def on(self, event_type):
+        def decorator(handler):
+            self.handlers.setdefault(event_type, []).append(handler)
+            return handler
+        return decorator
+
+    def remove_all_listeners(self):
+        self.handlers = {}
+
+    async def start(self):
+        if FakeLiveClient.failures > 0:
+            FakeLiveClient.failures -= 1
+            raise Exception('User is offline')
+
+    async def is_live(self, unique_id=None):
+        FakeLiveClient.status_checks += 1
+        return (unique_id or self.unique_id) in FakeLiveClient.live
+
+    async def disconnect(self, close_client=False):
+        self.closed = True
+        await self.drop()
+
+    async def drop(self):
+        for handler in self.handlers.get(DisconnectEvent, ()):
+            await handler(DisconnectEvent())
+
+
+class FakeConsumer:
+    async def send(self, text_data=None, bytes_data=None):
+        pass
+
+
+class ConnectionManagerTests(SimpleTestCase):
+    def setUp(self):
+        FakeConnector.started = []
+        self.manager = GlobalConnectionManager(ConnectorLeases(LocalLeaseBackend()), connector_factory=FakeConnector)
+
+    def tearDown(self):
+        if self.manager._heartbeat_task is not None:
+            self.manager._heartbeat_task.cancel()
+
+    async def test_concurrent_connects_start_one_upstream_client(self):
+        consumers = [FakeConsumer() for _ in range(100)]
+
+        connections = await asyncio.gather(*(
+            self.manager.get_or_create_connection('streamer', consumer) for consumer in consumers
+        ))
+
+        self.assertEqual(FakeConnector.started, ['streamer'])
+        self.assertEqual(len({id(connection) for connection in connections}), 1)
+        self.assertEqual(self.manager.reference_count('streamer'), 100)
+
+        for consumer in consumers:
+            await self.manager.remove_subscriber('streamer', consumer)
+        self.assertTrue(connections[0].stopped)
+        self.assertNotIn('streamer', self.manager.active_connections)
+
+    async def test_holds_keep_connection_open_until_released(self):
+        consumer = FakeConsumer()
+        connection = await self.manager.get_or_create_connection('@Streamer', consumer)
+        await self.manager.get_or_create_connection('streamer', hold='tts_view')
+
+        await self.manager.remove_subscriber('streamer', consumer)
+        self.assertFalse(connection.stopped)
+
+        await self.manager.release_hold('streamer', 'tts_view')
+        self.assertTrue(connection.stopped)
+        self.assertEqual(FakeConnector.started, ['streamer'])
+
+    async def test_stream_commands_share_the_managed_connection(self):
+        consumers = []
+        for _ in range(3):
+            consumer = LiveStreamConsumer()
+            consumer.username = 'streamer'
+            consumer.send = mock.AsyncMock()
+            consumers.append(consumer)
+
+        with mock.patch('tiktok_live.consumers.connection_manager', self.manager):
+            await asyncio.gather(*(consumer.start_stream() for consumer in consumers))
+            connection = consumers[0].connector
+            self.assertEqual(FakeConnector.started, ['streamer'])
+            self.assertTrue(all(consumer.connector is connection for consumer in consumers))
+
+            await consumers[0].reconnect_stream()
+            await consumers[1].stop_stream()
+            self.assertFalse(connection.stopped)
+            self.assertEqual(self.manager.reference_count('streamer'), 2)
+
+            await consumers[0].stop_stream()
+            await consumers[2].stop_stream()
+        self.assertTrue(connection.stopped)
+        self.assertNotIn('streamer', self.manager.active_connections)
+
+    async def test_dead_connection_is_replaced(self):
+        consumer = FakeConsumer()
+        dead = await self.manager.get_or_create_connection('streamer', consumer)
+        # Dropped and not reconnecting
+        dead.is_connected = False
+
+        connection = await self.manager.get_or_create_connection('streamer', FakeConsumer())
+
+        self.assertIsNot(connection, dead)
+        self.assertEqual(FakeConnector.started, ['streamer', 'streamer'])
+        self.assertEqual(self.manager.reference_count('streamer'), 2)
+
+
+class SharedLayerTests(SimpleTestCase):
+    def setUp(self):
+        # Two workers on one broker, a fresh broker per test
+        self.layers = [LocalBrokerChannelLayer(broker=self.id(), shards=4) for _ in range(2)]
+
+    async def test_group_send_reaches_subscribers_on_every_worker(self):
+        channels = []
+        for layer in self.layers:
+            channel = await layer.new_channel()
+            await layer.group_add(live_group_name('@Streamer'), channel)
+            channels.append(channel)
+
+        manager = GlobalConnectionManager(ConnectorLeases(LocalLeaseBackend()))
+        manager._channel_layer = self.layers[0]
+        await manager.broadcast_to_subscribers('streamer', {'type': 'gift', 'gift_name': 'Rose'})
+
+        for layer, channel in zip(self.layers, channels):
+            message = await asyncio.wait_for(layer.receive(channel), timeout=1)
+            self.assertEqual(json.loads(message['text']), {'type': 'gift', 'gift_name': 'Rose'})
+        self.assertEqual(manager.stats['sends'], 1)
+
+    async def test_groups_are_routed_to_the_same_shard_by_every_worker(self):
+        self.assertEqual(shard_for('Streamer_7', 4), shard_for('streamer_7', 4))
+        self.assertEqual(shard_for('anything', 1), 0)
+
+        group = live_group_name('streamer_7')
+        await self.layers[1].group_add(group, await self.layers[1].new_channel())
+
+        shard = shard_for(group, 4)
+        for layer in self.layers:
+            self.assertIn(group, layer.state.shards[shard])
+            self.assertEqual(sum(group in table for table in layer.state.shards), 1)
+
+
+class ConnectorLeaseTests(TestCase):
+    def workers(self, backend):
+        return ConnectorLeases(backend, owner='worker-a', ttl=15), ConnectorLeases(backend, owner='worker-b', ttl=15)
+
+    async def check_acquire_steal_and_release(self, backend, expire):
+        first, second = self.workers(backend)
+
+        self.assertTrue(await first.acquire('streamer'))
+        self.assertTrue(await first.acquire('streamer'))
+        self.assertFalse(await second.acquire('streamer'))
+        self.assertEqual(await first.renew_all(), [])
+
+        # The owner stopped renewing; the lease expires and the other worker takes it over
+        await expire('streamer')
+        self.assertTrue(await second.acquire('streamer'))
+        self.assertEqual(await first.renew_all(), ['streamer'])
+        self.assertFalse(first.owns('streamer'))
+
+        # Releasing a lease someone else holds does nothing
+        await first.release('streamer')
+        self.assertFalse(await first.acquire('streamer'))
+        await second.release('streamer')
+        self.assertTrue(await first.acquire('streamer'))
+
+    async def test_database_backend(self):
+        async def expire(username):
+            await ConnectorLease.objects.filter(username=username).aupdate(expires_at=timezone.now() - timedelta(seconds=1))
+        await self.check_acquire_steal_and_release(DatabaseLeaseBackend(), expire)
+
+    async def test_local_backend(self):
+        backend = LocalLeaseBackend()
+
+        async def expire(username):
+            owner, _ = backend.leases[username]
+            backend.leases[username] = (owner, time.monotonic() - 1)
+        await self.check_acquire_steal_and_release(backend, expire)
+
+
+class ReconnectTests(SimpleTestCase):
+    def setUp(self):
+        FakeLiveClient.failures = 0
+        FakeLiveClient.instances = []
+        self.limiter = ReconnectLimiter(1)
+        self.connector = TikTokLiveConnector(
+            'streamer', client_factory=FakeLiveClient, backoff=Backoff(base=0.001, cap=0.01), limiter=self.limiter
+        )
+        self.messages = []
+
+        async def record(data):
+            self.messages.append(data)
+        self.connector.send_to_websocket = record
+
+    async def test_dropped_connection_reconnects_and_reports_gap(self):
+        await self.connector.start()
+        dropped = self.connector.client
+        FakeLiveClient.failures = 2
+
+        await dropped.drop()
+        self.assertTrue(await self.connector.reconnect_task)
+
+        self.assertEqual([message['type'] for message in self.messages], ['disconnection', 'gap'])
+        self.assertTrue(self.messages[0]['reconnecting'])
+        self.assertEqual(self.messages[1]['attempts'], 3)
+        self.assertGreaterEqual(self.messages[1]['gap_seconds'], 0)
+        self.assertTrue(self.connector.is_connected)
+        self.assertEqual(self.limiter.peak, 1)
+
+    async def test_replaced_clients_are_detached_and_closed(self):
+        await self.connector.start()
+        FakeLiveClient.failures = 2
+
+        await self.connector.client.drop()
+        await self.connector.reconnect_task
+
+        *replaced, current = FakeLiveClient.instances
+        self.assertTrue(all(client.closed and not client.handlers for client in replaced))
+        self.assertFalse(current.closed)
+        # Closing the old clients did not report extra disconnections
+        self.assertEqual([message['type'] for message in self.messages], ['disconnection', 'gap'])
+
+    async def test_giving_up_evicts_the_connector(self):
+        manager = GlobalConnectionManager(ConnectorLeases(LocalLeaseBackend()), connector_factory=lambda username: TikTokLiveConnector(
+            username, client_factory=FakeLiveClient, backoff=Backoff(base=0.001, cap=0.01), limiter=self.limiter
+        ))
+        consumer = FakeConsumer()
+        try:
+            dead = await manager.get_or_create_connection('streamer', consumer)
+            dead.max_reconnect_attempts = 2
+            FakeLiveClient.failures = 100
+
+            await dead.client.drop()
+            self.assertFalse(await dead.reconnect_task)
+            self.assertNotIn('streamer', manager.active_connections)
+            self.assertFalse(manager.leases.owns('streamer'))
+
+            # The subscriber stays registered and gets a fresh connection once the streamer is back
+            FakeLiveClient.failures = 0
+            connection = await manager.get_or_create_connection('streamer', consumer)
+            self.assertIsNot(connection, dead)
+            self.assertTrue(connection.is_connected)
+            self.assertEqual(manager.reference_count('streamer'), 1)
+        finally:
+            manager._heartbeat_task.cancel()
+
+    async def test_stop_cancels_reconnect(self):
+        await self.connector.start()
+        FakeLiveClient.failures = 100
+
+        await self.connector.client.drop()
+        await self.connector.stop(end_stream=False)
+
+        with self.assertRaises(asyncio.CancelledError):
+            await self.connector.reconnect_task
+
+
+class LiveConnectorTests(TestCase):
+    """Events arriving on the live connector reach rules, points and speech"""
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        TikTokAccount.objects.create(user=self.owner, username='streamer')
+        # Ids are reused between tests; drop anything the global caches kept for this one
+        event_rules.discard(self.owner.id)
+        self.ledger = PointsLedger(interval=60)
+        self.leaderboard = Leaderboard(top_gifters=1)
+        for target, value in (('points_ledger', self.ledger), ('leaderboard', self.leaderboard)):
+            patcher = mock.patch(f'tiktok_live.live_connector.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.connector = TikTokLiveConnector('streamer', client_factory=FakeLiveClient)
+
+    def tearDown(self):
+        if self.ledger._worker is not None:
+            self.ledger._worker.cancel()
+
+    async def fire(self, event_type, **fields):
+        fields.setdefault('user', SimpleNamespace(unique_id='viewer', nickname='Viewer'))
+        for handler in self.connector.client.handlers[event_type]:
+            await handler(SimpleNamespace(**fields))
+
+    def gift(self, name='Rose', coins=5, count=1):
+        return SimpleNamespace(name=name, diamond_count=coins, count=count, streakable=False, streaking=False)
+
+    async def test_events_run_matching_rules(self):
+        action = await Action.objects.acreate(user=self.owner, name='confetti')
+        for fields in (dict(trigger_type='gift', min_coins=5), dict(trigger_type='gift', min_coins=100),
+                       dict(trigger_type='command', custom_command='!dance'),
+                       dict(trigger_type='follow', user_type='specific', specific_user='someone_else')):
+            event = await Event.objects.acreate(user=self.owner, **fields)
+            await event.actions.aadd(action)
+
+        with mock.patch.object(self.connector, 'execute_action') as execute:
+            await self.fire(GiftEvent, gift=self.gift(coins=5))
+            await self.fire(CommentEvent, comment='!dance now')
+            await self.fire(FollowEvent)
+
+        self.assertEqual([call.kwargs for call in execute.call_args_list], [
+            {'gift': mock.ANY}, {'command': '!dance now'}
+        ])
+        self.assertEqual(execute.call_args_list[0].args[1].unique_id, 'viewer')
+
+    async def test_alert_actions_speak_their_template(self):
+        action = await Action.objects.acreate(user=self.owner, name='thanks', tts_text='Thanks {username} for {amount} {giftname}')
+        event = await Event.objects.acreate(user=self.owner, trigger_type='gift', min_coins=1)
+        await event.actions.aadd(action)
+        sent = []
+
+        async def send(data):
+            sent.append(data)
+        self.connector.send_to_websocket = send
+
+        with mock.patch('tiktok_live.live_connector.template_speech.aspeak', return_value={'type': 'tts', 'text': 'spoken'}) as aspeak:
+            await self.fire(GiftEvent, gift=self.gift(count=3))
+
+        aspeak.assert_called_once_with('action', self.owner.id, action.id, {
+            'username': 'viewer', 'nickname': 'Viewer', 'giftname': 'Rose', 'amount': 3, 'coins': 5
+        })
+        self.assertEqual(sent[-1], {'type': 'tts', 'text': 'spoken'})
+
+    async def test_events_earn_points(self):
+        await self.fire(GiftEvent, gift=self.gift(coins=5, count=2))
+        await self.fire(LikeEvent, count=3)
+        await self.fire(CommentEvent, comment='merhaba')
+        await self.connector.flush_interactions()
+
+        row = await UserPoints.objects.aget(user=self.owner, tiktok_username='viewer')
+        # Default rates: 10 per gift, 1 per like, 5 per comment
+        self.assertEqual((row.points_total, row.total_gifts_sent, row.total_coins_spent), (28, 2, 10))
+
+    async def test_live_events_feed_the_leaderboard(self):
+        action = await Action.objects.acreate(user=self.owner, name='crown')
+        event = await Event.objects.acreate(user=self.owner, trigger_type='follow', user_type='topgifter')
+        await event.actions.aadd(action)
+        await self.leaderboard.board(self.owner.id)
+        other = SimpleNamespace(unique_id='other', nickname='Other')
+
+        with mock.patch.object(self.connector, 'speak_template') as speak, \
+                mock.patch.object(self.connector, 'execute_action') as execute:
+            await self.fire(GiftEvent, gift=self.gift(coins=5))
+            await self.fire(GiftEvent, gift=self.gift(coins=1), user=other)
+            await self.fire(CommentEvent, comment='!score')
+            await self.fire(FollowEvent, user=other)
+            await self.fire(FollowEvent)
+
+        # 10 for the gift and 5 for the !score comment itself
+        speak.assert_called_once_with('chatbot', 'points_info_top100', {'username': 'viewer', 'points': 15, 'level': 1, 'rank': 1})
+        # Only the top gifter triggers the top-gifter rule
+        self.assertEqual([call.args[1].unique_id for call in execute.call_args_list], ['viewer'])
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def matcher(self):
+        return KeywordMatcher(
+            [SimpleNamespace(id=1, trigger_keywords='merhaba, selam', response_message='Hoş geldin', cooldown_seconds=30)],
+            [SimpleNamespace(id=2, trigger_value='istanbul, ol', action_type='tts', action_value='', name='city')]
+        )
+
+    def keywords(self, comment):
+        return sorted(rule.keyword for rule in self.matcher().find(comment))
+
+    def test_suffixed_forms_match(self):
+        self.assertEqual(self.keywords('merhabalar herkese'), ['merhaba'])
+        self.assertEqual(self.keywords('Selamlar!'), ['selam'])
+        # Keywords of one auto response fire it once
+        self.assertEqual(len(self.keywords('selam, merhaba')), 1)
+
+    def test_keyword_inside_a_word_does_not_match(self):
+        self.assertEqual(self.keywords('kolay gelsin'), [])
+        self.assertEqual(self.keywords('esselam'), [])
+        self.assertEqual(self.keywords('bu çok kolay, ol artık'), ['ol'])
+
+    def test_turkish_case_folding(self):
+        for comment in ('İSTANBUL', 'ISTANBUL', 'ıstanbul', 'İstanbul’dan geliyorum'):
+            self.assertEqual(self.keywords(comment), ['istanbul'], comment)
+
+    async def test_registry_applies_cooldowns(self):
+        registry = KeywordMatcherRegistry()
+        registry.matchers[1] = self.matcher()
+        first = await registry.match(1, 'selam istanbul')
+        cooling = await registry.match(1, 'selam istanbul')
+        registry.last_fired[('auto_response', 1)] -= 31
+        later = await registry.match(1, 'merhaba')
+        self.assertEqual(sorted(rule.kind for rule in first), ['auto_response', 'automation'])
+        # The automation trigger has no cooldown; the auto response waits 30 s
+        self.assertEqual([rule.kind for rule in cooling], ['automation'])
+        self.assertEqual([rule.keyword for rule in later], ['merhaba'])
+
+class TTSQueueTests(SimpleTestCase):
+    def tts_settings(self, **overrides):
+        values = dict(user_id=1, max_queue_length=2, language='tr', voice='default', max_comment_length=200,
+                      default_speed=50, default_pitch=50)
+        values.update(overrides)
+        return SimpleNamespace(**values)
+
+    async def test_stalled_audio_socket_does_not_pin_the_worker(self):
+        def stream(job, emit):
+            for chunk in (b'a', b'b', b'c'):
+                emit(chunk)
+            return {'type': 'tts', 'text': job.text, 'audio_url': '/media/tts/x.mp3'}
+
+        async def stalled_send(username, frame):
+            await asyncio.sleep(60)
+
+        results = []
+
+        async def deliver(result):
+            results.append(result)
+
+        queue = TTSQueue(workers=1, stream_func=stream, streaming=True, send_timeout=0.05)
+        with mock.patch('tiktok_live.connection_manager.connection_manager.has_audio_listeners', return_value=True), \
+                mock.patch('tiktok_live.connection_manager.connection_manager.broadcast_audio', stalled_send):
+            queue.submit(self.tts_settings(), 'viewer', 'merhaba', deliver, streamer='streamer')
+            await asyncio.wait_for(queue.drainers[1], timeout=5)
+
+        self.assertEqual([result['type'] for result in results], ['tts_stream_start', 'tts'])
+        self.assertEqual(queue.stats['stalled'], 1)
+        self.assertEqual(queue.stats['completed'], 1)
+
+    async def test_full_queue_merges_then_drops(self):
+        spoken = []
+
+        async def deliver(result):
+            spoken.append(result['text'])
+
+        queue = TTSQueue(workers=1, synthesize_func=lambda job: {'type': 'tts', 'text': job.text}, streaming=False)
+        tts_settings = self.tts_settings()
+        statuses = [
+            queue.submit(tts_settings, speaker, text, deliver)
+            for speaker, text in (('a', 'one'), ('a', 'two'), ('a', 'three'), ('b', 'four'))
+        ]
+        await asyncio.wait_for(queue.drainers[1], timeout=5)
+
+        self.assertEqual(statuses, ['queued', 'queued', 'merged', 'dropped'])
+        self.assertEqual(spoken, ['one', 'two. three'])
+
+
+class FakeEngine(TTSEngine):
+    def __init__(self, name, audio_format, works=True):
+        self.name = name
+        self.audio_format = audio_format
+        self.works = works
+        self.calls = 0
+
+    def text_to_speech(self, text, output_path, voice="default", language="en", speed=50):
+        self.calls += 1
+        return self.works
+
+
+class TTSFallbackTests(SimpleTestCase):
+    def test_fallback_keeps_the_reported_audio_format(self):
+        tts = TTS()
+        tts.engines = {
+            'piper': FakeEngine('piper', 'wav', works=False),
+            'gtts': FakeEngine('gtts', 'mp3'),
+            'windows': FakeEngine('windows', 'wav'),
+        }
+
+        self.assertEqual(tts.audio_format_for('piper', 'tr-TR'), 'wav')
+        self.assertTrue(tts.text_to_speech('merhaba', '/dev/null', 'piper', 'tr-TR'))
+        # piper failed; the wav fallback rendered, the mp3 engine was never tried
+        self.assertEqual(tts.engines['windows'].calls, 1)
+        self.assertEqual(tts.engines['gtts'].calls, 0)
+
+        tts.engines['windows'].works = False
+        self.assertFalse(tts.text_to_speech('merhaba', '/dev/null', 'piper', 'tr-TR'))
+        self.assertEqual(tts.engines['gtts'].calls, 0)
+
+
+class TemplateCacheTests(SimpleTestCase):
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        speech = TemplateSpeech()
+        texts = iter(['Thanks {username}!', 'Welcome {username}!'])
+
+        def load(kind, user_id, ident):
+            text = next(texts)
+            if text.startswith('Thanks'):
+                # The template is edited while the old row is being compiled
+                speech.forget(kind, user_id, ident)
+            return CompiledTemplate(user_id, text, 'tr-TR', 'default', 50, 50)
+        speech._load = load
+
+        self.assertEqual(speech.get('action', 1, 7).text, 'Thanks {username}!')
+        self.assertEqual(speech.get('action', 1, 7).text, 'Welcome {username}!')
+        self.assertEqual(speech.metrics()['templates'], 1)
+
+
+class StreamContextTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.account = TikTokAccount.objects.create(user=self.owner, username='Streamer')
+
+    async def test_resolved_once_then_reloaded_after_a_change(self):
+        context = await StreamContext('@streamer').start_stream()
+        self.assertEqual((context.account_id, context.user_id), (self.account.id, self.owner.id))
+        self.assertIsNotNone(context.stream_id)
+        self.assertIsNone(context.points_settings)
+
+        # Events read the context from memory until a signal marks it stale
+        with mock.patch.object(context, '_load') as load:
+            await context.ensure_loaded()
+        load.assert_not_called()
+        settings = await PointsSettings.objects.acreate(user=self.owner, points_per_follow=7)
+        self.assertTrue(context.stale)
+        await context.ensure_loaded()
+        self.assertEqual(context.points_settings.id, settings.id)
+
+        stream_id = context.stream_id
+        await context.end_stream()
+        stream = await LiveStream.objects.aget(id=stream_id)
+        self.assertFalse(stream.is_active)
+
+
+class TTSListenerIndexTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.guest = User.objects.create(username='guest')
+        TikTokAccount.objects.create(user=self.owner, username='streamer')
+        self.owner_tts = TTSSettings.objects.create(user=self.owner, is_enabled=True)
+        self.guest_tts = TTSSettings.objects.create(user=self.guest, is_enabled=True)
+        self.index = TTSListenerIndex()
+        patcher = mock.patch('tiktok_live.signals.tts_listeners', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def listeners(self):
+        return {settings.user_id for settings in await self.index.get('@Streamer')}
+
+    async def test_owners_and_explicit_listeners(self):
+        self.assertEqual(await self.listeners(), {self.owner.id})
+        with mock.patch.object(self.index, '_build') as build:
+            await self.index.get('streamer')
+        build.assert_not_called()
+
+        # Two connections attach the guest; it stays until both detach
+        self.index.add_listener('streamer', self.guest.id)
+        self.index.add_listener('streamer', self.guest.id)
+        self.assertEqual(await self.listeners(), {self.owner.id, self.guest.id})
+        self.index.remove_listener('streamer', self.guest.id)
+        self.assertEqual(await self.listeners(), {self.owner.id, self.guest.id})
+        self.index.remove_listener('streamer', self.guest.id)
+        self.assertEqual(await self.listeners(), {self.owner.id})
+
+    async def test_settings_change_drops_the_entry(self):
+        self.assertEqual(await self.listeners(), {self.owner.id})
+        self.owner_tts.is_enabled = False
+        await self.owner_tts.asave()
+        self.assertNotIn('streamer', self.index.entries)
+        self.assertEqual(await self.listeners(), set())
+
+
+class TTSAudioCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rendered = []
+
+    def cache(self, **limits):
+        return TTSAudioCache(root=self.tmp.name, **limits)
+
+    def render(self, path):
+        self.rendered.append(path)
+        with open(path, 'wb') as audio:
+            audio.write(b'ID3 audio')
+        return True
+
+    def files(self):
+        return sorted(name for _, _, names in os.walk(self.tmp.name) for name in names)
+
+    def test_key_covers_every_audio_setting(self):
+        key = TTSAudioCache.key('Merhaba', 'tr-TR')
+        self.assertEqual(key, TTSAudioCache.key('Merhaba', 'tr-TR', 'default', 50, 50, 'mp3'))
+        self.assertEqual(len(key), 64)
+        variants = [
+            ('merhaba', 'tr-TR'), ('Merhaba', 'en-US'), ('Merhaba', 'tr-TR', 'other'),
+            ('Merhaba', 'tr-TR', 'default', 60), ('Merhaba', 'tr-TR', 'default', 50, 40),
+            ('Merhaba', 'tr-TR', 'default', 50, 50, 'wav')
+        ]
+        self.assertEqual(len({TTSAudioCache.key(*args) for args in variants} | {key}), len(variants) + 1)
+
+    def test_render_once_then_hit(self):
+        cache = self.cache()
+        url, hit = cache.get_or_render(self.render, 'Merhaba', 'tr-TR')
+        self.assertFalse(hit)
+        self.assertEqual(cache.get_or_render(self.render, 'Merhaba', 'tr-TR'), (url, True))
+        self.assertEqual(len(self.rendered), 1)
+        key = TTSAudioCache.key('Merhaba', 'tr-TR')
+        self.assertTrue(url.endswith(f'tts/{key[:2]}/{key}.mp3'))
+
+    def test_failed_render_publishes_nothing(self):
+        cache = self.cache()
+
+        def partial(path):
+            with open(path, 'wb') as audio:
+                audio.write(b'half')
+            raise RuntimeError('engine crashed')
+
+        self.assertEqual(cache.get_or_render(partial, 'Merhaba', 'tr-TR'), (None, False))
+        self.assertEqual(cache.get_or_render(lambda path: False, 'Merhaba', 'tr-TR'), (None, False))
+        # Neither the partial temp file nor a published file is left behind
+        self.assertEqual(self.files(), [])
+        self.assertEqual(cache.metrics()['failures'], 2)
+
+    def test_least_recently_used_file_is_evicted(self):
+        cache = self.cache(max_files=2)
+        cache.get_or_render(self.render, 'a', 'tr-TR')
+        cache.get_or_render(self.render, 'b', 'tr-TR')
+        cache.get_or_render(self.render, 'a', 'tr-TR')
+        cache.get_or_render(self.render, 'c', 'tr-TR')
+
+        kept = {TTSAudioCache.key(text, 'tr-TR') + '.mp3' for text in 'ac'}
+        self.assertEqual(set(self.files()), kept)
+        self.assertEqual(cache.metrics()['evictions'], 1)
+        # A new cache rebuilds the same entries from disk
+        reloaded = self.cache(max_files=2)
+        reloaded.get_or_render(self.render, 'a', 'tr-TR')
+        self.assertEqual(reloaded.metrics()['files'], 2)
+
+    def test_concurrent_requests_share_one_render(self):
+        cache = self.cache()
+        started, release = threading.Event(), threading.Event()
+        active, peak = [0], [0]
+
+        def render(path):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            started.set()
+            release.wait(5)
+            active[0] -= 1
+            # The first render fails, so a waiter has to render again under the same lock
+            if not self.rendered:
+                self.rendered.append(path)
+                return False
+            return self.render(path)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_render(render, 'Merhaba', 'tr-TR'))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while cache.key_locks[TTSAudioCache.key('Merhaba', 'tr-TR')][1] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(peak[0], 1)
+        self.assertEqual(len(self.rendered), 2)
+        self.assertEqual(sorted(hit for _, hit in results), [False, False, True, True])
+        self.assertEqual(cache.key_locks, {})
+
+class HoldRecorder:
+    """Stand-in connection manager that records which usernames the poller holds open"""
+    def __init__(self):
+        self.holds = set()
+
+    async def get_or_create_connection(self, username, consumer=None, hold=None):
+        self.holds.add(username)
+
+    async def release_hold(self, username, hold):
+        self.holds.discard(username)
+
+
+class LiveStatusBatchTests(SimpleTestCase):
+    def setUp(self):
+        FakeLiveClient.live = {'live_one'}
+        FakeLiveClient.status_checks = 0
+        self.service = LiveStatusService(ttl=60, client_factory=FakeLiveClient)
+        patcher = mock.patch('tiktok_live.live_status.live_status', self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batch_checks_each_username_once_and_caches(self):
+        url = reverse('tiktok_live:check_live_status_batch')
+        response = self.client.get(url, {'usernames': '@Live_One,offline,live_one,,'})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(r['username'], r['is_live'], r['source']) for r in body['results']],
+                         [('live_one', True, 'tiktok'), ('offline', False, 'tiktok')])
+        self.assertEqual(body['live'], ['live_one'])
+        self.assertEqual(FakeLiveClient.status_checks, 2)
+
+        response = self.client.post(url, json.dumps({'usernames': ['offline', 'live_one']}), content_type='application/json')
+        self.assertEqual([r['source'] for r in response.json()['results']], ['cache', 'cache'])
+        self.assertEqual(FakeLiveClient.status_checks, 2)
+
+    @override_settings(TIKTOK_LIVE_STATUS_BATCH_MAX=2)
+    def test_bad_batches_are_rejected(self):
+        url = reverse('tiktok_live:check_live_status_batch')
+        self.assertEqual(self.client.get(url, {'usernames': 'a,b,c'}).status_code, 400)
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(FakeLiveClient.status_checks, 0)
+
+    async def test_concurrent_checks_share_one_request(self):
+        results = await asyncio.gather(*(self.service.check('live_one') for _ in range(10)))
+
+        self.assertTrue(all(result['is_live'] for result in results))
+        self.assertEqual(FakeLiveClient.status_checks, 1)
+        self.assertEqual(self.service.stats['coalesced'], 9)
+
+
+class LiveStatusPollerTests(TestCase):
+    def setUp(self):
+        FakeLiveClient.live = set()
+        FakeLiveClient.status_checks = 0
+        owner = User.objects.create(username='owner')
+        self.accounts = TikTokAccount.objects.bulk_create([
+            TikTokAccount(user=owner, username=f'poll_{i}', enable_monitoring=i % 2 == 0) for i in range(6)
+        ])
+        self.manager = HoldRecorder()
+
+    def poller(self, **options):
+        status = LiveStatusService(ttl=0, concurrency=2, client_factory=FakeLiveClient)
+        return LiveStatusPoller(status=status, manager=self.manager, interval=60, autostart=True, **options)
+
+    async def live_usernames(self):
+        return {username async for username in TikTokAccount.objects.filter(is_live=True).values_list('username', flat=True)}
+
+    async def test_poll_flips_flags_and_holds_monitored_accounts(self):
+        poller = self.poller(idle_every=1)
+
+        FakeLiveClient.live = {'poll_0', 'poll_1', 'poll_2'}
+        summary = await poller.poll_once()
+        self.assertEqual(sorted(summary['went_live']), ['poll_0', 'poll_1', 'poll_2'])
+        self.assertEqual(await self.live_usernames(), {'poll_0', 'poll_1', 'poll_2'})
+        self.assertEqual(self.manager.holds, {'poll_0', 'poll_2'})
+        self.assertEqual(FakeLiveClient.status_checks, 6)
+
+        FakeLiveClient.live = {'poll_2', 'poll_3'}
+        poller.status.results.clear()
+        summary = await poller.poll_once()
+        self.assertEqual(summary['went_live'], ['poll_3'])
+        self.assertEqual(sorted(summary['went_offline']), ['poll_0', 'poll_1'])
+        self.assertEqual(await self.live_usernames(), {'poll_2', 'poll_3'})
+        self.assertEqual(self.manager.holds, {'poll_2'})
+
+    async def test_idle_accounts_are_checked_every_few_cycles(self):
+        await LiveStream.objects.acreate(account=self.accounts[4], stream_id='recent', is_active=False)
+        poller = self.poller(idle_every=3)
+
+        first = await poller.poll_once()
+        second = await poller.poll_once()
+
+        self.assertEqual((first['checked'], first['idle_included']), (6, True))
+        # Only the account that streamed recently is checked between full cycles
+        self.assertEqual((second['checked'], second['idle_included']), (1, False))
+
+
+class InteractionWriterTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        account = TikTokAccount.objects.create(user=owner, username='streamer')
+        self.stream = LiveStream.objects.create(account=account, stream_id='writer')
+        self.writer = InteractionWriter(batch_size=2, flush_interval=60, max_pending=10)
+
+    def tearDown(self):
+        if self.writer._worker is not None:
+            self.writer._worker.cancel()
+
+    async def test_failed_batch_is_written_on_the_next_flush(self):
+        for i in range(3):
+            await self.writer.enqueue(self.stream.id, 'comment', f'viewer_{i}', message=str(i))
+
+        with mock.patch.object(self.writer, '_write', side_effect=Exception('database is locked')):
+            self.assertEqual(await self.writer.flush(self.stream.id), 0)
+        self.assertEqual((self.writer.pending, self.writer.stats['failed']), (3, 3))
+
+        await self.writer.enqueue(self.stream.id, 'comment', 'viewer_3', message='3')
+        self.assertEqual(await self.writer.flush(self.stream.id), 4)
+
+        messages = [m async for m in StreamInteraction.objects.filter(stream=self.stream).order_by('id').values_list('message', flat=True)]
+        self.assertEqual(messages, ['0', '1', '2', '3'])
+        self.assertEqual(self.writer.pending, 0)
+
+    async def test_retried_rows_stay_under_the_backpressure_limit(self):
+        for i in range(3):
+            await self.writer.enqueue(self.stream.id, 'comment', f'viewer_{i}', message=str(i))
+        self.writer.max_pending = 3
+
+        with mock.patch.object(self.writer, '_write', side_effect=Exception('database is locked')):
+            await self.writer.flush(self.stream.id)
+
+        # The oldest row goes so enqueue() is not blocked while the database is down
+        self.assertEqual([row.message for row in self.writer.buffers[self.stream.id]], ['1', '2'])
+        self.assertEqual((self.writer.pending, self.writer.stats['dropped']), (2, 1))
+
+
+class InteractionRollupTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        account = TikTokAccount.objects.create(user=owner, username='streamer')
+        self.stream = LiveStream.objects.create(account=account, stream_id='rollups')
+        self.rollups = InteractionRollups()
+        self.now = time.time()
+
+    def tearDown(self):
+        if self.rollups._worker is not None:
+            self.rollups._worker.cancel()
+
+    async def minute_row(self):
+        return await InteractionRollup.objects.aget(stream=self.stream, resolution=MINUTE)
+
+    async def test_bucket_written_in_parts_counts_each_chatter_once(self):
+        for username in ('a', 'b'):
+            self.rollups.record(self.stream.id, 'comment', username, at=self.now)
+        await self.rollups.flush(self.stream.id)
+        for username in ('a', 'c'):
+            self.rollups.record(self.stream.id, 'comment', username, at=self.now)
+        await self.rollups.flush(self.stream.id)
+
+        row = await self.minute_row()
+        self.assertEqual((row.comments, row.unique_chatters), (4, 3))
+
+    async def test_failed_write_is_retried(self):
+        self.rollups.record(self.stream.id, 'comment', 'a', at=self.now)
+        self.rollups.record(self.stream.id, 'gift', 'b', count=2, gift_value=5, at=self.now)
+
+        with mock.patch.object(self.rollups, '_write', side_effect=Exception('database is locked')):
+            self.assertEqual(await self.rollups.flush(self.stream.id), 0)
+        self.assertEqual(await self.rollups.flush(self.stream.id), 2)
+
+        row = await self.minute_row()
+        self.assertEqual((row.comments, row.gifts, row.coins, row.unique_chatters), (1, 2, 10, 1))
+
+
+class StreamStatsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        account = TikTokAccount.objects.create(user=self.owner, username='streamer')
+        self.stream = LiveStream.objects.create(account=account, stream_id='stats')
+        self.stats = StreamStats(interval=3600)
+
+    def tearDown(self):
+        if self.stats._worker is not None:
+            self.stats._worker.cancel()
+
+    async def record(self, rows=True):
+        events = [('comment', 1, 0), ('comment', 1, 0), ('gift', 3, 5), ('like', 15, 0), ('like', 5, 0)]
+        for interaction_type, count, gift_value in events:
+            self.stats.record(self.stream.id, interaction_type, count, gift_value)
+            if rows and interaction_type != 'like':
+                await StreamInteraction.objects.acreate(stream=self.stream, interaction_type=interaction_type, username='viewer',
+                                                        gift_count=count, gift_value=gift_value)
+        self.stats.record_viewers(self.stream.id, 40)
+        self.stats.record_viewers(self.stream.id, 25)
+
+    async def test_snapshot_matches_the_checkpointed_row(self):
+        await self.record()
+        pending = self.stats.snapshot(self.stream)
+        self.assertEqual(await self.stats.checkpoint(self.stream.id), 1)
+        stored = self.stats.snapshot(await LiveStream.objects.aget(id=self.stream.id))
+        self.assertEqual(pending, stored)
+
+        # Event counters agree with a scan of the stored rows; likes and gift repeats are summed separately
+        rows = StreamInteraction.objects.filter(stream=self.stream)
+        self.assertEqual(stored['total_comments'], await rows.filter(interaction_type='comment').acount())
+        self.assertEqual(stored['total_gifts'], await rows.filter(interaction_type='gift').acount())
+        self.assertEqual((stored['total_gift_count'], stored['total_gift_value']), (3, 15))
+        self.assertEqual((stored['total_likes'], stored['total_like_count']), (2, 20))
+        self.assertEqual((stored['total_interactions'], stored['viewer_count'], stored['peak_viewers']), (5, 25, 40))
+
+    async def test_failed_checkpoint_is_retried(self):
+        await self.record()
+        with mock.patch.object(self.stats, '_write', side_effect=Exception('database is locked')):
+            self.assertEqual(await self.stats.checkpoint(self.stream.id), 0)
+        self.stats.record(self.stream.id, 'like', 10)
+        await self.stats.checkpoint(self.stream.id)
+
+        stream = await LiveStream.objects.aget(id=self.stream.id)
+        self.assertEqual((stream.total_likes, stream.total_like_count, stream.peak_viewers), (3, 30, 40))
+
+    def test_stats_views_keep_event_counts(self):
+        asyncio.run(self.record(rows=False))
+        self.client.force_login(self.owner)
+        with mock.patch('tiktok_live.views.stream_stats', self.stats):
+            data = self.client.get(reverse('tiktok_live:get_stream_stats', args=[self.stream.id])).json()
+            page = self.client.get(reverse('tiktok_live:interactions', args=[self.stream.id]), {'type': 'like'})
+
+        self.assertEqual((data['total_likes'], data['total_like_count']), (2, 20))
+        self.assertEqual((data['total_gifts'], data['total_gift_count']), (1, 3))
+        self.assertEqual(page.context['stats']['total'], 2)
+        self.assertEqual((page.context['stats']['likes'], page.context['stats']['like_count']), (2, 20))
+
+
+class StreamInteractionQueryPlanTests(TestCase):
+    """The hot StreamInteraction queries must be served by their composite indexes, without a sort"""
+
+    @classmethod
+    def setUpTestData(cls):
+        types = ['comment', 'gift', 'follow', 'share', 'join', 'like']
+        cls.owner = User.objects.create(username='owner')
+        account = TikTokAccount.objects.create(user=cls.owner, username='streamer')
+        streams = LiveStream.objects.bulk_create([
+            LiveStream(account=account, stream_id=f'plans_{i}', is_active=False) for i in range(20)
+        ])
+        cls.stream = streams[0]
+        StreamInteraction.objects.bulk_create([
+            StreamInteraction(stream=streams[i % 20], user=cls.owner, interaction_type=types[i % len(types)],
+                              username=f'viewer_{i % 500}')
+            for i in range(5000)
+        ])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_lastx_widget_uses_user_type_index(self):
+        # lastx_views.lastx_widget
+        queryset = StreamInteraction.objects.filter(user_id=self.owner.id, interaction_type='gift').order_by('-timestamp')[:1]
+        self.assertUsesIndex(queryset, 'interaction_user_type_idx')
+
+    def test_interactions_page_uses_stream_type_index(self):
+        # views.interactions filtered by type
+        queryset = StreamInteraction.objects.filter(stream=self.stream, interaction_type='comment').order_by('-timestamp')[:100]
+        self.assertUsesIndex(queryset, 'interaction_stream_type_idx')
+
+
+class PointsLedgerTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.ledger = PointsLedger(interval=60)
+
+    def tearDown(self):
+        if self.ledger._worker is not None:
+            self.ledger._worker.cancel()
+
+    async def test_gifts_without_points_still_count_coins(self):
+        # e.g. the points system is switched off: the gift earns nothing but its coins were spent
+        self.ledger.record(self.owner.id, 'viewer', 'gift', 0, gifts=2, coins=50)
+        self.ledger.record(self.owner.id, 'viewer', 'like', 3)
+        await self.ledger.flush()
+
+        row = await UserPoints.objects.aget(user=self.owner, tiktok_username='viewer')
+        self.assertEqual((row.points_total, row.total_gifts_sent, row.total_coins_spent), (3, 2, 50))
+        types = [t async for t in PointsTransaction.objects.filter(user_points=row).values_list('transaction_type', flat=True)]
+        self.assertEqual(types, ['like'])
+
+    def test_events_with_nothing_to_record_are_ignored(self):
+        self.ledger.record(self.owner.id, 'viewer', 'like', 0)
+        self.assertEqual(self.ledger.pending, {})
+
+
+class PointsOperationsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.other = User.objects.create(username='other')
+        for user in (self.owner, self.other):
+            viewers = UserPoints.objects.bulk_create([
+                UserPoints(user=user, tiktok_username=f'viewer_{i}', points_total=100, points_level=40, level=3) for i in range(50)
+            ])
+            PointsTransaction.objects.bulk_create([
+                PointsTransaction(user_points=viewer, transaction_type='like', points_change=1) for viewer in viewers for _ in range(2)
+            ])
+
+    def test_reset_all_is_set_based(self):
+        # count, one range lookup, two DELETEs and the audit row (plus the savepoint pair), whatever the ledger size
+        with self.assertNumQueries(7):
+            audit = PointsOperations().reset(self.owner, 'all')
+
+        self.assertEqual((audit.affected_users, audit.deleted_transactions), (50, 100))
+        self.assertFalse(UserPoints.objects.filter(user=self.owner).exists())
+        self.assertEqual(PointsTransaction.objects.filter(user_points__user=self.other).count(), 100)
+
+    def test_reset_all_in_chunks_reports_progress(self):
+        progress = []
+        audit = PointsOperations(chunk_size=20).reset(self.owner, 'all', progress=lambda done, total: progress.append(done))
+
+        self.assertEqual(progress, [20, 40, 50])
+        self.assertEqual(audit.deleted_transactions, 100)
+        self.assertEqual(UserPoints.objects.filter(user=self.other).count(), 50)
+
+    def test_reset_points_only_keeps_viewers(self):
+        PointsOperations(chunk_size=20).reset(self.owner, 'points_only')
+
+        self.assertEqual(set(UserPoints.objects.filter(user=self.owner).values_list('points_total', 'points_level', 'level')), {(0, 0, 1)})
+        self.assertEqual(PointsTransaction.objects.filter(user_points__user=self.owner).count(), 100)
+        self.assertEqual(PointsReset.objects.get(user=self.owner).affected_users, 50)
+
+    def test_halving_adjusts_points_but_keeps_levels(self):
+        # count, one range lookup, one UPDATE and the audit row (plus the savepoint pair)
+        with self.assertNumQueries(6):
+            audit = PointsOperations().halve(self.owner, 50)
+
+        self.assertEqual(audit.affected_users, 50)
+        self.assertEqual(set(UserPoints.objects.filter(user=self.owner).values_list('points_total', 'points_level', 'level')), {(50, 20, 3)})
+        self.assertEqual(set(UserPoints.objects.filter(user=self.other).values_list('points_total', flat=True)), {100})
+
+        PointsOperations(chunk_size=20).halve(self.owner, 33)
+        # Integer arithmetic truncates: 50 * 67 / 100 = 33
+        self.assertEqual(set(UserPoints.objects.filter(user=self.owner).values_list('points_total', flat=True)), {33})
+
+        for percentage in (0, 101):
+            with self.assertRaises(ValueError):
+                PointsOperations().halve(self.owner, percentage)
+
+
+class PointsGridTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner')
+        UserPoints.objects.bulk_create([
+            UserPoints(user=cls.owner, tiktok_username=f'viewer_{i:02d}', points_total=i % 7) for i in range(25)
+        ])
+
+    def test_keyset_pages_cover_every_row_once(self):
+        grid = PointsGrid(page_size=10)
+        seen, cursor = [], None
+        while True:
+            page = grid.page(self.owner.id, sort='points_total', order='desc', cursor=cursor)
+            seen.extend(row.tiktok_username for row in page['rows'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), [f'viewer_{i:02d}' for i in range(25)])
+
+    def test_count_is_cached_across_pages(self):
+        grid = PointsGrid(page_size=10)
+        # Views pass the whole query string, cursor and limit included
+        first = grid.page(self.owner.id, filters={'limit': '10', 'username': '@Viewer_1'})
+        grid.page(self.owner.id, cursor=first['next_cursor'], filters={'limit': '10', 'cursor': first['next_cursor'], 'username': 'viewer_1'})
+
+        self.assertEqual(first['total'], 10)
+        self.assertEqual((grid.stats['count_misses'], grid.stats['count_hits']), (1, 1))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.leaderboard = Leaderboard(top_gifters=1)
+
+    async def test_new_streamer_board_is_kept_and_updated_from_the_first_event(self):
+        board = await self.leaderboard.board(self.owner.id)
+        self.assertEqual(len(board.points), 0)
+
+        self.leaderboard.record(self.owner.id, 'viewer', points=5, coins=10)
+        self.leaderboard.record(self.owner.id, 'other', points=8)
+
+        self.assertEqual(await self.leaderboard.rank(self.owner.id, 'points', 'viewer'), 2)
+        self.assertTrue(await self.leaderboard.is_top_gifter(self.owner.id, 'viewer'))
+        self.assertEqual(self.leaderboard.stats['loads'], 1)
+
+    async def test_unknown_accounts_are_not_kept(self):
+        await self.leaderboard.board(self.owner.id + 1000)
+        self.assertNotIn(self.owner.id + 1000, self.leaderboard.boards)
+
+
+class PointsExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = User.objects.create(username='source')
+        cls.target = User.objects.create(username='target')
+        cls.then = datetime(2025, 3, 4, 5, 6, 7, tzinfo=dt_timezone.utc)
+        viewers = UserPoints.objects.bulk_create([
+            UserPoints(user=cls.source, tiktok_username=f'viewer_{i}', points_total=i * 10, total_coins_spent=i) for i in range(5)
+        ])
+        PointsTransaction.objects.bulk_create([
+            PointsTransaction(user_points=viewer, transaction_type='gift', points_change=5, description='Rose, "x2"\nthanks')
+            for viewer in viewers
+        ])
+        UserPoints.objects.filter(user=cls.source).update(first_activity=cls.then, last_activity=cls.then)
+        PointsTransaction.objects.filter(user_points__user=cls.source).update(created_at=cls.then)
+        UserPoints.objects.create(user=cls.target, tiktok_username='viewer_1', points_total=1)
+
+    def setUp(self):
+        self.exporter = PointsExport(chunk_size=2, batch_size=2)
+
+    def export(self, rows, fields, fmt, compress=False):
+        return io.BytesIO(b''.join(self.exporter.encode(rows, fields, fmt, compress)))
+
+    def test_round_trip_keeps_totals_and_timestamps(self):
+        ledger = self.export(self.exporter.ledger_rows(self.source.id), LEDGER_FIELDS, 'csv')
+        counts = self.exporter.import_ledger(self.target, self.exporter.read(ledger, 'csv'), on_conflict='add')
+        self.assertEqual(counts, {'created': 4, 'merged': 1, 'skipped': 0})
+
+        transactions = self.export(self.exporter.transaction_rows(self.source.id), TRANSACTION_FIELDS, 'ndjson', compress=True)
+        counts = self.exporter.import_transactions(self.target, self.exporter.read(transactions, 'ndjson'))
+        self.assertEqual(counts, {'created': 5, 'skipped': 0})
+
+        viewer = UserPoints.objects.get(user=self.target, tiktok_username='viewer_3')
+        self.assertEqual((viewer.points_total, viewer.first_activity, viewer.last_activity), (30, self.then, self.then))
+        self.assertEqual(UserPoints.objects.get(user=self.target, tiktok_username='viewer_1').points_total, 11)
+        transaction = PointsTransaction.objects.filter(user_points=viewer).get()
+        self.assertEqual((transaction.created_at, transaction.description), (self.then, 'Rose, "x2"\nthanks'))
+
+    def test_exported_dates_are_inserted_without_a_second_pass(self):
+        rows = [
+            {'tiktok_username': 'dated', 'first_activity': self.then.isoformat(), 'last_activity': self.then.isoformat()},
+            {'tiktok_username': 'undated', 'points_total': '5'},
+        ]
+        started = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            self.exporter.import_ledger(self.target, iter(rows))
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+
+        dated = UserPoints.objects.get(user=self.target, tiktok_username='dated')
+        undated = UserPoints.objects.get(user=self.target, tiktok_username='undated')
+        self.assertEqual((dated.first_activity, dated.last_activity), (self.then, self.then))
+        self.assertGreaterEqual(undated.first_activity, started)
+        # Outside an import, saving stamps the time as before
+        dated.save()
+        self.assertGreaterEqual(dated.last_activity, started)
+
+    def test_repeated_viewers_in_a_file_are_skipped(self):
+        rows = [{'tiktok_username': name, 'points_total': '5'} for name in ('new_a', 'new_b', 'new_a', 'new_a')]
+        counts = self.exporter.import_ledger(self.target, iter(rows))
+
+        self.assertEqual(counts, {'created': 2, 'merged': 0, 'skipped': 2})
+
+    def test_unreadable_uploads_are_rejected(self):
+        self.client.force_login(self.target)
+        uploads = [
+            ('ledger.csv.gz', b'\x1f\x8b' + b'not gzip at all', 'csv'),
+            ('transactions.ndjson', json.dumps(['not', 'an', 'object']).encode() + b'\n', 'ndjson'),
+            ('ledger.csv', gzip.compress('tiktok_username\nviewer'.encode('utf-16')), 'csv'),
+        ]
+        for name, content, fmt in uploads:
+            response = self.client.post(reverse('tiktok_live:import_points'), {
+                'file': SimpleUploadedFile(name, content), 'kind': 'ledger', 'format': fmt
+            })
+            self.assertEqual(response.status_code, 400, name)
+            self.assertFalse(response.json()['success'])
@@ -2,7 +2,15 @@ from TikTokLive import TikTokLiveClient
 from TikTokLive.events import *
 import asyncio
 import logging
-from .models import Action, Event, StreamInteraction, LiveStream, UserPoints, PointsTransaction
+from django.conf import settings
+from .event_rules import event_rules
+from .interaction_writer import interaction_writer
+from .stream_stats import stream_stats
+from .interaction_rollups import interaction_rollups
+from .points_ledger import points_ledger, points_for
+from .leaderboard import leaderboard
+from .stream_context import StreamContext
+from .tts_templates import template_speech
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +20,7 @@ class TikTokLiveConnector:
         self.user_id = user_id
         self.client = TikTokLiveClient(unique_id=username)
         self.is_connected = False
+        self.context = StreamContext(username)
         self.setup_event_handlers()
     
     def setup_event_handlers(self):
@@ -21,11 +30,13 @@ class TikTokLiveConnector:
         async def on_connect(event: ConnectEvent):
             logger.info(f"Connected to @{event.unique_id} (Room ID: {event.room_id})")
             self.is_connected = True
+            await self.start_stream()
         
         @self.client.on(DisconnectEvent)
         async def on_disconnect(event: DisconnectEvent):
             logger.info("Disconnected from TikTok Live")
             self.is_connected = False
+            await self.flush_interactions()
         
         @self.client.on(CommentEvent)
         async def on_comment(event: CommentEvent):
@@ -57,8 +68,13 @@ class TikTokLiveConnector:
             # Save interaction
             await self.save_interaction('comment', event.user, event.comment)
             
+            # Award points
+            await self.award_points(event.user.unique_id, 'comment')
+            
             # Check for custom commands
             if event.comment.startswith('!') or event.comment.startswith('/'):
+                if event.comment.strip().lower() == getattr(settings, 'TIKTOK_POINTS_COMMAND', '!score'):
+                    await self.reply_points(event.user.unique_id)
                 await self.check_command_events(event.user, event.comment)
             
             logger.info(f"Comment from @{event.user.unique_id}: {event.comment}")
@@ -75,7 +91,8 @@ class TikTokLiveConnector:
                                       gift_value=event.gift.diamond_count)
             
             # Award points
-            await self.award_points(event.user.unique_id, 'gift', event.gift.diamond_count)
+            await self.award_points(event.user.unique_id, 'gift', event.gift.count,
+                                    coins=event.gift.diamond_count * event.gift.count)
             
             # Check gift events
             await self.check_gift_events(event.user, event.gift)
@@ -91,7 +108,7 @@ class TikTokLiveConnector:
             await self.save_interaction('follow', event.user)
             
             # Award points
-            await self.award_points(event.user.unique_id, 'follow', 50)
+            await self.award_points(event.user.unique_id, 'follow')
             
             # Check follow events
             await self.check_follow_events(event.user)
@@ -107,7 +124,7 @@ class TikTokLiveConnector:
             await self.save_interaction('share', event.user)
             
             # Award points
-            await self.award_points(event.user.unique_id, 'share', 25)
+            await self.award_points(event.user.unique_id, 'share')
             
             # Check share events
             await self.check_share_events(event.user)
@@ -120,10 +137,10 @@ class TikTokLiveConnector:
         """Handle like events"""
         try:
             # Save interaction
-            await self.save_interaction('like', event.user)
+            await self.save_interaction('like', event.user, like_count=event.count)
             
             # Award points
-            await self.award_points(event.user.unique_id, 'like', 1)
+            await self.award_points(event.user.unique_id, 'like', event.count)
             
             # Check like events (batch processing)
             await self.check_like_events(event.user, event.count)
@@ -142,125 +159,126 @@ class TikTokLiveConnector:
         except Exception as e:
             logger.error(f"Error handling join: {e}")
     
+    async def start_stream(self):
+        """Resolve account, settings and the active LiveStream once per connection"""
+        try:
+            await self.context.start_stream()
+            # Load rankings now so top-gifter rules and the points command answer from memory
+            await leaderboard.board(self.user_id)
+        except Exception as e:
+            logger.error(f"Error resolving live stream: {e}")
+    
     async def save_interaction(self, interaction_type, user, message='', **kwargs):
-        """Save interaction to database"""
+        """Queue interaction for the batched database writer"""
         try:
-            # Get or create live stream
-            stream, created = await LiveStream.objects.aget_or_create(
-                account__username=self.username,
-                is_active=True,
-                defaults={'stream_id': f"{self.username}_{timezone.now().timestamp()}"}
-            )
+            await self.context.ensure_loaded()
+            if not self.context.stream_id:
+                return
             
-            # Create interaction
-            await StreamInteraction.objects.acreate(
-                stream=stream,
-                interaction_type=interaction_type,
-                username=user.unique_id,
+            await interaction_writer.enqueue(
+                self.context.stream_id,
+                interaction_type,
+                user.unique_id,
                 display_name=user.display_name or user.unique_id,
                 message=message,
                 gift_name=kwargs.get('gift_name', ''),
                 gift_count=kwargs.get('gift_count', 1),
-                gift_value=kwargs.get('gift_value', 0)
+                gift_value=kwargs.get('gift_value', 0),
+                user_id=self.context.user_id
             )
+            count = kwargs.get('like_count', kwargs.get('gift_count', 1))
+            stream_stats.record(self.context.stream_id, interaction_type, count, kwargs.get('gift_value', 0))
+            interaction_rollups.record(self.context.stream_id, interaction_type, user.unique_id, count, kwargs.get('gift_value', 0))
         except Exception as e:
             logger.error(f"Error saving interaction: {e}")
     
-    async def award_points(self, username, transaction_type, points):
-        """Award points to user"""
+    async def flush_interactions(self):
+        """Write buffered interactions, counters and points for the current stream"""
+        if self.context.stream_id:
+            try:
+                await interaction_writer.flush(self.context.stream_id)
+                await stream_stats.checkpoint(self.context.stream_id)
+                await interaction_rollups.flush(self.context.stream_id)
+            except Exception as e:
+                logger.error(f"Error flushing interactions: {e}")
+        if self.user_id:
+            try:
+                await points_ledger.flush(self.user_id)
+            except Exception as e:
+                logger.error(f"Error flushing points: {e}")
+    
+    async def award_points(self, username, transaction_type, count=1, coins=0):
+        """Add points at the streamer's rates to the ledger; they are written in batches"""
         try:
-            user_points, created = await UserPoints.objects.aget_or_create(
-                user_id=self.user_id,
-                tiktok_username=username,
-                defaults={'points_total': 0, 'level': 1}
-            )
-            
-            user_points.points_total += points
-            user_points.points_level += points
-            
-            # Level up check
-            if user_points.points_level >= 100:
-                user_points.level += 1
-                user_points.points_level = 0
-            
-            await user_points.asave()
-            
-            # Create transaction record
-            await PointsTransaction.objects.acreate(
-                user_points=user_points,
-                transaction_type=transaction_type,
-                points_change=points
+            await self.context.ensure_loaded()
+            points = points_for(self.context.points_settings, transaction_type, count)
+            points_ledger.record(
+                self.user_id, username, transaction_type, points,
+                gifts=count if transaction_type == 'gift' else 0,
+                coins=coins,
+                on_level_up=self.announce_level_up
             )
+            leaderboard.record(self.user_id, username, points, coins)
         except Exception as e:
             logger.error(f"Error awarding points: {e}")
     
+    async def reply_points(self, username):
+        """Answer the points command with the viewer's points, level and rank"""
+        try:
+            board = await leaderboard.board(self.user_id)
+            rank = board.points.rank(username)
+            command = 'points_info_top100' if rank is not None and rank <= 100 else 'points_info_other'
+            await self.speak_template('chatbot', command, {
+                'username': username,
+                'points': board.points.score(username) or 0,
+                'level': board.levels.get(username, 1),
+                'rank': rank or ''
+            })
+        except Exception as e:
+            logger.error(f"Error answering points command: {e}")
+    
+    async def announce_level_up(self, username, level, points):
+        """Speak the chatbot level-up message once a flush has levelled a viewer up"""
+        await self.speak_template('chatbot', 'level_up', {
+            'username': username,
+            'level': level,
+            'points': points
+        })
+    
     async def check_follow_events(self, user):
         """Check and trigger follow events"""
-        events = Event.objects.filter(
-            user_id=self.user_id,
-            trigger_type='follow',
-            is_active=True
-        )
-        
-        async for event in events:
-            if await self.user_matches_event(user, event):
-                await self.execute_event_actions(event, user)
+        rules = await event_rules.get(self.user_id)
+        for rule in rules.match_follow():
+            if await self.user_matches_event(user, rule):
+                await self.execute_event_actions(rule, user)
     
     async def check_gift_events(self, user, gift):
         """Check and trigger gift events"""
-        events = Event.objects.filter(
-            user_id=self.user_id,
-            trigger_type='gift',
-            is_active=True
-        )
-        
-        async for event in events:
-            if await self.user_matches_event(user, event):
-                # Check gift conditions
-                if event.specific_gift and event.specific_gift != gift.name:
-                    continue
-                if gift.diamond_count < event.min_coins:
-                    continue
-                
-                await self.execute_event_actions(event, user, gift=gift)
+        rules = await event_rules.get(self.user_id)
+        for rule in rules.match_gift(gift.name, gift.diamond_count):
+            if await self.user_matches_event(user, rule):
+                await self.execute_event_actions(rule, user, gift=gift)
     
     async def check_like_events(self, user, like_count):
         """Check and trigger like events"""
-        events = Event.objects.filter(
-            user_id=self.user_id,
-            trigger_type='like',
-            is_active=True
-        )
-        
-        async for event in events:
-            if await self.user_matches_event(user, event):
-                if like_count >= event.min_likes:
-                    await self.execute_event_actions(event, user, like_count=like_count)
+        rules = await event_rules.get(self.user_id)
+        for rule in rules.match_like(like_count):
+            if await self.user_matches_event(user, rule):
+                await self.execute_event_actions(rule, user, like_count=like_count)
     
     async def check_share_events(self, user):
         """Check and trigger share events"""
-        events = Event.objects.filter(
-            user_id=self.user_id,
-            trigger_type='share',
-            is_active=True
-        )
-        
-        async for event in events:
-            if await self.user_matches_event(user, event):
-                await self.execute_event_actions(event, user)
+        rules = await event_rules.get(self.user_id)
+        for rule in rules.match_share():
+            if await self.user_matches_event(user, rule):
+                await self.execute_event_actions(rule, user)
     
     async def check_command_events(self, user, command):
         """Check and trigger custom command events"""
-        events = Event.objects.filter(
-            user_id=self.user_id,
-            trigger_type='command',
-            is_active=True
-        )
-        
-        async for event in events:
-            if event.custom_command and command.startswith(event.custom_command):
-                if await self.user_matches_event(user, event):
-                    await self.execute_event_actions(event, user, command=command)
+        rules = await event_rules.get(self.user_id)
+        for rule in rules.match_command(command):
+            if await self.user_matches_event(user, rule):
+                await self.execute_event_actions(rule, user, command=command)
     
     async def user_matches_event(self, user, event):
         """Check if user matches event criteria"""
@@ -269,16 +287,14 @@ class TikTokLiveConnector:
         elif event.user_type == 'specific':
             return user.unique_id == event.specific_user
         elif event.user_type == 'topgifter':
-            # Check if user is in top gifters (simplified)
-            return True  # Implement top gifter logic
+            return await leaderboard.is_top_gifter(self.user_id, user.unique_id)
         
         return False
     
-    async def execute_event_actions(self, event, user, **kwargs):
-        """Execute actions for triggered event"""
+    async def execute_event_actions(self, rule, user, **kwargs):
+        """Execute actions for a triggered event rule"""
         try:
-            actions = event.actions.all()
-            async for action in actions:
+            for action in rule.actions:
                 await self.execute_action(action, user, **kwargs)
         except Exception as e:
             logger.error(f"Error executing event actions: {e}")
@@ -290,17 +306,36 @@ class TikTokLiveConnector:
             # For now, just log the action
             logger.info(f"Executing action '{action.name}' for user @{user.unique_id}")
             
+            if action.tts_text:
+                variables = {'username': user.unique_id, 'nickname': user.display_name or user.unique_id}
+                gift = kwargs.get('gift')
+                if gift is not None:
+                    variables.update(giftname=gift.name, amount=gift.count, coins=gift.diamond_count)
+                if 'like_count' in kwargs:
+                    variables['likecount'] = kwargs['like_count']
+                await self.speak_template('action', action.id, variables)
+            
             # Here you would:
             # 1. Send action data to overlay screens
             # 2. Play sounds/videos
             # 3. Show animations
-            # 4. Send TTS messages
-            # 5. Trigger webhooks
+            # 4. Trigger webhooks
             # etc.
             
         except Exception as e:
             logger.error(f"Error executing action: {e}")
     
+    async def speak_template(self, kind, ident, variables):
+        """Speak an alert or chatbot template from its pre-rendered segments"""
+        from .connection_manager import connection_manager
+        
+        try:
+            result = await template_speech.aspeak(kind, self.user_id, ident, variables)
+            if result is not None:
+                await connection_manager.broadcast_to_subscribers(self.username, result)
+        except Exception as e:
+            logger.error(f"Error speaking {kind} template: {e}")
+    
     async def start(self):
         """Start the TikTok Live connection"""
         try:
@@ -315,6 +350,8 @@ class TikTokLiveConnector:
             await self.client.stop()
         except Exception as e:
             logger.error(f"Error stopping TikTok Live client: {e}")
+        finally:
+            await self.flush_interactions()
     
     def is_live(self):
         """Check if currently connected to live stream"""
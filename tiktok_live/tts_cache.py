@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class TTSAudioCache:
+    """Content-addressed store for synthesized audio, shared by every user.
+
+    Files are named by the SHA-256 of everything that affects the audio
+    (text, language, voice, speed, pitch, format), so identical phrases are
+    rendered once. Writes go to a temp file and are renamed into place, and
+    the least recently used files are evicted once the cache exceeds its
+    size or file limits.
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_files=None):
+        self.root = root or os.path.join(settings.MEDIA_ROOT, 'tts')
+        self.max_bytes = max_bytes or getattr(settings, 'TIKTOK_TTS_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.max_files = max_files or getattr(settings, 'TIKTOK_TTS_CACHE_MAX_FILES', 20000)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'failures': 0}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.loaded = False
+
+    @staticmethod
+    def key(text, language, voice='default', speed=50, pitch=50, fmt='mp3'):
+        material = json.dumps([text, language, voice, speed, pitch, fmt], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def relative_path(self, key, fmt):
+        return f"{key[:2]}/{key}.{fmt}"
+
+    def url_for(self, key, fmt):
+        return f"{settings.MEDIA_URL}tts/{self.relative_path(key, fmt)}"
+
+    def path_for(self, key, fmt):
+        return os.path.join(self.root, self.relative_path(key, fmt))
+
+    def _load(self):
+        # Rebuild the LRU order from disk so limits hold across restarts
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if len(name.split('.')[0]) != 64:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, os.path.relpath(path, self.root).replace(os.sep, '/'), stat.st_size))
+        for _, relative, size in sorted(found):
+            self.entries[relative] = size
+            self.total_bytes += size
+        self.loaded = True
+
+    def get_or_render(self, render, text, language, voice='default', speed=50, pitch=50, fmt='mp3'):
+        """Return (url, hit) for the audio, calling render(path) only on a miss; url is None if rendering failed"""
+        key = self.key(text, language, voice, speed, pitch, fmt)
+        relative = self.relative_path(key, fmt)
+        path = os.path.join(self.root, relative)
+
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            # [lock, users]; the lock is dropped once nobody holds or waits for it
+            key_lock = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+
+        # One render per key; concurrent requests for the same phrase wait for it
+        try:
+            with key_lock[0]:
+                if os.path.exists(path):
+                    os.utime(path)
+                    with self.lock:
+                        self.stats['hits'] += 1
+                        if relative not in self.entries:
+                            size = os.path.getsize(path)
+                            self.entries[relative] = size
+                            self.total_bytes += size
+                        self.entries.move_to_end(relative)
+                    return self.url_for(key, fmt), True
+
+                with self.lock:
+                    self.stats['misses'] += 1
+                size = self._render_atomic(render, path, fmt)
+                if size is None:
+                    with self.lock:
+                        self.stats['failures'] += 1
+                    return None, False
+
+                with self.lock:
+                    self.entries[relative] = size
+                    self.total_bytes += size
+                    self._evict(keep=relative)
+                return self.url_for(key, fmt), False
+        finally:
+            with self.lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self.key_locks[key]
+
+    def open_stream(self, produce, text, language, voice='default', speed=50, pitch=50, fmt='mp3', chunk_size=16384):
+        """Return (url, chunks, hit) where chunks yields the audio as it becomes available.
+
+        A hit reads the cached file; a miss calls produce() for a chunk generator
+        and tees it into the cache, publishing the file only if it completes.
+        """
+        key = self.key(text, language, voice, speed, pitch, fmt)
+        relative = self.relative_path(key, fmt)
+        path = os.path.join(self.root, relative)
+
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            hit = os.path.exists(path)
+            self.stats['hits' if hit else 'misses'] += 1
+
+        if hit:
+            return self.url_for(key, fmt), self._read_chunks(relative, path, chunk_size), True
+        return self.url_for(key, fmt), self._tee_chunks(produce, relative, path, fmt), False
+
+    def _read_chunks(self, relative, path, chunk_size):
+        os.utime(path)
+        with self.lock:
+            if relative in self.entries:
+                self.entries.move_to_end(relative)
+        with open(path, 'rb') as audio:
+            while chunk := audio.read(chunk_size):
+                yield chunk
+
+    def _tee_chunks(self, produce, relative, path, fmt):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=f'.{fmt}')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in produce():
+                    out.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            if not size:
+                with self.lock:
+                    self.stats['failures'] += 1
+                return
+            os.replace(tmp_path, path)
+            with self.lock:
+                if relative not in self.entries:
+                    self.total_bytes += size
+                self.entries[relative] = size
+                self.entries.move_to_end(relative)
+                self._evict(keep=relative)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _render_atomic(self, render, path, fmt):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            if not render(tmp_path) or not os.path.getsize(tmp_path):
+                return None
+            os.replace(tmp_path, path)
+            return os.path.getsize(path)
+        except Exception as e:
+            logger.error(f"TTS render failed: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self, keep=None):
+        while self.entries and (self.total_bytes > self.max_bytes or len(self.entries) > self.max_files):
+            relative, size = next(iter(self.entries.items()))
+            if relative == keep:
+                break
+            del self.entries[relative]
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                os.remove(os.path.join(self.root, relative))
+            except OSError:
+                pass
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0,
+                'files': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+# Global instance
+tts_cache = TTSAudioCache()
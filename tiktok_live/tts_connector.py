@@ -2,11 +2,10 @@ from TikTokLive import TikTokLiveClient
 from TikTokLive.events import ConnectEvent, CommentEvent, DisconnectEvent
 import asyncio
 import logging
-import os
-import hashlib
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from .models import TTSSettings, TTSLog
 from .piper_tts import piper_tts
+from .tts_cache import tts_cache
 
 logger = logging.getLogger(__name__)
 
@@ -90,19 +89,16 @@ class TTSLiveConnector:
             if len(comment) > tts_settings.max_comment_length:
                 comment = comment[:tts_settings.max_comment_length]
             
-            # Generate TTS
-            media_dir = os.path.join(settings.BASE_DIR, 'media', 'tts')
-            os.makedirs(media_dir, exist_ok=True)
-            
-            text_hash = hashlib.md5(comment.encode()).hexdigest()[:8]
-            audio_filename = f"tts_{self.user.id}_{text_hash}.wav"
-            audio_path = os.path.join(media_dir, audio_filename)
-            
-            if not os.path.exists(audio_path):
-                success = piper_tts.text_to_speech(comment, audio_path, "default", tts_settings.language)
-                if not success:
-                    logger.error(f"TTS generation failed for: {comment}")
-                    return
+            # Generate TTS through the shared audio cache
+            audio_url, cached = await sync_to_async(tts_cache.get_or_render, thread_sensitive=False)(
+                lambda path: piper_tts.text_to_speech(comment, path, tts_settings.voice, tts_settings.language, tts_settings.default_speed),
+                comment, tts_settings.language, tts_settings.voice,
+                tts_settings.default_speed, tts_settings.default_pitch,
+                piper_tts.audio_format_for(tts_settings.voice, tts_settings.language)
+            )
+            if audio_url is None:
+                logger.error(f"TTS generation failed for: {comment}")
+                return
             
             # Log TTS usage
             await TTSLog.objects.acreate(
@@ -112,7 +108,6 @@ class TTSLiveConnector:
             )
             
             # Send TTS event
-            audio_url = f"/media/tts/{audio_filename}"
             if self.websocket_callback:
                 await self.websocket_callback({
                     'type': 'tts',
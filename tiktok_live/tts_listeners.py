@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, Set
+from asgiref.sync import sync_to_async
+from .models import TikTokAccount, TTSSettings
+
+logger = logging.getLogger(__name__)
+
+class TTSListenerIndex:
+    """Which enabled TTSSettings listen to each streamer.
+
+    A streamer's listeners are the owners of its TikTokAccount plus users who
+    attached TTS to it explicitly (TTS socket or tts_connect). Entries are
+    built on first use and dropped when signals report a relevant change.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, tuple] = {}
+        self.candidates: Dict[str, Set[int]] = {}
+        self.by_user: Dict[int, Set[str]] = {}
+        self.explicit: Dict[str, Dict[int, int]] = {}
+
+    async def get(self, username):
+        """Enabled TTSSettings listening to a streamer"""
+        username = username.lower().strip('@')
+        entry = self.entries.get(username)
+        if entry is None:
+            entry = await sync_to_async(self._build)(username)
+        return entry
+
+    def _build(self, username):
+        user_ids = set(TikTokAccount.objects.filter(username__iexact=username).values_list('user_id', flat=True))
+        user_ids.update(self.explicit.get(username, ()))
+
+        entry = tuple(TTSSettings.objects.filter(user_id__in=user_ids, is_enabled=True))
+        self._forget(username)
+        self.candidates[username] = user_ids
+        for user_id in user_ids:
+            self.by_user.setdefault(user_id, set()).add(username)
+        self.entries[username] = entry
+        logger.info(f"Indexed {len(entry)} TTS listener(s) for @{username}")
+        return entry
+
+    def _forget(self, username):
+        self.entries.pop(username, None)
+        for user_id in self.candidates.pop(username, ()):
+            usernames = self.by_user.get(user_id)
+            if usernames is not None:
+                usernames.discard(username)
+                if not usernames:
+                    del self.by_user[user_id]
+
+    def add_listener(self, username, user_id):
+        """Attach a user's TTS to a streamer they do not own; counted per connection"""
+        username = username.lower().strip('@')
+        listeners = self.explicit.setdefault(username, {})
+        listeners[user_id] = listeners.get(user_id, 0) + 1
+        self.invalidate_username(username)
+
+    def remove_listener(self, username, user_id):
+        username = username.lower().strip('@')
+        listeners = self.explicit.get(username)
+        if not listeners or user_id not in listeners:
+            return
+        listeners[user_id] -= 1
+        if listeners[user_id] <= 0:
+            del listeners[user_id]
+            if not listeners:
+                del self.explicit[username]
+            self.invalidate_username(username)
+
+    def invalidate_username(self, username):
+        self._forget(username.lower().strip('@'))
+
+    def invalidate_user(self, user_id):
+        for username in list(self.by_user.get(user_id, ())):
+            self._forget(username)
+
+# Global instance
+tts_listeners = TTSListenerIndex()
@@ -0,0 +1,284 @@
+import asyncio
+import itertools
+import logging
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+class TTSJob:
+    """One message waiting to be spoken for a streamer"""
+    __slots__ = ('user_id', 'speaker', 'text', 'language', 'voice', 'speed', 'pitch', 'max_length',
+                 'callback', 'streamer', 'enqueued_at', 'merged')
+
+    def __init__(self, user_id, speaker, text, language, voice, max_length, callback, speed=50, pitch=50, streamer=None):
+        self.user_id = user_id
+        self.speaker = speaker
+        self.text = text
+        self.language = language
+        self.voice = voice
+        self.speed = speed
+        self.pitch = pitch
+        self.max_length = max_length
+        self.callback = callback
+        self.streamer = streamer
+        self.enqueued_at = time.monotonic()
+        self.merged = 1
+
+    def merge(self, text):
+        """Fold another message from the same speaker into this job if it fits"""
+        combined = f"{self.text}. {text}"
+        if len(combined) > self.max_length:
+            return False
+        self.text = combined
+        self.merged += 1
+        return True
+
+class LatencyWindow:
+    """Rolling window of recent durations in milliseconds"""
+
+    def __init__(self, size=500):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds * 1000)
+
+    def summary(self):
+        if not self.samples:
+            return {'count': 0, 'avg_ms': 0, 'p95_ms': 0, 'max_ms': 0}
+        ordered = sorted(self.samples)
+        return {
+            'count': len(ordered),
+            'avg_ms': round(sum(ordered) / len(ordered), 1),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            'max_ms': round(ordered[-1], 1)
+        }
+
+def synthesize(job):
+    """Render a job through the shared audio cache and log it; runs on a pool thread"""
+    from .models import TTSLog
+    from .piper_tts import piper_tts
+    from .tts_cache import tts_cache
+
+    close_old_connections()
+    try:
+        audio_url, hit = tts_cache.get_or_render(
+            lambda path: piper_tts.text_to_speech(job.text, path, job.voice, job.language, job.speed),
+            job.text, job.language, job.voice, job.speed, job.pitch, piper_tts.audio_format_for(job.voice, job.language)
+        )
+        if audio_url is None:
+            logger.error(f"TTS generation failed for: {job.text}")
+            return None
+
+        TTSLog.objects.create(user_id=job.user_id, tiktok_username=job.speaker, message=job.text)
+
+        return {
+            'type': 'tts',
+            'username': job.speaker,
+            'text': job.text,
+            'audio_url': audio_url,
+            'language': job.language
+        }
+    finally:
+        close_old_connections()
+
+def synthesize_stream(job, emit):
+    """Stream a job's audio through emit(chunk) while teeing it into the cache; runs on a pool thread"""
+    from .models import TTSLog
+    from .piper_tts import piper_tts
+    from .tts_cache import tts_cache
+
+    close_old_connections()
+    try:
+        audio_url, chunks, hit = tts_cache.open_stream(
+            lambda: piper_tts.stream(job.text, job.voice, job.language, job.speed),
+            job.text, job.language, job.voice, job.speed, job.pitch, piper_tts.audio_format_for(job.voice, job.language)
+        )
+        sent = 0
+        for chunk in chunks:
+            emit(chunk)
+            sent += 1
+        if not sent:
+            logger.error(f"TTS streaming produced no audio for: {job.text}")
+            return None
+
+        TTSLog.objects.create(user_id=job.user_id, tiktok_username=job.speaker, message=job.text)
+
+        return {
+            'type': 'tts',
+            'username': job.speaker,
+            'text': job.text,
+            'audio_url': audio_url,
+            'language': job.language,
+            'streamed': True,
+            'chunks': sent
+        }
+    finally:
+        close_old_connections()
+
+class TTSQueue:
+    """Per-account FIFO queues drained by a bounded synthesis pool.
+
+    Queues are keyed by the TTSSettings owner (the account listening to a
+    stream, which is usually the streamer), because max_queue_length and the
+    metrics belong to those settings. Each queue is spoken in order, one
+    message at a time, so a slow synthesis only delays that account. At most
+    ``workers`` syntheses run at once across all accounts. A full queue merges
+    the new message into a queued one from the same viewer, or drops it.
+    """
+
+    def __init__(self, workers=None, synthesize_func=synthesize, stream_func=synthesize_stream, streaming=None, send_timeout=None):
+        self.workers = workers or getattr(settings, 'TIKTOK_TTS_WORKERS', 4)
+        self.send_timeout = send_timeout or getattr(settings, 'TIKTOK_TTS_SEND_TIMEOUT', 5.0)
+        self.synthesize = synthesize_func
+        self.synthesize_stream = stream_func
+        self.streaming = streaming if streaming is not None else getattr(settings, 'TIKTOK_TTS_STREAMING', True)
+        self.stream_ids = itertools.count(1)
+        self.queues: Dict[int, deque] = {}
+        self.drainers: Dict[int, asyncio.Task] = {}
+        self.stats = {'enqueued': 0, 'merged': 0, 'dropped': 0, 'completed': 0, 'failed': 0, 'stalled': 0}
+        self.wait_latency = LatencyWindow()
+        self.synthesis_latency = LatencyWindow()
+        self.first_chunk_latency = LatencyWindow()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts')
+        return self._pool
+
+    def submit(self, tts_settings, speaker, text, callback, streamer=None):
+        """Queue a message for a streamer; returns 'queued', 'merged' or 'dropped'
+
+        With a streamer username, audio is streamed to that streamer's TTS sockets
+        as it is synthesized when any of them asked for it.
+        """
+        user_id = tts_settings.user_id
+        queue = self.queues.setdefault(user_id, deque())
+
+        if len(queue) >= max(tts_settings.max_queue_length, 1):
+            for job in reversed(queue):
+                if job.speaker == speaker and job.merge(text):
+                    self.stats['merged'] += 1
+                    return 'merged'
+            self.stats['dropped'] += 1
+            logger.info(f"TTS queue full for user {user_id}, dropped message from {speaker}")
+            return 'dropped'
+
+        queue.append(TTSJob(
+            user_id, speaker, text, tts_settings.language, tts_settings.voice,
+            tts_settings.max_comment_length, callback,
+            speed=tts_settings.default_speed, pitch=tts_settings.default_pitch, streamer=streamer
+        ))
+        self.stats['enqueued'] += 1
+
+        drainer = self.drainers.get(user_id)
+        if drainer is None or drainer.done():
+            self.drainers[user_id] = asyncio.create_task(self._drain(user_id))
+        return 'queued'
+
+    async def _drain(self, user_id):
+        loop = asyncio.get_running_loop()
+        queue = self.queues[user_id]
+        while queue:
+            job = queue.popleft()
+            started = time.monotonic()
+            self.wait_latency.add(started - job.enqueued_at)
+            try:
+                if self._should_stream(job):
+                    result = await self._stream(loop, job, started)
+                else:
+                    result = await loop.run_in_executor(self.pool, self.synthesize, job)
+            except Exception as e:
+                logger.error(f"TTS synthesis error for user {user_id}: {e}")
+                result = None
+            self.synthesis_latency.add(time.monotonic() - started)
+
+            if result is None:
+                self.stats['failed'] += 1
+                continue
+            self.stats['completed'] += 1
+            try:
+                await job.callback(result)
+            except Exception as e:
+                logger.error(f"Failed to deliver TTS result for user {user_id}: {e}")
+
+    def _should_stream(self, job):
+        from .connection_manager import connection_manager
+        return self.streaming and job.streamer and connection_manager.has_audio_listeners(job.streamer)
+
+    async def _stream(self, loop, job, started):
+        """Push audio as binary frames while it is synthesized.
+
+        Each frame is a 4-byte stream id and a 4-byte sequence number (both
+        big-endian) followed by audio bytes. A tts_stream_start event announces
+        the stream id; the usual tts event with the cached audio_url ends it.
+        A send that takes longer than ``send_timeout`` stops the frames for
+        this stream, but synthesis still finishes so the audio_url is valid.
+        """
+        from .connection_manager import connection_manager
+        from .piper_tts import piper_tts
+
+        stream_id = next(self.stream_ids) & 0xFFFFFFFF
+        sequence = itertools.count()
+        stalled = False
+        await job.callback({
+            'type': 'tts_stream_start',
+            'stream_id': stream_id,
+            'username': job.speaker,
+            'text': job.text,
+            'format': piper_tts.audio_format_for(job.voice, job.language)
+        })
+
+        def emit(chunk):
+            nonlocal stalled
+            seq = next(sequence)
+            if seq == 0:
+                self.first_chunk_latency.add(time.monotonic() - started)
+            if stalled:
+                return
+            frame = struct.pack('>II', stream_id, seq) + chunk
+            # Block the pool thread until the frame is sent so a slow socket applies backpressure,
+            # but never longer than send_timeout so a stalled consumer cannot pin the thread
+            future = asyncio.run_coroutine_threadsafe(connection_manager.broadcast_audio(job.streamer, frame), loop)
+            try:
+                future.result(timeout=self.send_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                stalled = True
+                self.stats['stalled'] += 1
+                logger.warning(f"TTS audio send for @{job.streamer} timed out after {self.send_timeout}s, no more frames for stream {stream_id}")
+            except Exception as e:
+                stalled = True
+                logger.error(f"Failed to send TTS audio for @{job.streamer}: {e}")
+
+        result = await loop.run_in_executor(self.pool, self.synthesize_stream, job, emit)
+        if result is not None:
+            result['stream_id'] = stream_id
+        return result
+
+    def depth(self, user_id):
+        return len(self.queues.get(user_id, ()))
+
+    def metrics(self, user_id=None):
+        data = {
+            'workers': self.workers,
+            'stats': dict(self.stats),
+            'queue_wait': self.wait_latency.summary(),
+            'synthesis': self.synthesis_latency.summary(),
+            'first_chunk': self.first_chunk_latency.summary()
+        }
+        if user_id is None:
+            data['depths'] = {uid: len(queue) for uid, queue in self.queues.items() if queue}
+        else:
+            data['depth'] = self.depth(user_id)
+        return data
+
+# Global instance
+tts_queue = TTSQueue()
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import re
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r'%(\w+)%|\{(\w+)\}')
+
+# Placeholders that are the same for every viewer, folded into the static text
+CONSTANTS = {'currencyname': 'points'}
+
+def split_template(text, constants=CONSTANTS):
+    """Split a template into ('text', value) and ('var', name, placeholder) parts"""
+    parts = []
+    static = ''
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        name = match.group(1) or match.group(2)
+        static += text[position:match.start()]
+        position = match.end()
+        if name in constants:
+            static += constants[name]
+            continue
+        if static:
+            parts.append(('text', static))
+            static = ''
+        parts.append(('var', name, match.group(0)))
+    static += text[position:]
+    if static:
+        parts.append(('text', static))
+    return parts
+
+def speakable(text):
+    return any(char.isalnum() for char in text)
+
+def concat_audio(paths, output_path, fmt):
+    """Join rendered segments into one file; False if they cannot be joined losslessly"""
+    if fmt == 'wav':
+        params = None
+        with wave.open(output_path, 'wb') as out:
+            for path in paths:
+                with wave.open(path, 'rb') as segment:
+                    current = segment.getparams()[:3]
+                    if params is None:
+                        params = current
+                        out.setnchannels(current[0])
+                        out.setsampwidth(current[1])
+                        out.setframerate(current[2])
+                    elif current != params:
+                        return False
+                    out.writeframes(segment.readframes(segment.getnframes()))
+        return True
+    if fmt == 'mp3':
+        with open(output_path, 'wb') as out:
+            for index, path in enumerate(paths):
+                with open(path, 'rb') as segment:
+                    data = segment.read()
+                if index and data[:3] == b'ID3':
+                    # Only the first segment keeps its ID3v2 tag
+                    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+                    data = data[10 + size:]
+                out.write(data)
+        return True
+    return False
+
+class CompiledTemplate:
+    """A template split into parts plus the voice it is spoken with"""
+    __slots__ = ('user_id', 'text', 'parts', 'language', 'voice', 'speed', 'pitch')
+
+    def __init__(self, user_id, text, language, voice, speed, pitch):
+        self.user_id = user_id
+        self.text = text
+        self.parts = split_template(text)
+        self.language = language
+        self.voice = voice
+        self.speed = speed
+        self.pitch = pitch
+
+    def render_text(self, variables):
+        return ''.join(
+            part[1] if part[0] == 'text' else str(variables.get(part[1], part[2]))
+            for part in self.parts
+        )
+
+class TemplateSpeech:
+    """Speaks ChatbotMessage and Action.tts_text templates from pre-rendered segments.
+
+    The static text between placeholders is synthesized ahead of time on a
+    background thread. Speaking a template renders only the variable values
+    (usernames and amounts, which repeat and are cached too) and joins the
+    segments, so alerts skip most of the synthesis. Templates are keyed by
+    (kind, user_id, ident): ('action', user_id, action.id) or
+    ('chatbot', user_id, command). The template dict is shared by pool
+    threads and signal handlers, so it is only changed under ``lock``.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or getattr(settings, 'TIKTOK_TTS_PRERENDER_WORKERS', 1)
+        self.templates: Dict[tuple, CompiledTemplate] = {}
+        self.stats = {'prerendered': 0, 'assembled': 0, 'fallbacks': 0, 'failures': 0}
+        self.lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced one is not cached
+        self.generation = 0
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts-prerender')
+        return self._pool
+
+    def _load(self, kind, user_id, ident):
+        from .models import Action, ChatbotMessage, TTSSettings
+
+        if kind == 'action':
+            row = Action.objects.filter(id=ident, user_id=user_id).values('tts_text', 'tts_voice').first()
+            text = row and row['tts_text']
+            voice = row['tts_voice'] if row else 'default'
+        else:
+            row = ChatbotMessage.objects.filter(user_id=user_id, command=ident, is_active=True).values('message_text').first()
+            text = row and row['message_text']
+            voice = 'default'
+        if not text:
+            return None
+
+        tts_settings = TTSSettings.objects.filter(user_id=user_id).first()
+        language = tts_settings.language if tts_settings else 'tr-TR'
+        if voice == 'default' and tts_settings:
+            voice = tts_settings.voice
+        speed = tts_settings.default_speed if tts_settings else 50
+        pitch = tts_settings.default_pitch if tts_settings else 50
+        return CompiledTemplate(user_id, text, language, voice, speed, pitch)
+
+    def get(self, kind, user_id, ident):
+        key = (kind, user_id, ident)
+        with self.lock:
+            template = self.templates.get(key)
+            generation = self.generation
+        if template is None:
+            template = self._load(kind, user_id, ident)
+            if template is not None:
+                with self.lock:
+                    if generation == self.generation:
+                        self.templates[key] = template
+        return template
+
+    def _invalidate(self, match):
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.templates if match(key)]:
+                del self.templates[key]
+
+    def _segment(self, template, text):
+        """Path of the cached audio for one segment, rendering it if needed"""
+        from .piper_tts import piper_tts
+        from .tts_cache import tts_cache
+
+        fmt = piper_tts.audio_format_for(template.voice, template.language)
+        url, hit = tts_cache.get_or_render(
+            lambda path: piper_tts.text_to_speech(text, path, template.voice, template.language, template.speed),
+            text, template.language, template.voice, template.speed, template.pitch, fmt
+        )
+        if url is None:
+            return None
+        return tts_cache.path_for(tts_cache.key(text, template.language, template.voice, template.speed, template.pitch, fmt), fmt)
+
+    def prerender(self, kind, user_id, ident):
+        """Drop the compiled template and render its static segments in the background"""
+        self.forget(kind, user_id, ident)
+        self.pool.submit(self._prerender, kind, user_id, ident)
+
+    def _prerender(self, kind, user_id, ident):
+        close_old_connections()
+        try:
+            template = self.get(kind, user_id, ident)
+            if template is None:
+                return
+            for part in template.parts:
+                if part[0] == 'text' and speakable(part[1]):
+                    if self._segment(template, part[1]) is None:
+                        with self.lock:
+                            self.stats['failures'] += 1
+                        return
+            with self.lock:
+                self.stats['prerendered'] += 1
+            logger.info(f"Pre-rendered {kind} template {ident} for user {user_id}")
+        except Exception as e:
+            logger.error(f"TTS pre-render failed for {kind} {ident}: {e}")
+        finally:
+            close_old_connections()
+
+    def prerender_user(self, user_id):
+        """Re-render every template of a user, e.g. after their voice or language changed"""
+        self._invalidate(lambda key: key[1] == user_id)
+        self.pool.submit(self._prerender_user, user_id)
+
+    def _prerender_user(self, user_id):
+        from .models import Action, ChatbotMessage
+
+        close_old_connections()
+        try:
+            action_ids = list(Action.objects.filter(user_id=user_id).exclude(tts_text='').values_list('id', flat=True))
+            commands = list(ChatbotMessage.objects.filter(user_id=user_id, is_active=True).values_list('command', flat=True))
+        finally:
+            close_old_connections()
+        for action_id in action_ids:
+            self._prerender('action', user_id, action_id)
+        for command in commands:
+            self._prerender('chatbot', user_id, command)
+
+    def forget(self, kind, user_id, ident):
+        self._invalidate(lambda key: key == (kind, user_id, ident))
+
+    def speak(self, kind, user_id, ident, variables):
+        """Return a tts event for the filled-in template, or None if there is nothing to say"""
+        from .piper_tts import piper_tts
+        from .tts_cache import tts_cache
+
+        close_old_connections()
+        try:
+            template = self.get(kind, user_id, ident)
+            if template is None:
+                return None
+            text = template.render_text(variables)
+            fmt = piper_tts.audio_format_for(template.voice, template.language)
+
+            paths = []
+            for part in template.parts:
+                segment = part[1] if part[0] == 'text' else str(variables.get(part[1], part[2]))
+                if not speakable(segment):
+                    continue
+                path = self._segment(template, segment)
+                if path is None:
+                    paths = None
+                    break
+                paths.append(path)
+
+            audio_url = None
+            if paths:
+                # Assembled audio is stored under its own voice key so it never stands in for a whole-phrase render
+                audio_url, hit = tts_cache.get_or_render(
+                    lambda path: concat_audio(paths, path, fmt),
+                    text, template.language, f"segments:{template.voice}", template.speed, template.pitch, fmt
+                )
+            if audio_url is None:
+                with self.lock:
+                    self.stats['fallbacks'] += 1
+                audio_url, hit = tts_cache.get_or_render(
+                    lambda path: piper_tts.text_to_speech(text, path, template.voice, template.language, template.speed),
+                    text, template.language, template.voice, template.speed, template.pitch, fmt
+                )
+                if audio_url is None:
+                    with self.lock:
+                        self.stats['failures'] += 1
+                    return None
+            else:
+                with self.lock:
+                    self.stats['assembled'] += 1
+
+            return {
+                'type': 'tts',
+                'username': variables.get('username', ''),
+                'text': text,
+                'audio_url': audio_url,
+                'language': template.language,
+                'template': kind
+            }
+        finally:
+            close_old_connections()
+
+    async def aspeak(self, kind, user_id, ident, variables):
+        """speak() on the TTS synthesis pool"""
+        from .tts_queue import tts_queue
+        return await asyncio.get_running_loop().run_in_executor(tts_queue.pool, self.speak, kind, user_id, ident, variables)
+
+    def metrics(self):
+        with self.lock:
+            return {**self.stats, 'templates': len(self.templates)}
+
+# Global instance
+template_speech = TemplateSpeech()
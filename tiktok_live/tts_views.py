@@ -1,8 +1,9 @@
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
+from asgiref.sync import async_to_sync
+from .tts_listeners import tts_listeners
 import json
-import asyncio
 
 @login_required
 @require_http_methods(["POST"])
@@ -16,14 +17,17 @@ def tts_connect(request):
         if not username:
             return JsonResponse({'success': False, 'error': 'Username required'})
         
-        async def connect():
-            try:
-                connector = await connection_manager.get_or_create_connection(username)
-                return True
-            except Exception as e:
-                raise e
+        hold = f"tts_view:{request.user.id}"
+        if hold not in connection_manager.holds.get(username.lower(), ()):
+            tts_listeners.add_listener(username, request.user.id)
         
-        success = asyncio.run(connect())
+        # Runs on the server's event loop so the connection outlives this request;
+        # the user's hold keeps it open until tts_disconnect
+        try:
+            async_to_sync(connection_manager.get_or_create_connection)(username, hold=hold)
+        except Exception:
+            tts_listeners.remove_listener(username, request.user.id)
+            raise
         
         return JsonResponse({
             'success': True,
@@ -44,7 +48,10 @@ def tts_disconnect(request):
         username = data.get('username', '').replace('@', '').strip()
         
         if username:
-            asyncio.run(connection_manager.close_connection(username))
+            hold = f"tts_view:{request.user.id}"
+            if hold in connection_manager.holds.get(username.lower(), ()):
+                tts_listeners.remove_listener(username, request.user.id)
+            async_to_sync(connection_manager.release_hold)(username, hold)
         
         return JsonResponse({'success': True, 'message': 'Disconnected'})
         
@@ -1,6 +1,9 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .connection_manager import connection_manager
+from .channel_layers import live_group_name, tts_audio_group_name
+from .tts_listeners import tts_listeners
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,12 +11,25 @@ logger = logging.getLogger(__name__)
 class TTSWebSocketConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.username = self.scope['url_route']['kwargs']['username']
+        self.room_group_name = live_group_name(self.username)
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        
+        # ?stream=1 asks for TTS audio as binary frames while it is synthesized
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.stream_audio = query.get('stream', ['0'])[0] in ('1', 'true')
+        if self.stream_audio:
+            connection_manager.add_audio_subscriber(self.username, self)
+            await self.channel_layer.group_add(tts_audio_group_name(self.username), self.channel_name)
+        
         await self.accept()
         logger.info(f"TTS WebSocket connected for @{self.username}")
         
         # Use main connection manager for TTS
         user = self.scope['user']
+        self.listener_id = None
         if user.is_authenticated:
+            self.listener_id = user.id
+            tts_listeners.add_listener(self.username, user.id)
             try:
                 # Get or create connection through main manager
                 connector = await connection_manager.get_or_create_connection(self.username, self)
@@ -32,6 +48,24 @@ class TTSWebSocketConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         logger.info(f"TTS WebSocket disconnected for @{self.username}")
+        await connection_manager.remove_subscriber(self.username, self)
+        if getattr(self, 'listener_id', None):
+            tts_listeners.remove_listener(self.username, self.listener_id)
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, 'stream_audio', False):
+            connection_manager.remove_audio_subscriber(self.username, self)
+            await self.channel_layer.group_discard(tts_audio_group_name(self.username), self.channel_name)
+    
+    async def tts_audio(self, event):
+        """Forward a streamed TTS audio frame published on the shared channel layer"""
+        await self.send(bytes_data=event['bytes'])
+    
+    async def live_event(self, event):
+        """Forward live events published on the shared channel layer"""
+        text = event.get('text')
+        if text is None:
+            text = json.dumps(event.get('data', event))
+        await self.send(text_data=text)
     
     async def send_tts_event(self, data):
         """Callback for TTS events"""
@@ -46,6 +46,9 @@ urlpatterns = [
     path('users-points/update-settings/', views.update_points_settings, name='update_points_settings'),
     path('users-points/reset/', views.reset_points, name='reset_points'),
     path('users-points/audit/<int:user_id>/', views.user_audit, name='user_audit'),
+    path('users-points/export/ledger/', views.export_points_ledger, name='export_points_ledger'),
+    path('users-points/export/transactions/', views.export_points_transactions, name='export_points_transactions'),
+    path('users-points/import/', views.import_points, name='import_points'),
     
     # Timer
     path('timer/', views.timer, name='timer'),
@@ -68,6 +71,8 @@ urlpatterns = [
     
     # API endpoints
     path('api/timer/status/', views.timer_status_api, name='timer_status_api'),
+    path('api/leaderboard/', views.leaderboard_api, name='leaderboard_api'),
+    path('check-live/batch/', views.check_live_status_batch, name='check_live_status_batch'),
     path('check-live/<str:username>/', views.check_live_status, name='check_live_status'),
     path('profile/<str:username>/', views.get_tiktok_profile, name='get_tiktok_profile'),
     
@@ -89,6 +94,7 @@ urlpatterns = [
     path('challenge/', views.challenge, name='challenge'),
     path('split/', views.split, name='split'),
     path('viewer-analysis/', views.viewer_analysis, name='viewer_analysis'),
+    path('viewer-analysis/<int:stream_id>/data/', views.viewer_analysis_data, name='viewer_analysis_data'),
     path('event-api/', views.event_api, name='event_api'),
     path('profile-settings/', views.profile_settings, name='profile_settings'),
     path('target-overlays/', views.target_overlays, name='target_overlays'),
@@ -111,6 +117,8 @@ urlpatterns = [
     path('ajax/tts/update-settings/', views.tts_update_settings, name='tts_update_settings'),
     path('ajax/tts/generate/', views.tts_generate, name='tts_generate'),
     path('ajax/tts/test/', views.tts_test, name='tts_test'),
+    path('ajax/tts/stream/', views.tts_stream, name='tts_stream'),
+    path('ajax/tts/queue-status/', views.tts_queue_status, name='tts_queue_status'),
     
     # Stream management
     path('stream/<str:username>/', views.live_stream, name='live_stream'),
@@ -8,6 +8,9 @@ from django.contrib.auth.decorators import login_required
 from .models import TikTokAccount, LiveStream, StreamInteraction, AutomationTrigger, AutoResponse, UserPoints, Widget, Action, Event, OverlayScreen, Timer, PointsTransaction, PointsSettings, CountdownTimer, PointsHalving, ChatbotSettings, ChatbotMessage, ChatbotLog, TTSSettings, TTSSpecialUser, TTSLog
 from .actions_events_views import actions_and_events, create_action, create_event, simulate_event, create_timer, update_screen_settings
 from .lastx_views import lastx_overlays, lastx_widget, lastx_test
+from .stream_stats import stream_stats, COUNTERS
+from .points_operations import points_operations
+from .points_grid import points_grid
 from django.db.models import Count, Q
 from django.utils import timezone
 from .tiktok_oauth import TikTokOAuth
@@ -16,8 +19,6 @@ import json
 import random
 import secrets
 import logging
-from TikTokLive import TikTokLiveClient
-from TikTokLive.client.errors import UserOfflineError, UserNotFoundError
 
 logger = logging.getLogger(__name__)
 
@@ -309,14 +310,17 @@ def interactions(request, stream_id):
     if interaction_type != 'all':
         interactions_qs = interactions_qs.filter(interaction_type=interaction_type)
     
-    interactions_list = interactions_qs[:100]
+    interactions_list = interactions_qs.order_by('-timestamp')[:100]
     
+    counters = stream_stats.snapshot(stream)
     stats = {
-        'total': interactions_qs.count(),
-        'comments': interactions_qs.filter(interaction_type='comment').count(),
-        'gifts': interactions_qs.filter(interaction_type='gift').count(),
-        'follows': interactions_qs.filter(interaction_type='follow').count(),
-        'likes': interactions_qs.filter(interaction_type='like').count(),
+        'total': counters[COUNTERS[interaction_type]] if interaction_type in COUNTERS else counters['total_interactions'],
+        'comments': counters['total_comments'],
+        'gifts': counters['total_gifts'],
+        'follows': counters['total_follows'],
+        'likes': counters['total_likes'],
+        'gift_count': counters['total_gift_count'],
+        'like_count': counters['total_like_count'],
     }
     
     context = {
@@ -435,18 +439,19 @@ def add_account(request):
 def get_stream_stats(request, stream_id):
     stream = get_object_or_404(LiveStream, id=stream_id, account__user=request.user)
     
+    counters = stream_stats.snapshot(stream)
     stats = {
-        'viewer_count': stream.viewer_count,
-        'peak_viewers': stream.peak_viewers,
-        'total_interactions': StreamInteraction.objects.filter(stream=stream).count(),
-        'total_comments': stream.total_comments,
-        'total_gifts': stream.total_gifts,
-        'total_likes': stream.total_likes,
-        'total_shares': stream.total_shares,
-        'follows': StreamInteraction.objects.filter(stream=stream, interaction_type='follow').count(),
-        'total_gift_value': sum(
-            i.gift_value for i in StreamInteraction.objects.filter(stream=stream, interaction_type='gift')
-        ),
+        'viewer_count': counters['viewer_count'],
+        'peak_viewers': counters['peak_viewers'],
+        'total_interactions': counters['total_interactions'],
+        'total_comments': counters['total_comments'],
+        'total_gifts': counters['total_gifts'],
+        'total_gift_count': counters['total_gift_count'],
+        'total_likes': counters['total_likes'],
+        'total_like_count': counters['total_like_count'],
+        'total_shares': counters['total_shares'],
+        'follows': counters['total_follows'],
+        'total_gift_value': counters['total_gift_value'],
         'is_monitored': stream.is_monitored,
         'auto_response_enabled': stream.auto_response_enabled,
         'automation_enabled': stream.automation_enabled,
@@ -573,100 +578,38 @@ def verify_ownership(request, account_id):
         'message': 'Account ownership verified!'
     })
 
-def check_live_status(request, username):
-    """Check if TikTok user is live using TikTokLive"""
-    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
-    import asyncio
+async def check_live_status(request, username):
+    """Check if a TikTok user is live; cached and shared with concurrent checks"""
+    from .live_status import live_status
     
-    username_clean = username.strip('@')
-    logger.info(f"Checking live status for: @{username_clean}")
+    result = await live_status.check(username)
+    return JsonResponse({
+        'success': True,
+        **result,
+        'message': f"@{result['username']} is currently {result['status']}"
+    })
+
+@require_http_methods(["GET", "POST"])
+async def check_live_status_batch(request):
+    """Check many usernames at once: ?usernames=a,b,c or a JSON body {"usernames": [...]}"""
+    from django.conf import settings
+    from .live_status import live_status
     
-    def check_live():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
+    if request.method == 'POST':
         try:
-            client = TikTokLiveClient(unique_id=username_clean)
-            
-            async def test_connection():
-                try:
-                    # Try to connect to the live stream
-                    logger.info(f"Attempting to connect to @{username_clean}...")
-                    await client.start()
-                    
-                    # Wait for connection to stabilize
-                    await asyncio.sleep(2)
-                    
-                    # If we get here without exception, user is live
-                    logger.info(f"Successfully connected! @{username_clean} is LIVE")
-                    
-                    # Disconnect cleanly
-                    try:
-                        await client.disconnect()
-                    except:
-                        pass
-                    
-                    return True
-                    
-                except UserOfflineError:
-                    logger.info(f"@{username_clean} is OFFLINE (UserOfflineError)")
-                    return False
-                except UserNotFoundError:
-                    logger.info(f"@{username_clean} NOT FOUND (UserNotFoundError)")
-                    return False
-                except Exception as e:
-                    logger.error(f"Error checking @{username_clean}: {type(e).__name__}: {e}")
-                    return False
-            
-            result = loop.run_until_complete(asyncio.wait_for(test_connection(), timeout=10))
-            return result
-            
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout checking @{username_clean} - assuming OFFLINE")
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error for @{username_clean}: {type(e).__name__}: {e}")
-            return False
-        finally:
-            try:
-                loop.close()
-            except:
-                pass
+            usernames = json.loads(request.body).get('usernames', [])
+        except (ValueError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    else:
+        usernames = request.GET.get('usernames', '').split(',')
     
-    try:
-        with ThreadPoolExecutor() as executor:
-            future = executor.submit(check_live)
-            is_live = future.result(timeout=12)
-        
-        status = "LIVE" if is_live else "OFFLINE"
-        logger.info(f"Final status for @{username_clean}: {status}")
-        
-        return JsonResponse({
-            'success': True,
-            'is_live': is_live,
-            'status': status,
-            'username': username_clean,
-            'message': f'@{username_clean} is currently {status}'
-        })
-        
-    except FuturesTimeoutError:
-        logger.error(f"Executor timeout for @{username_clean}")
-        return JsonResponse({
-            'success': True,
-            'is_live': False,
-            'status': 'OFFLINE',
-            'username': username_clean,
-            'error': 'Connection timeout'
-        })
-    except Exception as e:
-        logger.error(f"Exception in check_live_status: {type(e).__name__}: {e}")
-        return JsonResponse({
-            'success': True,
-            'is_live': False,
-            'status': 'OFFLINE',
-            'username': username_clean,
-            'error': str(e)
-        })
+    limit = getattr(settings, 'TIKTOK_LIVE_STATUS_BATCH_MAX', 50)
+    usernames = [str(username) for username in usernames if str(username).strip('@ ')]
+    if len(usernames) > limit:
+        return JsonResponse({'success': False, 'error': f'At most {limit} usernames per request'}, status=400)
+    
+    results = await live_status.check_many(usernames)
+    return JsonResponse({'success': True, 'results': results, 'live': [result['username'] for result in results if result['is_live']]})
 
 def overlay_gallery(request):
     """Overlay Gallery - TikFinity style overlays for OBS/Live Studio"""
@@ -802,90 +745,11 @@ def users_points(request):
         }
     )
     
-    # Get user points data
-    user_points = UserPoints.objects.filter(user=request.user).order_by('-points_total')
-    
-    # Handle AJAX requests for data grid
+    # AJAX requests for the data grid get the same keyset pages as users_points_data
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        # Pagination and filtering
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('pageSize', 40))
-        sort_field = request.GET.get('sort', 'points_total')
-        sort_order = request.GET.get('order', 'desc')
-        
-        # Apply sorting
-        if sort_order == 'desc':
-            sort_field = f'-{sort_field}'
-        
-        user_points = user_points.order_by(sort_field)
-        
-        # Apply filters
-        username_filter = request.GET.get('username')
-        if username_filter:
-            user_points = user_points.filter(tiktok_username__icontains=username_filter)
-        
-        points_filter = request.GET.get('points')
-        if points_filter:
-            try:
-                points_filter = int(points_filter)
-                user_points = user_points.filter(points_total=points_filter)
-            except ValueError:
-                pass
-        
-        level_points_filter = request.GET.get('level_points')
-        if level_points_filter:
-            try:
-                level_points_filter = int(level_points_filter)
-                user_points = user_points.filter(points_level=level_points_filter)
-            except ValueError:
-                pass
-        
-        first_activity_filter = request.GET.get('first_activity')
-        if first_activity_filter:
-            try:
-                from datetime import datetime
-                date_obj = datetime.strptime(first_activity_filter, '%Y-%m-%d')
-                user_points = user_points.filter(first_activity__date=date_obj.date())
-            except ValueError:
-                pass
-        
-        last_activity_filter = request.GET.get('last_activity')
-        if last_activity_filter:
-            try:
-                from datetime import datetime
-                date_obj = datetime.strptime(last_activity_filter, '%Y-%m-%d')
-                user_points = user_points.filter(last_activity__date=date_obj.date())
-            except ValueError:
-                pass
-        
-        # Pagination
-        total_count = user_points.count()
-        start = (page - 1) * page_size
-        end = start + page_size
-        user_points_page = user_points[start:end]
-        
-        # Format data for DevExtreme DataGrid
-        data = []
-        for up in user_points_page:
-            data.append({
-                'id': up.id,
-                'username': up.tiktok_username,
-                'display_name': up.display_name or up.tiktok_username,
-                'profile_picture': up.profile_picture or '/img/nothumb.webp',
-                'level': up.level,
-                'points_total': f"{up.points_total:,}",
-                'points_level': f"{up.points_level:,}",
-                'first_activity': up.first_activity.strftime('%m/%d/%Y, %I:%M %p'),
-                'last_activity': up.last_activity.strftime('%m/%d/%Y, %I:%M %p'),
-            })
-        
-        return JsonResponse({
-            'data': data,
-            'totalCount': total_count,
-        })
+        return users_points_data(request)
     
-    # Regular page request
-    total_users = user_points.count()
+    total_users = points_grid.total(request.user.id)
     
     context = {
         'points_settings': points_settings,
@@ -953,7 +817,22 @@ def split(request):
     return render(request, 'tiktok_live/split.html')
 
 def viewer_analysis(request):
-    return render(request, 'tiktok_live/viewer_analysis.html')
+    streams = []
+    if request.user.is_authenticated:
+        streams = LiveStream.objects.filter(account__user=request.user).select_related('account').order_by('-started_at')[:50]
+    return render(request, 'tiktok_live/viewer_analysis.html', {'streams': streams})
+
+@login_required
+def viewer_analysis_data(request, stream_id):
+    """Per-minute or per-hour interaction buckets for a stream, for charts"""
+    from .interaction_rollups import interaction_rollups
+    
+    stream = get_object_or_404(LiveStream, id=stream_id, account__user=request.user)
+    resolution = {'minute': 60, 'hour': 3600}.get(request.GET.get('resolution'))
+    series = interaction_rollups.series(stream, resolution)
+    for bucket in series['buckets']:
+        bucket['bucket_start'] = bucket['bucket_start'].isoformat()
+    return JsonResponse({'success': True, **series})
 
 def event_api(request):
     return render(request, 'tiktok_live/event_api.html')
@@ -1171,34 +1050,22 @@ def simulate_event(request, event_type):
 
 @login_required
 def users_points_data(request):
-    """API endpoint for users points data grid"""
-    user_points = UserPoints.objects.filter(user=request.user)
-    
-    # Apply filters
-    username_filter = request.GET.get('username')
-    if username_filter:
-        user_points = user_points.filter(tiktok_username__icontains=username_filter)
-    
-    points_filter = request.GET.get('points')
-    if points_filter:
-        try:
-            points_filter = int(points_filter)
-            user_points = user_points.filter(points_total=points_filter)
-        except ValueError:
-            pass
-    
-    # Sorting
-    sort_field = request.GET.get('sort', 'points_total')
-    sort_order = request.GET.get('order', 'desc')
-    
-    if sort_order == 'desc':
-        sort_field = f'-{sort_field}'
-    
-    user_points = user_points.order_by(sort_field)
+    """API endpoint for users points data grid: keyset pages with a cursor for the next one"""
+    try:
+        page = points_grid.page(
+            request.user.id,
+            sort=request.GET.get('sort', 'points_total'),
+            order=request.GET.get('order', 'desc'),
+            cursor=request.GET.get('cursor'),
+            limit=request.GET.get('limit'),
+            filters=request.GET
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
     # Format data
     data = []
-    for up in user_points:
+    for up in page['rows']:
         data.append({
             'id': up.id,
             'username': up.tiktok_username,
@@ -1211,7 +1078,7 @@ def users_points_data(request):
             'last_activity': up.last_activity.isoformat(),
         })
     
-    return JsonResponse({'data': data, 'totalCount': len(data)})
+    return JsonResponse({'data': data, 'totalCount': page['total'], 'nextCursor': page['next_cursor']})
 
 @login_required
 @require_http_methods(["POST"])
@@ -1252,22 +1119,79 @@ def reset_points(request):
         data = json.loads(request.body)
         reset_type = data.get('type', 'all')
         
+        record = points_operations.reset(request.user, reset_type)
         if reset_type == 'all':
-            UserPoints.objects.filter(user=request.user).delete()
-            PointsTransaction.objects.filter(user_points__user=request.user).delete()
             message = 'All user points have been reset'
-        elif reset_type == 'points_only':
-            UserPoints.objects.filter(user=request.user).update(
-                points_total=0,
-                points_level=0,
-                level=1
-            )
+        else:
             message = 'All points have been reset to 0'
         
-        return JsonResponse({'success': True, 'message': message})
+        return JsonResponse({'success': True, 'message': message, 'affected_users': record.affected_users})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+def _export_response(request, kind):
+    from django.http import StreamingHttpResponse
+    from .points_export import points_export, stream, parse_bound, FORMATS, LEDGER_FIELDS, TRANSACTION_FIELDS
+    
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    if fmt not in FORMATS:
+        return JsonResponse({'success': False, 'error': f"Unsupported format: {fmt}"}, status=400)
+    try:
+        since = parse_bound(request.GET.get('since'))
+        until = parse_bound(request.GET.get('until'), end=True)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'since and until must be YYYY-MM-DD dates or ISO datetimes'}, status=400)
+    
+    if kind == 'ledger':
+        rows, fields = points_export.ledger_rows(request.user.id, since, until), LEDGER_FIELDS
+    else:
+        rows, fields = points_export.transaction_rows(request.user.id, since, until, request.GET.get('username')), TRANSACTION_FIELDS
+    
+    filename = f"points_{kind}_{timezone.now():%Y%m%d_%H%M%S}.{fmt}" + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        stream(points_export.encode(rows, fields, fmt, compress)),
+        content_type='application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required
+def export_points_ledger(request):
+    """Stream the user's points ledger as CSV or NDJSON (?format, ?gzip=1, ?since/?until on last activity)"""
+    return _export_response(request, 'ledger')
+
+@login_required
+def export_points_transactions(request):
+    """Stream the user's points transactions as CSV or NDJSON (?format, ?gzip=1, ?since/?until, ?username)"""
+    return _export_response(request, 'transactions')
+
+@login_required
+@require_http_methods(["POST"])
+def import_points(request):
+    """Import an exported ledger or transaction file (CSV or NDJSON, optionally gzipped) into this account"""
+    from .points_export import points_export, FORMATS
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'No file uploaded'}, status=400)
+    kind = request.POST.get('kind', 'ledger')
+    name = upload.name.lower().removesuffix('.gz')
+    fmt = request.POST.get('format') or next((f for f in FORMATS if name.endswith(f'.{f}')), 'csv')
+    
+    try:
+        rows = points_export.read(upload.file, fmt)
+        if kind == 'ledger':
+            counts = points_export.import_ledger(request.user, rows, request.POST.get('on_conflict', 'skip'))
+        elif kind == 'transactions':
+            counts = points_export.import_transactions(request.user, rows)
+        else:
+            return JsonResponse({'success': False, 'error': f"Unknown import kind: {kind}"}, status=400)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **counts})
+
 @login_required
 def user_audit(request, user_id):
     """View user audit/transaction history"""
@@ -1568,6 +1492,27 @@ def timer_status_api(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+async def leaderboard_api(request):
+    """Ranked viewers of a streamer by points or coins spent, for overlays"""
+    from .leaderboard import leaderboard
+    
+    try:
+        user_id = int(request.GET.get('cid', ''))
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+        start = max(int(request.GET.get('start', 1)), 1)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'cid, limit and start must be numbers'}, status=400)
+    board = request.GET.get('board', 'coins')
+    if board not in leaderboard.BOARDS:
+        return JsonResponse({'success': False, 'error': f"Unknown board: {board}"}, status=400)
+    
+    entries = await leaderboard.top(user_id, board, limit, start)
+    return JsonResponse({
+        'success': True,
+        'board': board,
+        'entries': [{'rank': rank, 'username': username, 'score': score} for rank, username, score in entries]
+    })
+
 def halving(request):
     """Halving page - reduce user points by percentage"""
     if request.user.is_authenticated:
@@ -1591,25 +1536,8 @@ def execute_halving(request):
         if percentage < 1 or percentage > 100:
             return JsonResponse({'success': False, 'error': 'Percentage must be between 1 and 100'})
         
-        # Get all user points
-        user_points = UserPoints.objects.filter(user=request.user)
-        affected_count = user_points.count()
-        
-        # Calculate reduction factor
-        reduction_factor = (100 - percentage) / 100
-        
-        # Update all user points
-        for up in user_points:
-            up.points_total = int(up.points_total * reduction_factor)
-            up.points_level = int(up.points_level * reduction_factor)
-            up.save()
-        
-        # Record halving
-        PointsHalving.objects.create(
-            user=request.user,
-            percentage=percentage,
-            affected_users=affected_count
-        )
+        # One UPDATE over the ledger plus the PointsHalving record
+        affected_count = points_operations.halve(request.user, percentage).affected_users
         
         return JsonResponse({
             'success': True,
@@ -1717,9 +1645,7 @@ def tts_generate(request):
     """Generate TTS audio for live chat messages using gTTS"""
     try:
         from gtts import gTTS
-        import os
-        import hashlib
-        from django.conf import settings
+        from .tts_cache import tts_cache
         
         data = json.loads(request.body)
         text = data.get('text', '')
@@ -1739,25 +1665,18 @@ def tts_generate(request):
             except TTSSettings.DoesNotExist:
                 pass
         
-        # Create media directory
-        media_dir = os.path.join(settings.BASE_DIR, 'media', 'tts')
-        os.makedirs(media_dir, exist_ok=True)
-        
-        # Generate unique filename
-        text_hash = hashlib.md5(f"{text}_{language}".encode()).hexdigest()[:8]
-        audio_filename = f"tts_{text_hash}.mp3"
-        audio_path = os.path.join(media_dir, audio_filename)
-        
-        # Generate audio if not exists
-        if not os.path.exists(audio_path):
-            tts = gTTS(text=text, lang=language, slow=False)
-            tts.save(audio_path)
+        # Shared content-addressed cache; only renders phrases it has not seen
+        audio_url, cached = tts_cache.get_or_render(
+            lambda path: gTTS(text=text, lang=language, slow=False).save(path) or True,
+            text, language, fmt='mp3'
+        )
+        if audio_url is None:
+            return JsonResponse({'success': False, 'error': 'TTS generation failed'})
         
         # Log TTS usage if user is authenticated
         if request.user.is_authenticated:
             TTSLog.objects.create(user=request.user, tiktok_username=username, message=text)
         
-        audio_url = f"/media/tts/{audio_filename}"
         return JsonResponse({
             'success': True,
             'audio_url': audio_url,
@@ -1771,9 +1690,7 @@ def tts_generate(request):
 def tts_test(request):
     try:
         from gtts import gTTS
-        import os
-        import hashlib
-        from django.conf import settings
+        from .tts_cache import tts_cache
         
         data = json.loads(request.body)
         text = data.get('text', 'Test message')
@@ -1782,24 +1699,18 @@ def tts_test(request):
         if not text:
             return JsonResponse({'success': False, 'error': 'Text is required'})
         
-        # Create media directory
-        media_dir = os.path.join(settings.BASE_DIR, 'media', 'tts')
-        os.makedirs(media_dir, exist_ok=True)
-        
-        # Generate unique filename
-        text_hash = hashlib.md5(f"{text}_{language}".encode()).hexdigest()[:8]
-        audio_filename = f"tts_test_{text_hash}.mp3"
-        audio_path = os.path.join(media_dir, audio_filename)
-        
-        # Generate TTS audio using gTTS
-        tts = gTTS(text=text, lang=language, slow=False)
-        tts.save(audio_path)
+        # Generate TTS audio using gTTS, reusing the cached file for a repeated phrase
+        audio_url, cached = tts_cache.get_or_render(
+            lambda path: gTTS(text=text, lang=language, slow=False).save(path) or True,
+            text, language, fmt='mp3'
+        )
+        if audio_url is None:
+            return JsonResponse({'success': False, 'error': 'TTS generation failed'})
         
         # Log TTS usage if user is authenticated
         if request.user.is_authenticated:
             TTSLog.objects.create(user=request.user, tiktok_username='Test', message=text)
         
-        audio_url = f"/media/tts/{audio_filename}"
         return JsonResponse({
             'success': True, 
             'message': 'TTS test completed',
@@ -1808,6 +1719,56 @@ def tts_test(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+@require_http_methods(["GET"])
+def tts_stream(request):
+    """Stream TTS audio with chunked transfer while it is synthesized"""
+    from django.http import StreamingHttpResponse
+    from asgiref.sync import sync_to_async
+    from .piper_tts import piper_tts
+    from .tts_cache import tts_cache
+    
+    text = request.GET.get('text', '').strip()
+    if not text:
+        return JsonResponse({'success': False, 'error': 'Text is required'})
+    
+    language = request.GET.get('language', 'tr-TR')
+    voice, speed, pitch = 'default', 50, 50
+    tts_settings = TTSSettings.objects.filter(user=request.user).first()
+    if tts_settings:
+        text = text[:tts_settings.max_comment_length]
+        language, voice = tts_settings.language, tts_settings.voice
+        speed, pitch = tts_settings.default_speed, tts_settings.default_pitch
+    
+    audio_format = piper_tts.audio_format_for(voice, language)
+    audio_url, chunks, cached = tts_cache.open_stream(
+        lambda: piper_tts.stream(text, voice, language, speed),
+        text, language, voice, speed, pitch, audio_format
+    )
+    
+    async def stream_chunks():
+        # Served by daphne: an async iterator is sent chunk by chunk, a sync one would be buffered
+        iterator = iter(chunks)
+        while True:
+            chunk = await sync_to_async(next, thread_sensitive=False)(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+    
+    response = StreamingHttpResponse(stream_chunks(), content_type='audio/mpeg' if audio_format == 'mp3' else 'audio/wav')
+    response['Cache-Control'] = 'no-cache'
+    response['X-TTS-Cache'] = 'hit' if cached else 'miss'
+    response['X-TTS-Audio-Url'] = audio_url
+    return response
+
+@login_required
+def tts_queue_status(request):
+    """Queue depth and synthesis latency for the current user's TTS queue"""
+    from .tts_queue import tts_queue
+    from .tts_cache import tts_cache
+    from .tts_templates import template_speech
+    return JsonResponse({'success': True, 'queue': tts_queue.metrics(request.user.id), 'cache': tts_cache.metrics(), 'templates': template_speech.metrics()})
+
 def get_tiktok_profile(request, username):
     """Get TikTok profile information"""
     username_clean = username.strip('@')